@@ -19,6 +19,7 @@ The module includes definitions to manipulate the molecules.
 import __future__
 
 import gypsum_dl.Utils as Utils
+import gypsum_dl.MyMol as MyMol
 
 try:
     from rdkit import Chem
@@ -26,6 +27,11 @@ try:
 except:
     Utils.exception("You need to install rdkit and its dependencies.")
 
+try:
+    import numpy
+except:
+    Utils.exception("You need to install numpy and its dependencies.")
+
 def pick_lowest_enrgy_mols(mol_lst, num, thoroughness):
     """Pick molecules with low energies. If necessary, the definition also
        makes a conformer without minimization (so not too computationally
@@ -47,36 +53,69 @@ def pick_lowest_enrgy_mols(mol_lst, num, thoroughness):
     :rtype: list
     """
 
-    # Remove identical entries.
-    mol_lst = list(set(mol_lst))
+    mols_3d, must_score = pick_candidates_to_score(mol_lst, num, thoroughness)
+    if not must_score:
+        return mols_3d
+
+    return keep_lowest_enrgy_mols(mols_3d, MyMol.score_mols(mols_3d), num)
+
+def pick_candidates_to_score(mol_lst, num, thoroughness):
+    """Picks the molecules whose energies pick_lowest_enrgy_mols() must
+       compare. They can then be scored along with the candidates of other
+       containers (see MyMol.score_mols()), and the best ones picked with
+       keep_lowest_enrgy_mols().
+
+    :param mol_lst: The list of MyMol.MyMol objects.
+    :type mol_lst: list
+    :param num: The number of the lowest-energy ones to keep.
+    :type num: int
+    :param thoroughness: How many molecules to generate per variant (molecule)
+       retained, for evaluation (see pick_lowest_enrgy_mols()).
+    :type thoroughness: int
+    :return: A tuple, (mols, must_score). mols is a list of MyMol.MyMol
+       objects. If must_score is False, there are few enough molecules to
+       keep them all, so they needn't be scored.
+    :rtype: tuple
+    """
+
+    # Remove identical entries. Sort the rest by SMILES, so the choices below
+    # don't depend on the order in which they were generated.
+    mol_lst = Utils.uniq(mol_lst)
+    mol_lst.sort(key=lambda m: str(m.smiles()))
 
     # If the length of the mol_lst is less than num, just return them all.
     if len(mol_lst) <= num:
-        return mol_lst
+        return mol_lst, False
 
     # First, generate 3D structures. How many? num * thoroughness. mols_3d is
     # a list of Gypsum-DL MyMol.MyMol objects.
-    mols_3d = Utils.random_sample(mol_lst, num * thoroughness, "")
+    mols_3d = Utils.random_sample(
+        mol_lst, num * thoroughness, "",
+        " ".join([str(m.smiles()) for m in mol_lst])
+    )
 
-    # Now get the energies
-    data = []
-    for i, mol in enumerate(mols_3d):
-        mol.make_first_3d_conf_no_min()  # Make sure at least one conformer
-                                         # exists.
-        if len(mol.conformers) > 0:
-            energy = mol.conformers[0].energy
-            data.append((energy, i))
+    return mols_3d, True
 
-    data.sort()
+def keep_lowest_enrgy_mols(mols_3d, energies, num):
+    """Keeps the molecules with the lowest energies. Molecules whose energies
+       are NaN (they could not be embedded) are discarded.
 
-    # Now keep only best top few.
-    data = data[:num]
+    :param mols_3d: The list of MyMol.MyMol objects.
+    :type mols_3d: list
+    :param energies: Their energies (see MyMol.score_mols()).
+    :type energies: numpy.array
+    :param num: The number of the lowest-energy ones to keep.
+    :type num: int
+    :return: A list of MyMol.MyMol, the best ones, from lowest to highest
+       energy. Ties are kept in their original order.
+    :rtype: list
+    """
 
-    # Keep just the mols there.
-    new_mols_list = [mol_lst[d[1]] for d in data]
+    # NaNs are sorted last, so they are removed before keeping the best.
+    order = numpy.argsort(energies, kind="stable")
+    order = order[~numpy.isnan(energies[order])][:num]
 
-    # Return those molecules.
-    return new_mols_list
+    return [mols_3d[i] for i in order]
 
 def remove_highly_charged_molecules(mol_lst):
     """Remove molecules that are highly charged.
@@ -143,25 +182,44 @@ def bst_for_each_contnr_no_opt(contnrs, mol_lst, max_variants_per_compound,
     # Group the smiles by contnr_idx.
     data = Utils.group_mols_by_container_index(mol_lst)
 
-    # Go through each container.
-    for contnr_idx, contnr in enumerate(contnrs):
+    # Pick the candidates of each container whose energies must be compared.
+    # Possible a compound was eliminated early on, so doesn't exist.
+    candidates = []
+    to_score = []
+    for contnr in contnrs:
         contnr_idx = contnr.contnr_idx
-        none_generated = False
-
-        # Pick just the lowest-energy conformers from the new candidates.
-        # Possible a compound was eliminated early on, so doesn't exist.
-        if contnr_idx in list(data.keys()):
-            mols = data[contnr_idx]
-
+        if contnr_idx in data:
             # Remove molecules with unusually high charges.
-            mols = remove_highly_charged_molecules(mols)
+            mols = remove_highly_charged_molecules(data[contnr_idx])
 
-            # Pick the lowest-energy molecules. Note that this creates a
-            # conformation if necessary, but it is not minimized and so is not
-            # computationally expensive.
-            mols = pick_lowest_enrgy_mols(
+            mols, must_score = pick_candidates_to_score(
                 mols, max_variants_per_compound, thoroughness
             )
+            if must_score:
+                to_score.extend(mols)
+            candidates.append((mols, must_score))
+        else:
+            candidates.append(None)
+
+    # Get the energies of all the candidates at once. Note that this creates
+    # a conformation if necessary, but it is not minimized and so is not
+    # computationally expensive.
+    energies = MyMol.score_mols(to_score)
+
+    # Go through each container.
+    first = 0
+    for contnr, candidate in zip(contnrs, candidates):
+        none_generated = False
+
+        # Pick just the lowest-energy conformers from the new candidates.
+        if candidate is not None:
+            mols, must_score = candidate
+            if must_score:
+                mol_energies = energies[first:first + len(mols)]
+                first = first + len(mols)
+                mols = keep_lowest_enrgy_mols(
+                    mols, mol_energies, max_variants_per_compound
+                )
 
             if len(mols) > 0:
                 # Now remove all previously determined mols for this
@@ -0,0 +1,440 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-process caches of the results of expensive, frequently repeated
+operations on molecules.
+
+Many Gypsum-DL steps rebuild molecules from SMILES strings, and many variants
+converge to the same SMILES. Parsing and sanitizing a SMILES string (or
+computing its canonical form) is a pure function of that string, so the
+results can be reused. Embedding 3D coordinates is also expensive, and the
+same variant is often embedded by several steps, so the unminimized
+conformers are remembered too and reused as starting points. Each process
+has its own caches, and they are bounded in size (least recently used
+entries are discarded first). The tautomers of each molecule can also be
+saved to a file and reused by later runs.
+"""
+
+import __future__
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import gypsum_dl.Utils as Utils
+import gypsum_dl.MolObjectHandling as MOH
+
+try:
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+except:
+    Utils.exception("You need to install rdkit and its dependencies.")
+
+try:
+    import numpy
+except:
+    Utils.exception("You need to install numpy and its dependencies.")
+
+try:
+    from gypsum_dl.molvs import standardize_smiles as ssmiles
+except:
+    Utils.exception("You need to install molvs and its dependencies.")
+
+class LRUCache(object):
+    """A dictionary-like cache with a maximum size. When full, the least
+    recently used entry is discarded to make room for new ones. It can be
+    shared by several threads (see the threads job manager)."""
+
+    def __init__(self, max_size):
+        """The constructor.
+
+        :param max_size: The maximum number of entries to keep.
+        :type max_size: int
+        """
+
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        """Gets a cached value, marking it as recently used.
+
+        :param key: The key.
+        :param default: The value to return if the key is not in the cache.
+           Defaults to None.
+        :return: The cached value, or default.
+        """
+
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+
+            self.data[key] = value
+            return value
+
+    def put(self, key, value):
+        """Adds a value to the cache, discarding the least recently used entry
+        if the cache is full.
+
+        :param key: The key.
+        :param value: The value.
+        """
+
+        with self.lock:
+            if key in self.data:
+                self.data.pop(key)
+            elif len(self.data) >= self.max_size:
+                self.data.popitem(last=False)
+
+            self.data[key] = value
+
+    def clear(self):
+        """Removes all entries from the cache."""
+
+        with self.lock:
+            self.data.clear()
+
+    def items(self):
+        """Gets all the entries, from the least to the most recently used.
+
+        :return: A list of (key, value) tuples.
+        :rtype: list
+        """
+
+        with self.lock:
+            return list(self.data.items())
+
+# Distinguishes entries that are missing from those whose value is None.
+MISSING = object()
+
+# SMILES string (as given) -> (sanitized rdkit.Mol or None, canonical SMILES).
+SANITIZED_MOLS = LRUCache(4096)
+
+# Canonical SMILES -> canonical SMILES without hydrogen atoms.
+NOH_SMILES = LRUCache(4096)
+
+# (canonical SMILES, topology key) -> list of the coordinates of unminimized
+# embedded conformers, by embedding number (see MyMol.add_conformers()).
+EMBEDDINGS = LRUCache(256)
+
+# The maximum number of embedded conformers to remember per molecule.
+MAX_EMBEDDINGS_PER_MOL = 64
+
+# (MMFF variant, topology key) -> MMFF molecule properties (atom types,
+# charges, etc.), or None if MMFF can't describe the molecule.
+MMFF_PROPS = LRUCache(1024)
+
+# Canonical SMILES -> standardized SMILES (MolVS), or None if it can't be
+# standardized.
+STANDARDIZED_SMILES = LRUCache(4096)
+
+# (canonical SMILES, maximum number of tautomers) -> list of the SMILES of the
+# tautomers MolVS enumerates.
+TAUTOMERS = LRUCache(4096)
+
+def sanitized_mol_from_smiles(smiles):
+    """Converts a SMILES string to a sanitized rdkit.Mol object, as
+    MyMol.MyMol does. The result is cached, so each distinct SMILES string
+    is only parsed and sanitized once per process.
+
+    :param smiles: The SMILES string.
+    :type smiles: str
+    :return: A tuple, (mol, can_smi). mol is a new copy of the sanitized
+       rdkit.Mol object that the caller is free to modify, or None if the
+       SMILES string could not be converted. can_smi is the canonical SMILES
+       string of mol, or None if it could not be determined.
+    :rtype: tuple
+    """
+
+    entry = SANITIZED_MOLS.get(smiles)
+    if entry is None:
+        try:
+            # sanitize = False makes it respect double-bond stereochemistry
+            m = Chem.MolFromSmiles(smiles, sanitize=False)
+        except:
+            m = None
+
+        if m is not None:
+            # Sanitize and hopefully correct errors in the smiles string such
+            # as incorrect nitrogen charges.
+            m = MOH.check_sanitization(m)
+
+        can_smi = None
+        if m is not None:
+            try:
+                can_smi = Chem.MolToSmiles(
+                    m, isomericSmiles=True, canonical=True
+                )
+            except:
+                can_smi = None
+
+        entry = (m, can_smi)
+        SANITIZED_MOLS.put(smiles, entry)
+
+    m, can_smi = entry
+    if m is not None:
+        m = Chem.Mol(m)
+
+    return m, can_smi
+
+def standardized_smiles(can_smi):
+    """Gets the standardized SMILES string (see MolVS) of a molecule. The
+    result is cached by the canonical SMILES string, so each distinct
+    molecule is only standardized once per process.
+
+    :param can_smi: The canonical SMILES string of the molecule.
+    :type can_smi: str
+    :return: The standardized SMILES string, or None if the molecule can't be
+       standardized.
+    :rtype: str or None
+    """
+
+    std_smi = STANDARDIZED_SMILES.get(can_smi, MISSING)
+    if std_smi is MISSING:
+        try:
+            std_smi = ssmiles(can_smi)
+        except:
+            std_smi = None
+        STANDARDIZED_SMILES.put(can_smi, std_smi)
+
+    return std_smi
+
+def noh_smiles(can_smi, mol):
+    """Gets the canonical SMILES string of a molecule without its hydrogen
+    atoms. The result is cached by the canonical SMILES string (with
+    hydrogens), so it is only calculated once per distinct molecule.
+
+    :param can_smi: The canonical SMILES string of the molecule.
+    :type can_smi: str
+    :param mol: The molecule itself. Not modified.
+    :type mol: rdkit.Mol
+    :return: The canonical SMILES string without hydrogen atoms.
+    :rtype: str
+    """
+
+    result = NOH_SMILES.get(can_smi)
+    if result is None:
+        amol = Chem.Mol(mol)
+        amol = MOH.try_deprotanation(amol)
+        result = Chem.MolToSmiles(amol, isomericSmiles=True, canonical=True)
+        NOH_SMILES.put(can_smi, result)
+
+    return result
+
+def topology_key(mol):
+    """Gets a key that identifies the topology of a molecule: its atoms and
+    bonds, in order. Unlike a canonical SMILES string, it depends on the
+    atom order, so molecules with the same key can share data that is indexed
+    by atom (e.g., force-field parameters). Coordinates are ignored.
+
+    :param mol: The molecule.
+    :type mol: rdkit.Mol
+    :return: The key.
+    :rtype: tuple
+    """
+
+    atoms = tuple([
+        (a.GetAtomicNum(), a.GetFormalCharge(), a.GetIsotope(),
+         a.GetTotalNumHs(), a.GetIsAromatic())
+        for a in mol.GetAtoms()
+    ])
+    bonds = tuple([
+        (b.GetBeginAtomIdx(), b.GetEndAtomIdx(), int(b.GetBondType()))
+        for b in mol.GetBonds()
+    ])
+    return (atoms, bonds)
+
+def mmff_properties(mol, variant="MMFF94"):
+    """Gets the MMFF properties (atom types, partial charges, etc.) of a
+    molecule. Assigning them is expensive, so they are cached and shared by
+    all molecules (e.g., the conformers of a variant) with the same topology.
+
+    :param mol: The molecule. Not modified.
+    :type mol: rdkit.Mol
+    :param variant: "MMFF94" or "MMFF94s". Defaults to "MMFF94".
+    :type variant: str, optional
+    :return: The properties, or None if MMFF can't describe this molecule.
+    :rtype: rdkit.ForceField.MMFFMolProperties
+    """
+
+    key = (variant, topology_key(mol))
+    props = MMFF_PROPS.get(key, MISSING)
+    if props is not MISSING:
+        return props
+
+    # Typing can perceive aromaticity, so work on a copy.
+    props = AllChem.MMFFGetMoleculeProperties(
+        Chem.Mol(mol), mmffVariant=variant
+    )
+    MMFF_PROPS.put(key, props)
+    return props
+
+def embedding_key(can_smi, mol):
+    """Gets the key under which the embedded conformers of a molecule are
+    cached. The canonical SMILES string distinguishes stereoisomers, and the
+    topology key makes sure the atoms are in the same order, so the cached
+    coordinates can be given to any molecule with the same key.
+
+    :param can_smi: The canonical SMILES string of the molecule.
+    :type can_smi: str
+    :param mol: The molecule, with its hydrogen atoms.
+    :type mol: rdkit.Mol
+    :return: The key.
+    :rtype: tuple
+    """
+
+    return (can_smi, topology_key(mol))
+
+def cached_embeddings(key):
+    """Gets the coordinates of the conformers previously embedded for a
+    molecule.
+
+    :param key: The key from embedding_key().
+    :type key: tuple
+    :return: A list of numpy arrays (one row of x, y, z coordinates per atom).
+       Do not modify them.
+    :rtype: list
+    """
+
+    return EMBEDDINGS.get(key, [])
+
+def cache_embedding(key, idx, conformer):
+    """Remembers a newly embedded (unminimized) conformer so later steps can
+    reuse it rather than embedding the molecule again. Only the coordinates
+    are kept, since an rdkit.Conformer refers to the molecule that owns it.
+
+    :param key: The key from embedding_key().
+    :type key: tuple
+    :param idx: The number of this embedding. It is only cached if it is
+       the next one in the list returned by cached_embeddings(), so that
+       list is always in embedding-number order.
+    :type idx: int
+    :param conformer: The conformer.
+    :type conformer: rdkit.Conformer
+    """
+
+    positions = conformer.GetPositions()
+    with EMBEDDINGS.lock:
+        confs = EMBEDDINGS.get(key)
+        if confs is None:
+            confs = []
+            EMBEDDINGS.put(key, confs)
+
+        if idx == len(confs) and idx < MAX_EMBEDDINGS_PER_MOL:
+            confs.append(positions)
+
+def conformer_from_positions(positions):
+    """Makes an rdkit.Conformer from cached coordinates.
+
+    :param positions: The coordinates, one row per atom.
+    :type positions: numpy.array
+    :return: The conformer.
+    :rtype: rdkit.Conformer
+    """
+
+    conformer = Chem.Conformer(len(positions))
+    conformer.SetPositions(numpy.asarray(positions, dtype=float))
+    conformer.Set3D(True)
+    return conformer
+
+def tautomers_key(can_smi, max_tautomers):
+    """Gets the key under which the tautomers of a molecule are cached.
+
+    :param can_smi: The canonical SMILES string of the molecule.
+    :type can_smi: str
+    :param max_tautomers: The maximum number of tautomers enumerated.
+    :type max_tautomers: int
+    :return: The key.
+    :rtype: tuple
+    """
+
+    return (can_smi, max_tautomers)
+
+def cached_tautomers(key):
+    """Gets the SMILES strings of the tautomers previously enumerated for a
+    molecule.
+
+    :param key: The key from tautomers_key().
+    :type key: tuple
+    :return: A list of SMILES strings, or None if they aren't cached. Do not
+       modify it.
+    :rtype: list or None
+    """
+
+    return TAUTOMERS.get(key)
+
+def cache_tautomers(key, taut_smis):
+    """Remembers the tautomers enumerated for a molecule.
+
+    :param key: The key from tautomers_key().
+    :type key: tuple
+    :param taut_smis: The SMILES strings of the tautomers.
+    :type taut_smis: list
+    """
+
+    TAUTOMERS.put(key, taut_smis)
+
+def load_tautomers(filename):
+    """Adds the tautomers saved by save_tautomers() to the cache. A file that
+    doesn't exist (e.g., on the first run) is ignored.
+
+    :param filename: The path to the JSON file.
+    :type filename: str
+    """
+
+    if not os.path.exists(filename):
+        return
+
+    try:
+        with open(filename) as f:
+            entries = json.load(f)
+    except:
+        Utils.log(
+            "WARNING: Could not read the tautomer cache " + filename +
+            ". Tautomers will be enumerated from scratch.",
+            level=Utils.WARNING
+        )
+        return
+
+    for can_smi, max_tautomers, taut_smis in entries:
+        TAUTOMERS.put(tautomers_key(can_smi, max_tautomers), taut_smis)
+
+def save_tautomers(filename):
+    """Saves the cached tautomers to a file, so later runs can reuse them (see
+    load_tautomers()). The file is replaced at once, so it is never left
+    half-written.
+
+    :param filename: The path to the JSON file.
+    :type filename: str
+    """
+
+    entries = [
+        [can_smi, max_tautomers, taut_smis]
+        for (can_smi, max_tautomers), taut_smis in TAUTOMERS.items()
+    ]
+
+    tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(entries, f)
+    os.replace(tmp_filename, filename)
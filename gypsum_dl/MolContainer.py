@@ -32,7 +32,7 @@ try:
 except:
     Utils.exception("You need to install rdkit and its dependencies.")
 
-class MolContainer:
+class MolContainer(object):
     """The molecucle container class. It stores all the molecules (tautomers,
     etc.) associated with a single input SMILES entry."""
 
@@ -58,7 +58,7 @@ class MolContainer:
                                       # original for filename output.
         self.orig_smi = smiles
         self.orig_smi_deslt = smiles  # initial assumption
-        self.mols = []
+        self.mols = []  # Also resets the canonical-smiles index.
         self.name = name
         self.properties = properties
         self.mol_orig_frm_inp_smi = MyMol.MyMol(smiles, name)
@@ -84,6 +84,45 @@ class MolContainer:
         # Get the non-acidic carbon-hydrogen footprint.
         self.carbon_hydrogen_count = self.mol_orig_frm_inp_smi.count_hyd_bnd_to_carb()
 
+    @property
+    def mols(self):
+        """The MyMol.MyMol objects in this container.
+
+        :return: The list of molecules.
+        :rtype: list
+        """
+
+        return self._mols
+
+    @mols.setter
+    def mols(self, mols):
+        """Replaces the molecules in this container. The index of canonical
+           smiles strings is rebuilt the next time it is needed.
+
+        :param mols: The new list of MyMol.MyMol objects.
+        :type mols: list
+        """
+
+        self._mols = mols
+        self._can_smi_idx = None
+
+    def can_smi_index(self):
+        """Gets a dictionary that maps the canonical smiles string of each
+           molecule in this container to the first molecule with that smiles.
+           The dictionary is kept up to date as molecules are added, so it
+           only needs to be built from scratch when self.mols is replaced.
+
+        :return: The canonical smiles to MyMol.MyMol dictionary.
+        :rtype: dict
+        """
+
+        if self._can_smi_idx is None:
+            self._can_smi_idx = {}
+            for m in self._mols:
+                self._can_smi_idx.setdefault(m.smiles(), m)
+
+        return self._can_smi_idx
+
     def mol_with_smiles_is_in_contnr(self, smiles):
         """Checks whether or not a given smiles string is already in this
            container.
@@ -99,15 +138,10 @@ class MolContainer:
         # already present. Returns a new MyMol object if it isn't, True
         # otherwise.
 
-        # First, get the set of all cannonical smiles.
-        # TODO: Probably shouldn't be generating this on the fly every time
-        # you use it!
-        can_smi_in_this_container = set([m.smiles() for m in self.mols])
-
         # Determine whether it is already in the container, and act
         # accordingly.
         amol = MyMol.MyMol(smiles)
-        if amol.smiles() in can_smi_in_this_container:
+        if amol.smiles() in self.can_smi_index():
             return True
         else:
             return amol
@@ -137,7 +171,7 @@ class MolContainer:
                 result.orig_smi_deslt = self.orig_smi_deslt
                 result.contnr_idx = self.contnr_idx
 
-                self.mols.append(result)
+                self.add_mol(result)
 
     def add_mol(self, mol):
         """Adds a molecule to this container. Does NOT check for uniqueness.
@@ -146,7 +180,11 @@ class MolContainer:
         :type mol: MyMol.MyMol
         """
 
-        self.mols.append(mol)
+        self._mols.append(mol)
+
+        # Keep the index current, if it has been built.
+        if self._can_smi_idx is not None:
+            self._can_smi_idx.setdefault(mol.smiles(), mol)
 
     def all_can_noh_smiles(self):
         """Gets a list of all the noh canonical smiles in this container.
@@ -280,7 +318,14 @@ class MolContainer:
         # while None in self.mols:
         #     self.mols.remove(None)
 
-        self.mols = ChemUtils.uniq_mols_in_list(self.mols)
+        # If there are as many distinct canonical smiles as molecules, there
+        # are no duplicates to remove.
+        if len(self.can_smi_index()) == len(self._mols):
+            return
+
+        # Keeps the first molecule with each smiles, as the index does, so
+        # the index remains valid.
+        self._mols = ChemUtils.uniq_mols_in_list(self._mols)
 
     def update_idx(self, new_idx):
         """Updates the index of this container.
@@ -27,9 +27,12 @@ import __future__
 import sys
 import copy
 import operator
+from collections import OrderedDict
 
 import gypsum_dl.Utils as Utils
 import gypsum_dl.MolObjectHandling as MOH
+import gypsum_dl.MolCache as MolCache
+import gypsum_dl.Parallelizer as Parallelizer
 
 #Disable the unnecessary RDKit warnings
 from rdkit import RDLogger
@@ -43,10 +46,31 @@ try:
 except:
     Utils.exception("You need to install rdkit and its dependencies.")
 
+# Molecules are pickled to send them to other processes. By default, RDKit
+# pickles coordinates in single precision, so results would depend on how
+# many processes are used.
 try:
-    from gypsum_dl.molvs import standardize_smiles as ssmiles
+    Chem.SetDefaultPickleProperties(
+        Chem.GetDefaultPickleProperties() |
+        Chem.PropertyPickleOptions.CoordsAsDouble
+    )
 except:
-    Utils.exception("You need to install molvs and its dependencies.")
+    # Older versions of RDKit always use single precision.
+    pass
+
+try:
+    import numpy
+except:
+    Utils.exception("You need to install numpy and its dependencies.")
+
+# The force fields that can be used to score and minimize conformers, and the
+# one currently in use (see set_force_field()).
+FORCE_FIELDS = ["UFF", "MMFF94", "MMFF94S"]
+FORCE_FIELD = "UFF"
+
+# The number of threads used to embed and score several molecules at once
+# (see score_mols() and set_scoring_threads()).
+SCORING_THREADS = 1
 
 class MyMol:
     """
@@ -93,12 +117,15 @@ class MyMol:
                 )
 
         self.can_smi_noh = ""
+        self.parsed_can_smi = None  # (rdkit.Mol, its canonical SMILES), see smiles().
         self.orig_smi = smiles
 
         # Default assumption is that they are the same.
         self.orig_smi_deslt = smiles
         self.name = name
         self.conformers = []
+        self.conf_host = None  # The rdkit.Mol holding the conformers' coordinates.
+        self.embeddings_used = set([])  # Numbers of the embeddings already used.
         self.nonaro_ring_atom_idx = ""
         self.chiral_cntrs_only_assigned = ""
         self.chiral_cntrs_include_unasignd = ""
@@ -123,13 +150,20 @@ class MyMol:
         if self.stdrd_smiles != "":
             return self.stdrd_smiles
 
-        try:
-            self.stdrd_smiles = ssmiles(self.smiles())
-        except:
+        # Cached, so variants that are the same molecule are only
+        # standardized once.
+        can_smi = self.smiles()
+        std_smi = None
+        if can_smi is not None:
+            std_smi = MolCache.standardized_smiles(can_smi)
+
+        if std_smi is None:
             Utils.log(
                 "\tCould not standardize " + self.smiles(True) + ". Skipping."
             )
-            self.stdrd_smiles = self.smiles()
+            std_smi = can_smi
+
+        self.stdrd_smiles = std_smi
 
         return self.stdrd_smiles
 
@@ -237,18 +271,22 @@ class MyMol:
 
         # If given a SMILES string.
         if self.rdkit_mol == "":
-            try:
-                # sanitize = False makes it respect double-bond stereochemistry
-                m = Chem.MolFromSmiles(self.orig_smi_deslt, sanitize=False)
-            except:
-                m = None
+            # Parsing and sanitizing (and hopefully correcting errors in the
+            # smiles string such as incorrect nitrogen charges) is cached, so
+            # repeated SMILES strings only cost one parse. The canonical
+            # SMILES string comes for free. It is only used if
+            # self.rdkit_mol is still this same molecule when smiles() is
+            # first called.
+            m, can_smi = MolCache.sanitized_mol_from_smiles(self.orig_smi_deslt)
+            if can_smi is not None:
+                self.parsed_can_smi = (m, can_smi)
         else: # If given a RDKit Mol Obj
             m = self.rdkit_mol
 
-        if m is not None:
-            # Sanitize and hopefully correct errors in the smiles string such
-            # as incorrect nitrogen charges.
-            m = MOH.check_sanitization(m)
+            if m is not None:
+                # Sanitize and hopefully correct errors in the smiles string
+                # such as incorrect nitrogen charges.
+                m = MOH.check_sanitization(m)
         self.rdkit_mol = m
         return m
 
@@ -289,8 +327,17 @@ class MyMol:
             if self.can_smi != "":
                 # Return previously determined canonical SMILES.
                 return self.can_smi
+            elif (self.parsed_can_smi is not None and
+                    self.parsed_can_smi[0] is self.rdkit_mol):
+                # Use the canonical SMILES found when the molecule was
+                # parsed (see make_mol_frm_smiles_sanitze()).
+                self.can_smi = self.parsed_can_smi[1]
+                self.parsed_can_smi = None
+                return self.can_smi
             else:
-                # Need to determine canonical SMILES.
+                # Need to determine canonical SMILES. (self.rdkit_mol has
+                # changed since it was parsed, if it was.)
+                self.parsed_can_smi = None
                 try:
                     can_smi = Chem.MolToSmiles(
                         self.rdkit_mol, isomericSmiles=True, canonical=True
@@ -302,7 +349,7 @@ class MyMol:
                     Utils.log("Warning: Couldn't put " + self.orig_smi + " (" +
                             self.name + ") in canonical form. Got this error: " +
                             str(sys.exc_info()[0]) + ". This molecule will be " +
-                            "discarded.")
+                            "discarded.", level=Utils.WARNING)
                     self.can_smi = None
                     return None
 
@@ -314,6 +361,13 @@ class MyMol:
                 # Return previously determined string.
                 return self.can_smi_noh
 
+            # The same molecule always gives the same string, so use the
+            # cached one if possible.
+            can_smi = self.smiles()
+            if isinstance(can_smi, str):
+                self.can_smi_noh = MolCache.noh_smiles(can_smi, self.rdkit_mol)
+                return self.can_smi_noh
+
             # So remove hydrogens. Note that this assumes you will have called
             # this function previously with noh = False
             amol = copy.copy(self.rdkit_mol)
@@ -554,7 +608,7 @@ class MyMol:
         self.set_rdkit_mol_prop("Genealogy", genealogy)
         self.set_rdkit_mol_prop("_Name", self.name)
 
-    def add_conformers(self, num, rmsd_cutoff=0.1, minimize=True):
+    def add_conformers(self, num, rmsd_cutoff=0.1, minimize=True, num_threads=1):
         """Add conformers to this molecule.
 
         :param num: The total number of conformers to generate, including ones
@@ -566,26 +620,59 @@ class MyMol:
         :param minimize: Whether or not to minimize the geometry of all these
            conformers. Defaults to True.
         :param minimize: bool, optional
+        :param num_threads: The number of threads to use when minimizing. 0
+           means one per CPU core. Defaults to 1.
+        :type num_threads: int, optional
         """
 
         # First, do you need to add new conformers? Some might have already
         # been added. Just add enough to meet the requested amount.
         num_new_confs = max(0, num - len(self.conformers))
+
+        # Conformers of this same molecule that were embedded earlier (e.g.,
+        # by a previous step) are reused before embedding new ones. The
+        # embeddings of each molecule are numbered, and if a seed was set,
+        # each number always gives the same coordinates.
+        key = None
+        if num_new_confs > 0 and self.smiles() not in [None, False, ""]:
+            key = MolCache.embedding_key(self.smiles(), self.conformer_host())
+
         for i in range(num_new_confs):
-            if len(self.conformers) == 0:
-                # For the first one, don't start from random coordinates.
-                new_conf = MyConformer(self)
+            # The first embedding not yet used by this molecule.
+            embed_idx = 0
+            while embed_idx in self.embeddings_used:
+                embed_idx = embed_idx + 1
+            self.embeddings_used.add(embed_idx)
+
+            cached = []
+            if key is not None:
+                cached = MolCache.cached_embeddings(key)
+
+            if embed_idx < len(cached):
+                new_conf = MyConformer(
+                    self, MolCache.conformer_from_positions(cached[embed_idx])
+                )
             else:
-                # For all subsequent ones, do start from random coordinates.
-                new_conf = MyConformer(self, None, False, True)
+                # Only the first one doesn't start from random coordinates.
+                seed = Utils.seed_for("embed", self.smiles(), embed_idx)
+                new_conf = MyConformer(
+                    self, None, False, embed_idx > 0,
+                    -1 if seed is None else seed
+                )
+
+                if new_conf.mol is not False and key is not None:
+                    # Remember it for later steps.
+                    MolCache.cache_embedding(
+                        key, embed_idx, new_conf.conformer()
+                    )
 
             if new_conf.mol is not False:
                 self.conformers.append(new_conf)
 
         # Are the current ones minimized if necessary?
         if minimize == True:
-            for conf in self.conformers:
-                conf.minimize()  # Won't reminimize if it's already been done.
+            # Won't reminimize ones that have already been done.
+            minimize_conformers(self.conformers, num_threads)
 
         # Automatically sort by the energy.
         self.conformers.sort(key=operator.attrgetter('energy'))
@@ -625,6 +712,58 @@ class MyMol:
             self.conformers.remove(None)
 
         # Those that remains are only the distinct conformers.
+        self.remove_unused_conformers()
+
+    def copy_without_conformers(self):
+        """Makes a copy of this molecule without its conformers. Much faster
+           than copy.deepcopy(), which would also copy every conformer.
+
+        :return: The copy.
+        :rtype: MyMol.MyMol
+        """
+
+        conformers = self.conformers
+        conf_host = self.conf_host
+        self.conformers = []
+        self.conf_host = None
+        try:
+            new_mol = copy.deepcopy(self)
+        finally:
+            self.conformers = conformers
+            self.conf_host = conf_host
+
+        return new_mol
+
+    def conformer_host(self):
+        """Gets the rdkit.Mol object that holds the coordinates of all of this
+           molecule's conformers (MyConformer objects only refer to them). It
+           is created from self.rdkit_mol when needed (i.e., when there are
+           no conformers yet).
+
+        :return: The rdkit.Mol object.
+        :rtype: rdkit.Mol
+        """
+
+        if self.conf_host is None or len(self.conformers) == 0:
+            self.conf_host = Chem.Mol(self.rdkit_mol)
+            self.conf_host.RemoveAllConformers()
+
+        return self.conf_host
+
+    def remove_unused_conformers(self):
+        """Removes the coordinates of conformers that are no longer in
+           self.conformers (e.g., because they were too similar to others), to
+           save memory."""
+
+        if self.conf_host is None:
+            return
+
+        ids_in_use = set([
+            c.conf_id for c in self.conformers if c.mol is self.conf_host
+        ])
+        for conf in list(self.conf_host.GetConformers()):
+            if conf.GetId() not in ids_in_use:
+                self.conf_host.RemoveConformer(conf.GetId())
 
     def count_hyd_bnd_to_carb(self):
         """Count the number of Hydrogens bound to carbons."""
@@ -646,15 +785,20 @@ class MyMol:
 
         self.rdkit_mol.RemoveAllConformers()
         for conformer in self.conformers:
-            self.rdkit_mol.AddConformer(conformer.conformer())
+            self.rdkit_mol.AddConformer(conformer.conformer(), assignId=True)
 
 class MyConformer:
     """A wrapper around a rdkit Conformer object. Allows me to associate extra
     values with conformers. These are 3D coordinate sets for a given
     MyMol.MyMol object (different molecule conformations).
+
+    The coordinates themselves are stored in a single rdkit.Mol object shared
+    by all the conformers of the same MyMol.MyMol (see
+    MyMol.conformer_host()). A MyConformer only records which conformer of
+    that molecule is its own, along with its energy, etc.
     """
 
-    def __init__(self, mol, conformer=None, second_embed=False, use_random_coordinates=False):
+    def __init__(self, mol, conformer=None, second_embed=False, use_random_coordinates=False, random_seed=-1):
         """Create a MyConformer objects.
 
         :param mol: The MyMol.MyMol associated with this conformer.
@@ -673,14 +817,17 @@ class MyConformer:
            conformers to try to consider alternate geometries. So they should
            start from random coordinates. Defaults to False.
         :type use_random_coordinates: bool, optional
+        :param random_seed: The seed for generating the new conformer, so the
+           same coordinates can be generated again. Defaults to -1 (a
+           different conformer every time).
+        :type random_seed: int, optional
         """
 
-        # Save some values to the object.
-        self.mol = copy.deepcopy(mol.rdkit_mol)
+        # Save some values to the object. self.mol is the rdkit.Mol that
+        # holds the coordinates, and self.conf_id identifies them within it.
+        self.mol = mol.conformer_host()
         self.smiles = mol.smiles()
-
-        # Remove any previous conformers.
-        self.mol.RemoveAllConformers()
+        self.conf_id = -1
 
         if conformer is None:
             # The user is providing no conformer. So we must generate it.
@@ -710,41 +857,47 @@ class MyConformer:
 
             # Also set whether to start from random coordinates.
             params.useRandomCoords = use_random_coordinates
+            params.randomSeed = random_seed
+
+            # Keep the other conformers of this molecule.
+            params.clearConfs = False
 
             # AllChem.EmbedMolecule uses geometry to create inital molecule
             # coordinates. This sometimes takes a very long time
-            AllChem.EmbedMolecule(self.mol, params)
+            self.conf_id = AllChem.EmbedMolecule(self.mol, params)
 
             # On rare occasions, the new conformer generating algorithm fails
             # because params.useRandomCoords = False. So if it fails, try
             # again with True.
-            if self.mol.GetNumConformers() == 0 and use_random_coordinates == False:
+            if self.conf_id == -1 and use_random_coordinates == False:
                 params.useRandomCoords = True
-                AllChem.EmbedMolecule(self.mol, params)
+                self.conf_id = AllChem.EmbedMolecule(self.mol, params)
 
             # On very rare occasions, the new conformer generating algorithm
             # fails. For example, COC(=O)c1cc(C)nc2c(C)cc3[nH]c4ccccc4c3c12 .
             # In this case, the old one still works. So if no coordinates are
             # assigned, try that one. Parameters must have second_embed set to
             # True for this to happen.
-            if second_embed == True and self.mol.GetNumConformers() == 0:
-                AllChem.EmbedMolecule(
-                    self.mol, useRandomCoords=use_random_coordinates
+            if second_embed == True and self.conf_id == -1:
+                self.conf_id = AllChem.EmbedMolecule(
+                    self.mol, useRandomCoords=use_random_coordinates,
+                    clearConfs=False, randomSeed=random_seed
                 )
 
             # On rare occasions, both methods fail. For example,
             # O=c1cccc2[C@H]3C[NH2+]C[C@@H](C3)Cn21 Another example:
             # COc1cccc2c1[C@H](CO)[N@H+]1[C@@H](C#N)[C@@H]3C[C@@H](C(=O)[O-])[C@H]([C@H]1C2)[N@H+]3C
-            if self.mol.GetNumConformers() == 0:
+            if self.conf_id == -1:
                 self.mol = False
         else:
-            # The user has provided a conformer. Just add it.
-            conformer.SetId(0)
-            self.mol.AddConformer(conformer, assignId=True)
+            # The user has provided a conformer. Just add (a copy of) it.
+            self.conf_id = self.mol.AddConformer(
+                Chem.Conformer(conformer), assignId=True
+            )
 
         # Calculate some energies, other housekeeping.
         if self.mol is not False:
-            ff = AllChem.UFFGetMoleculeForceField(self.mol)
+            ff = make_force_field(self.mol, self.conf_id)
             self.minimized = False
             self.energy = ff.CalcEnergy()
             self.ids_hvy_atms = [a.GetIdx() for a in self.mol.GetAtoms()
@@ -762,10 +915,13 @@ class MyConformer:
         """
 
         if conf is None:
-            return self.mol.GetConformers()[0]
+            return self.mol.GetConformer(self.conf_id)
         else:
-            self.mol.RemoveAllConformers()
-            self.mol.AddConformer(conf)
+            # Replace the coordinates, keeping the same id.
+            new_conf = Chem.Conformer(conf)
+            new_conf.SetId(self.conf_id)
+            self.mol.RemoveConformer(self.conf_id)
+            self.mol.AddConformer(new_conf, assignId=False)
 
     def minimize(self):
         """Minimize (optimize) the geometry of the current conformer if it
@@ -775,8 +931,9 @@ class MyConformer:
             # Already minimized. Don't do it again.
             return
 
-        # Perform the minimization, and save the energy.
-        ff = AllChem.UFFGetMoleculeForceField(self.mol)
+        # Perform the minimization, and save the energy. The force field
+        # updates the coordinates in place.
+        ff = make_force_field(self.mol, self.conf_id)
         ff.Minimize()
         self.energy = ff.CalcEnergy()
         self.minimized = True
@@ -790,18 +947,31 @@ class MyConformer:
         :rtype: MyConformer
         """
 
+        if other_conf.mol is self.mol:
+            # Both conformers are in the same molecule, so they can be aligned
+            # in place.
+            AllChem.AlignMolConformers(
+                self.mol, atomIds = self.ids_hvy_atms,
+                confIds = [self.conf_id, other_conf.conf_id]
+            )
+            return other_conf
+
         # Add the conformer of the other MyConformer object.
-        self.mol.AddConformer(other_conf.conformer(), assignId=True)
+        other_id = self.mol.AddConformer(
+            Chem.Conformer(other_conf.conformer()), assignId=True
+        )
 
         # Align them.
-        AllChem.AlignMolConformers(self.mol, atomIds = self.ids_hvy_atms)
+        AllChem.AlignMolConformers(
+            self.mol, atomIds = self.ids_hvy_atms,
+            confIds = [self.conf_id, other_id]
+        )
 
         # Reset the conformer of the other MyConformer object.
-        last_conf = self.mol.GetConformers()[-1]
-        other_conf.conformer(last_conf)
+        other_conf.conformer(self.mol.GetConformer(other_id))
 
         # Remove the added conformer.
-        self.mol.RemoveConformer(last_conf.GetId())
+        self.mol.RemoveConformer(other_id)
 
         # Return that other object.
         return other_conf
@@ -810,13 +980,12 @@ class MyConformer:
         """Prints out the first 500 letters of the molblock version of this
         conformer. Good for debugging."""
 
-        mol_copy = copy.deepcopy(self.mol_copy)  # Use it as a template.
-        mol_copy.RemoveAllConformers()
-        mol_copy.AddConformer(self.conformer)
-        Utils.log(Chem.MolToMolBlock(mol_copy)[:500])
+        Utils.log(Chem.MolToMolBlock(self.mol, confId=self.conf_id)[:500])
 
     def rmsd_to_me(self, other_conf):
         """Calculate the rms distance between this conformer and another one.
+           Only heavy atoms are considered, and the conformers must already be
+           aligned.
 
         :param other_conf: The other conformer to align.
         :type other_conf: MyConformer
@@ -824,23 +993,201 @@ class MyConformer:
         :rtype: float
         """
 
-        # Make a new molecule.
-        amol = Chem.MolFromSmiles(self.smiles, sanitize=False)
-        amol = MOH.check_sanitization(amol)
-        amol = MOH.try_reprotanation(amol)
+        # Get the coordinates of the heavy atoms of both conformers.
+        pos1 = numpy.array(self.conformer().GetPositions())[self.ids_hvy_atms]
+        pos2 = numpy.array(other_conf.conformer().GetPositions())[self.ids_hvy_atms]
 
-        # Add the conformer of the other MyConformer object.
-        amol.AddConformer(self.conformer(), assignId=True)
-        amol.AddConformer(other_conf.conformer(), assignId=True)
+        # Return the RMSD.
+        return float(numpy.sqrt(((pos1 - pos2) ** 2).sum() / len(pos1)))
+
+def minimize_conformers(confs, num_threads=1):
+    """Minimizes (optimizes) the geometries of several conformers of the same
+       molecule, skipping those that have already been optimized. Gives the
+       same results as calling MyConformer.minimize() on each, but all the
+       conformers are optimized in a single RDKit call, which can use several
+       threads.
+
+    :param confs: A list of MyConformer objects, all of the same molecule.
+    :type confs: list
+    :param num_threads: The number of threads to use. 0 means one per CPU
+       core. Defaults to 1.
+    :type num_threads: int, optional
+    """
+
+    confs = [c for c in confs if c.minimized == False]
+    if len(confs) == 0:
+        return
+    if len(confs) == 1:
+        confs[0].minimize()
+        return
+
+    # If these are all the conformers of the molecule that holds them, they
+    # can be optimized in place. Otherwise, put them in a new molecule.
+    amol = confs[0].mol
+    in_place = (
+        len([c for c in confs if c.mol is amol]) == len(confs) and
+        amol.GetNumConformers() == len(confs)
+    )
+    if not in_place:
+        amol = Chem.Mol(amol, True)  # Without conformers.
+        for conf in confs:
+            amol.AddConformer(Chem.Conformer(conf.conformer()), assignId=True)
+
+    # Optimize them all at once, with the same force field used to minimize
+    # individual conformers. Returns a (not converged, energy) tuple per
+    # conformer.
+    ff = make_force_field(amol)
+    if hasattr(AllChem, "OptimizeMoleculeConfs"):
+        results = AllChem.OptimizeMoleculeConfs(
+            amol, ff, numThreads=num_threads
+        )
+    elif ff_name_for(amol) == "UFF":
+        # Older versions of RDKit.
+        results = AllChem.UFFOptimizeMoleculeConfs(
+            amol, numThreads=num_threads
+        )
+    else:
+        results = AllChem.MMFFOptimizeMoleculeConfs(
+            amol, numThreads=num_threads, mmffVariant=ff_name_for(amol)
+        )
 
-        # Get the two confs.
-        first_conf = amol.GetConformers()[0]
-        last_conf = amol.GetConformers()[-1]
+    # Copy the optimized coordinates (unless optimized in place) and
+    # energies back. The results are in the order of amol's conformers.
+    if in_place:
+        confs_by_id = dict([(c.conf_id, c) for c in confs])
+        confs = [confs_by_id[c.GetId()] for c in amol.GetConformers()]
+    for conf, rdkit_conf, result in zip(confs, amol.GetConformers(), results):
+        if not in_place:
+            conf.conformer(rdkit_conf)
+        conf.energy = result[1]
+        conf.minimized = True
+
+def score_mols(mols, num_threads=None):
+    """Makes sure each molecule has a 3D conformer (see
+       MyMol.make_first_3d_conf_no_min()), and gets the energies of those
+       conformers, for example to rank variants. Gives the same results as
+       calling make_first_3d_conf_no_min() on each molecule, but the molecules
+       are embedded and scored in a pool of threads. RDKit releases the GIL
+       while it embeds, so several molecules can be embedded at once.
+
+    :param mols: The MyMol.MyMol objects. The same object may be listed more
+       than once.
+    :type mols: list
+    :param num_threads: The number of threads to use. 0 means one per CPU
+       core. Defaults to None, meaning the number set with
+       set_scoring_threads().
+    :type num_threads: int, optional
+    :return: The energy of the first (lowest-energy) conformer of each
+       molecule, in the same order, or NaN for molecules that could not be
+       embedded.
+    :rtype: numpy.array
+    """
 
-        # Return the RMSD.
-        amol = MOH.try_deprotanation(amol)
-        rmsd = AllChem.GetConformerRMS(
-            amol, first_conf.GetId(), last_conf.GetId(), prealigned = True
+    if num_threads is None:
+        num_threads = SCORING_THREADS
+
+    # Each molecule is only embedded once, by a single thread.
+    unique_mols = list(OrderedDict((id(mol), mol) for mol in mols).values())
+    energies = Parallelizer.ThreadPool(
+        [tuple([mol]) for mol in unique_mols], num_threads, score_mol
+    )
+    energies_by_id = dict(zip([id(mol) for mol in unique_mols], energies))
+
+    return numpy.array(
+        [energies_by_id[id(mol)] for mol in mols], dtype=float
+    )
+
+@Parallelizer.thread_safe
+def score_mol(mol):
+    """Makes sure a molecule has a 3D conformer, and gets its energy. Used by
+       score_mols().
+
+    :param mol: The MyMol.MyMol object.
+    :type mol: MyMol.MyMol
+    :return: The energy of its first (lowest-energy) conformer, or NaN if it
+       could not be embedded.
+    :rtype: float
+    """
+
+    try:
+        mol.make_first_3d_conf_no_min()
+    except:
+        return float("nan")
+
+    if len(mol.conformers) == 0:
+        return float("nan")
+
+    return mol.conformers[0].energy
+
+def set_scoring_threads(num_threads):
+    """Sets the number of threads score_mols() uses in this process from now
+       on. Worker processes keep the default (1), since the other workers
+       already keep the processors busy.
+
+    :param num_threads: The number of threads. 0 means one per CPU core.
+    :type num_threads: int
+    """
+
+    global SCORING_THREADS
+
+    SCORING_THREADS = num_threads
+
+def set_force_field(name):
+    """Sets the force field used to score and minimize all conformers
+       created in this process from now on.
+
+    :param name: The force field: "UFF", "MMFF94", or "MMFF94s".
+    :type name: str
+    """
+
+    global FORCE_FIELD
+
+    if name.upper() not in FORCE_FIELDS:
+        Utils.exception(
+            "Unrecognized force field: " + name + ". Choose from UFF, " +
+            "MMFF94, or MMFF94s."
         )
 
-        return rmsd
+    FORCE_FIELD = name.upper()
+
+def ff_name_for(mol):
+    """Gets the name of the force field to use for a given molecule. Usually
+       the one set with set_force_field(), but UFF if that's an MMFF force
+       field that lacks parameters for this molecule.
+
+    :param mol: The molecule.
+    :type mol: rdkit.Mol
+    :return: "UFF", "MMFF94", or "MMFF94s".
+    :rtype: str
+    """
+
+    if FORCE_FIELD == "UFF":
+        return "UFF"
+
+    variant = "MMFF94s" if FORCE_FIELD == "MMFF94S" else "MMFF94"
+    if MolCache.mmff_properties(mol, variant) is None:
+        return "UFF"
+
+    return variant
+
+def make_force_field(mol, conf_id=-1):
+    """Makes a force field (see set_force_field()) for a molecule. For the
+       MMFF force fields, the expensive atom typing is cached and shared by
+       all molecules with the same topology.
+
+    :param mol: The molecule, with at least one conformer.
+    :type mol: rdkit.Mol
+    :param conf_id: The id of the conformer whose coordinates the force field
+       uses (and updates, when minimizing). Defaults to -1 (the first).
+    :type conf_id: int, optional
+    :return: The force field.
+    :rtype: rdkit.ForceField.ForceField
+    """
+
+    variant = ff_name_for(mol)
+    if variant == "UFF":
+        return AllChem.UFFGetMoleculeForceField(mol, confId=conf_id)
+
+    return AllChem.MMFFGetMoleculeForceField(
+        mol, MolCache.mmff_properties(mol, variant), confId=conf_id
+    )
@@ -21,7 +21,9 @@ The "parallelizer" object exposes a simple map interface that takes a function
 and a list of arguments and returns the result of applying the function to
 each argument. Internally, the parallelizer class can determine what parallel
 capabilities are present on a system and automatically pick between "mpi",
-"multiprocessing" or "serial" in order to speed up the map operation. This
+"multiprocessing" or "serial" in order to speed up the map operation. A
+"threads" mode is also available, which runs functions marked with
+thread_safe() in a pool of threads within the current process. This
 approach simplifies development and allows the same program to run on a laptop
 or a high-performance computer cluster, utilizing the full resources of each
 system. (Description provided by Harrison Green.)
@@ -29,7 +31,19 @@ system. (Description provided by Harrison Green.)
 
 import __future__
 import multiprocessing
+import os
 import sys
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+import gypsum_dl.Utils as Utils
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except:
+    # Python 2, without the futures backport.
+    ThreadPoolExecutor = None
 
 MPI_installed = False
 try:
@@ -43,7 +57,8 @@ class Parallelizer(object):
     Abstract parallelization class
     """
 
-    def __init__(self, mode=None, num_procs=None, flag_for_low_level=False):
+    def __init__(self, mode=None, num_procs=None, flag_for_low_level=False,
+                 timeout=None, memory_limit=None, max_tasks_per_worker=None):
         """
         This will initialize the Parallelizer class and kick off the specific classes for multiprocessing and MPI.
 
@@ -70,11 +85,25 @@ class Parallelizer(object):
                                         This will be overriden and fixed to a single processor if mode==serial
         :param bol flag_for_low_level: this will override mode and number of processors and set it to a multiprocess as serial. This is useful because
                                 a low-level program in mpi mode referenced by a top level program in mpi mode will have terrible problems. This means you can't mpi-multiprocess inside an mpi-multiprocess.
+                                Jobs that such a Parallelizer is asked to run in mpi mode (e.g., on each node of a program running in mpi mode) are run in its own mode instead.
+        :param float timeout: the maximum number of seconds a single job may run in multiprocessing or serial mode. None or 0 means no limit.
+        :param int memory_limit: the maximum amount of memory (in MB) a single job may use in multiprocessing or serial mode. None or 0 means no limit.
+        :param int max_tasks_per_worker: the number of jobs after which a worker process is replaced with a fresh one. None or 0 means never.
+                                Jobs that exceed the limits return None, and are recorded in self.failed_jobs as (function name, args, reason) tuples.
+                                If any limit is set, jobs are run in separate worker processes even in serial mode, so the limits can be enforced.
         """
 
         if mode == "none" or mode == "None":
             mode = None
 
+        self.limits = {
+            "timeout": timeout,
+            "memory_limit": memory_limit,
+            "max_tasks_per_worker": max_tasks_per_worker
+        }
+        self.failed_jobs = []
+        self.flag_for_low_level = flag_for_low_level
+
         self.HAS_MPI = self.test_import_MPI(mode, flag_for_low_level)
 
         # Pick the mode
@@ -97,6 +126,11 @@ class Parallelizer(object):
         elif mode == 'multiprocessing':
             self.mode = 'multiprocessing'
 
+        elif mode == 'threads':
+            if ThreadPoolExecutor is None:
+                raise Exception('threads mode requires Python 3')
+            self.mode = 'threads'
+
         elif mode == 'Serial' or mode == 'serial':
             self.mode = 'serial'
 
@@ -290,12 +324,18 @@ class Parallelizer(object):
             mode = self.mode
         else:
             if self.mode != mode:
-                if mode != "mpi" and  mode != "serial" and  mode != "multiprocessing":
+                if mode != "mpi" and  mode != "serial" and  mode != "multiprocessing" and mode != "threads":
                     printout = "Overriding function with a multiprocess mode which doesn't match: " + mode
                     raise Exception(printout)
                 if mode == "mpi":
-                    printout = "Overriding multiprocess can't go from non-mpi to mpi mode"
-                    raise Exception(printout)
+                    if self.flag_for_low_level == True:
+                        # A low-level Parallelizer (e.g., the local one of
+                        # each node in mpi mode) can't use mpi itself, so it
+                        # runs the jobs its own way.
+                        mode = self.mode
+                    else:
+                        printout = "Overriding multiprocess can't go from non-mpi to mpi mode"
+                        raise Exception(printout)
 
         if num_procs == None:
             num_procs = self.num_procs
@@ -316,10 +356,16 @@ class Parallelizer(object):
             return self.parallel_obj.run(func, args)
 
         elif mode == 'multiprocessing':
-            return MultiThreading(args, num_procs,  func)
+            return MultiThreading(args, num_procs,  func, self.limits, self.failed_jobs)
+        elif mode == 'threads':
+            # Only functions known to be thread safe are run in threads. The
+            # limits on each job can only be enforced in worker processes.
+            if is_thread_safe(func) and not limits_are_set(self.limits):
+                return ThreadPool(args, num_procs, func)
+            return MultiThreading(args, num_procs,  func, self.limits, self.failed_jobs)
         else:
             # serial is running the ParallelThreading with num_procs=1
-            return MultiThreading(args, 1,  func)
+            return MultiThreading(args, 1,  func, self.limits, self.failed_jobs)
 
     def pick_mode(self):
         """
@@ -376,7 +422,7 @@ class Parallelizer(object):
             if not self.HAS_MPI:
                 raise Exception('mpi4py package must be available to use mpi mode')
             return mpi4py.MPI.COMM_WORLD.Get_size()
-        elif mode == 'multiprocessing':
+        elif mode == 'multiprocessing' or mode == 'threads':
             return multiprocessing.cpu_count()
         else:
             return 1
@@ -612,7 +658,7 @@ Adapted from examples on https://docs.python.org/2/library/multiprocessing.html
 
 
 
-def MultiThreading(inputs, num_procs, task_name):
+def MultiThreading(inputs, num_procs, task_name, limits=None, failures=None):
     """Initialize this object.
 
     Args:
@@ -621,6 +667,11 @@ def MultiThreading(inputs, num_procs, task_name):
         num_procs (int): The number of processors to use.
         task_class_name (class): The class that governs what to do for each
             job on each processor.
+        limits (dict): The limits placed on each job (see ProcessPool). If
+            any are set, the jobs are run in worker processes even if
+            num_procs is 1, so that they can be enforced.
+        failures (list): Jobs that exceed their limits are recorded here, as
+            (task_name, args, reason) tuples. Their results are None.
     """
 
     results = []
@@ -643,28 +694,79 @@ def MultiThreading(inputs, num_procs, task_name):
         task = (index, (task_name, item))
         tasks.append(task)
 
-    if num_procs == 1:
+    if num_procs == 1 and not limits_are_set(limits):
         for item in tasks:
             job, args = item[1]
             output = job(*args)
             results.append(output)
     else:
-        results = start_processes(tasks, num_procs)
+        results = start_processes(tasks, num_procs, limits, failures)
 
     return results
 
 
-###
-# Worker function
-###
+def thread_safe(func):
+    """
+    Marks a function as safe to run in several threads at once (e.g., it
+    modifies only its own arguments, and otherwise calls RDKit functions that
+    release the GIL). In threads mode, only such functions are run in
+    threads. Others are run in worker processes. Meant to be used as a
+    decorator.
 
-def worker(input, output):
-    for seq, job in iter(input.get, 'STOP'):
-        func, args = job
-        result = func(*args)
-        ret_val = (seq, result)
-        output.put(ret_val)
+    :param python_obj func: The function.
+
+    :returns: The same function.
+    """
+    func.thread_safe = True
+    return func
+
+def is_thread_safe(func):
+    """
+    Determines whether a function was marked with thread_safe().
+
+    :param python_obj func: The function.
 
+    :returns: True if it is thread safe, False otherwise.
+    """
+    return getattr(func, "thread_safe", False)
+
+def ThreadPool(inputs, num_threads, func):
+    """
+    Runs a function on each of the inputs in a pool of threads within the
+    current process. Nothing is pickled or copied, so the jobs share the
+    per-process caches (see MolCache) and use little additional memory. The
+    function must be thread safe (see thread_safe()).
+
+    :param list inputs: A list of tuples, each containing the arguments of
+        a single job.
+    :param int num_threads: The number of threads to use. If less than one,
+        one per processor.
+    :param python_obj func: The function to run.
+
+    :returns: A list of the results, in the order of the inputs.
+    """
+
+    results = []
+
+    # If there are no inputs, just return an empty list.
+    if len(inputs) == 0:
+        return results
+
+    inputs = check_and_format_inputs_to_list_of_tuples(inputs)
+
+    num_threads = count_processors(len(inputs), num_threads)
+
+    if num_threads == 1:
+        return [func(*args) for args in inputs]
+
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    try:
+        futures = [executor.submit(func, *args) for args in inputs]
+        results = [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=True)
+
+    return results
 
 def check_and_format_inputs_to_list_of_tuples(args):
     # Make sure args is a list of tuples
@@ -713,36 +815,517 @@ def count_processors(num_inputs, num_procs):
 
     return num_procs
 
-def start_processes(inputs, num_procs):
+def limits_are_set(limits):
     """
-    Creates a queue of inputs and outputs
+    Determines whether any job limits are in effect.
+
+    :param dict limits: The limits (see ProcessPool), or None.
+
+    :returns: True if any limit is set, False otherwise.
     """
+    if limits is None:
+        return False
 
-    # Create queues
-    task_queue = multiprocessing.Queue()
-    done_queue = multiprocessing.Queue()
+    for key in limits:
+        if limits[key] is not None and limits[key] > 0:
+            return True
 
-    # Submit tasks
-    for item in inputs:
-        task_queue.put(item)
+    return False
 
-    # Start worker processes
-    for i in range(num_procs):
-        multiprocessing.Process(target=worker, args=(task_queue, done_queue)).start()
+# The modules the fork server imports before it starts any workers (see
+# get_context()). Every worker is forked from the server, so it starts with
+# these modules, and the pattern tables they compile, already loaded.
+FORKSERVER_PRELOAD = ["gypsum_dl.Preload"]
 
-    # Get and print results
-    results = []
-    for i in range(len(inputs)):
-        results.append(done_queue.get())
+USE_FORKSERVER = False  # Whether to start workers from a fork server.
+
+MP_CONTEXT = None  # The multiprocessing context, once chosen.
 
-    # Tell child processes to stop
-    for i in range(num_procs):
-        task_queue.put('STOP')
+def use_forkserver(enabled=True):
+    """
+    Chooses whether worker processes are started by a fork server (see
+    get_context()). Off by default. Must be called before the first worker
+    process is started.
+
+    Only enable it if the main script starts Gypsum-DL under
+    if __name__ == "__main__" (as run_gypsum_dl.py does), because the fork
+    server imports the main script again. A script without that guard would
+    start a new run in the fork server.
+
+    :param bool enabled: Whether to use the fork server. Defaults to True.
+    """
+
+    global USE_FORKSERVER
+
+    USE_FORKSERVER = enabled
+
+def get_context():
+    """
+    Gets the multiprocessing context used to start worker processes.
+
+    If use_forkserver() was called and the platform supports it, workers are
+    started by a fork server: a separate process that imports the modules in
+    FORKSERVER_PRELOAD once and then forks a copy of itself for each new
+    worker. Unlike workers forked from the main process, these never hold
+    (nor gradually copy) the main process's memory, which includes the whole
+    input library. Unlike spawned workers, they need not import RDKit etc.
+    themselves.
+
+    Otherwise (or if the fork server can't be started), workers are forked
+    from the main process where the platform supports it, and use the
+    platform's default start method elsewhere (e.g., on Windows). Workers
+    that aren't forked from the main process don't inherit its settings, so
+    they are given them explicitly (see worker_settings()).
+
+    :returns: the multiprocessing context.
+    """
+
+    global MP_CONTEXT
+
+    if MP_CONTEXT is None:
+        if not hasattr(multiprocessing, "get_context"):
+            # Python 2 can only fork.
+            MP_CONTEXT = multiprocessing
+            return MP_CONTEXT
+
+        methods = multiprocessing.get_all_start_methods()
+        if USE_FORKSERVER and "forkserver" in methods:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(FORKSERVER_PRELOAD)
+            try:
+                start_forkserver()
+                MP_CONTEXT = context
+            except Exception as e:
+                Utils.log(
+                    "WARNING: Could not start the fork server (" + str(e) +
+                    "). Forking worker processes instead.",
+                    level=Utils.WARNING
+                )
+
+        if MP_CONTEXT is None:
+            if "fork" in methods:
+                MP_CONTEXT = multiprocessing.get_context("fork")
+            else:
+                MP_CONTEXT = multiprocessing.get_context()
+
+    return MP_CONTEXT
+
+def start_forkserver():
+    """
+    Starts the fork server (see get_context()), if it isn't running already.
+
+    Some versions of Python don't tell the fork server where to find modules
+    (sys.path), so it can't preload Gypsum-DL unless Gypsum-DL is installed.
+    It is therefore started with the current sys.path in its PYTHONPATH.
+    """
+
+    from multiprocessing import forkserver
+
+    old_python_path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        [os.path.abspath(p) for p in sys.path]
+    )
+    try:
+        forkserver.ensure_running()
+    finally:
+        if old_python_path is None:
+            del os.environ["PYTHONPATH"]
+        else:
+            os.environ["PYTHONPATH"] = old_python_path
+
+def worker_settings():
+    """
+    Gets the process-wide settings of the current process (how to log, the
+    force field, and the seed), so worker processes can adopt them. Workers
+    that are not forked from the main process do not inherit them.
+
+    :returns: dict of settings, for apply_worker_settings().
+    """
+
+    settings = {"logging": Utils.LOGGING_CONFIG, "seed": Utils.SEED}
+
+    # Only if it's in use. There's no need to import RDKit here otherwise.
+    MyMol = sys.modules.get("gypsum_dl.MyMol")
+    if MyMol is not None:
+        settings["force_field"] = MyMol.FORCE_FIELD
+
+    return settings
+
+def apply_worker_settings(settings):
+    """
+    Adopts the settings of the main process in a worker process.
+
+    :param dict settings: the settings, from worker_settings().
+    """
+
+    if settings["logging"] is not None:
+        Utils.setup_logging(*settings["logging"])
+    Utils.set_seed(settings["seed"])
+
+    if "force_field" in settings:
+        from gypsum_dl.MyMol import set_force_field
+        set_force_field(settings["force_field"])
+
+def start_processes(inputs, num_procs, limits=None, failures=None):
+    """
+    Runs the inputs on a pool of worker processes and returns the results in
+    the order of the inputs.
+    """
+
+    if limits is None:
+        limits = {}
+
+    pool = ProcessPool(num_procs, **limits)
+
+    # Submit tasks
+    for seq, job in inputs:
+        func, args = job
+        pool.submit(seq, func, args)
+
+    # Get the results
+    results = []
+    try:
+        for i in range(len(inputs)):
+            seq, result, reason = pool.get()
+            if reason is not None:
+                func, args = inputs[seq][1]
+                if failures is not None:
+                    failures.append((func.__name__, args, reason))
+            results.append((seq, result))
+    finally:
+        pool.close()
 
     results.sort(key=lambda tup: tup[0])
 
     return  [item[1] for item in map(list, results)]
 
+class ProcessPool(object):
+    """
+    A persistent pool of worker processes that accepts jobs one at a time.
+
+    Unlike a simple map, jobs can be submitted to a ProcessPool while others
+    are still running, and results are returned in the order they finish.
+    This makes it possible to chain dependent jobs (e.g., the steps of a
+    pipeline) without waiting for every job of the previous kind to
+    complete.
+
+    Each worker runs one job at a time, so the pool can also limit the wall
+    time and memory of each job. A job that exceeds its limits is abandoned
+    and its worker is replaced with a fresh one, so the remaining jobs keep
+    going. Workers can also be replaced after a fixed number of jobs, to
+    return the memory they have accumulated to the system.
+
+    Jobs and their results are pickled and sent through pipes. This includes
+    the 3D coordinates of molecules, which RDKit pickles as one compact
+    binary block per molecule. Passing them through shared memory instead
+    was measured and is not faster: even with Conformer.SetPositions(), which
+    sets all of a conformer's coordinates at once, the main process must
+    still rebuild each conformer, because the SDF and PDB writers need RDKit
+    conformers rather than raw arrays. Pickling is only a small part of that
+    cost.
+    """
+
+    def __init__(self, num_procs, timeout=None, memory_limit=None,
+                 max_tasks_per_worker=None):
+        """
+        Starts the worker processes.
+
+        :param int num_procs: The number of worker processes to start. If
+            less than one, all available processors are used.
+        :param float timeout: The maximum number of seconds a single job may
+            run. None or 0 means no limit.
+        :param int memory_limit: The maximum amount of memory (in MB) a
+            worker may allocate beyond what it started with. None or 0
+            means no limit. Only enforced on platforms that support
+            resource limits (e.g., Linux).
+        :param int max_tasks_per_worker: The number of jobs after which a
+            worker is replaced. None or 0 means workers are never replaced.
+        """
+
+        if num_procs <= 0:
+            num_procs = multiprocessing.cpu_count()
+
+        self.num_procs = num_procs
+        self.timeout = timeout if timeout else None
+        self.memory_limit = memory_limit if memory_limit else None
+        self.max_tasks_per_worker = max_tasks_per_worker if max_tasks_per_worker else None
+        self.settings = worker_settings()
+
+        self.num_pending = 0
+        self.waiting = deque()  # Jobs not yet sent to a worker.
+        self.finished = deque()  # (seq, result, reason) not yet returned.
+
+        self.workers = [self._start_worker() for i in range(num_procs)]
+
+    def _start_worker(self):
+        """
+        Starts a single worker process.
+
+        :returns: dict describing the worker.
+        """
+
+        context = get_context()
+        parent_conn, child_conn = context.Pipe()
+        proc = context.Process(
+            target=pool_worker,
+            args=(child_conn, self.memory_limit, self.settings)
+        )
+        proc.start()
+        child_conn.close()
+
+        return {
+            "process": proc,
+            "conn": parent_conn,
+            "job": None,         # The (seq, func, args) being run.
+            "start_time": None,  # When the job was sent.
+            "num_tasks": 0       # The number of jobs run so far.
+        }
+
+    def _replace_worker(self, i, kill):
+        """
+        Stops a worker and starts a new one in its place.
+
+        :param int i: The index of the worker in self.workers.
+        :param bool kill: Whether to terminate the worker (e.g., because it
+            is stuck) rather than ask it to stop.
+        """
+
+        old = self.workers[i]
+        try:
+            if kill:
+                old["process"].terminate()
+            else:
+                old["conn"].send('STOP')
+        except:
+            pass
+        old["process"].join()
+        old["conn"].close()
+
+        self.workers[i] = self._start_worker()
+
+    def _dispatch(self):
+        """
+        Sends waiting jobs to idle workers.
+        """
+
+        for worker in self.workers:
+            if len(self.waiting) == 0:
+                return
+            if worker["job"] is None:
+                job = self.waiting.popleft()
+                worker["job"] = job
+                worker["start_time"] = time.time()
+                worker["conn"].send((job[1], job[2]))
+
+    def _finish(self, i, result, reason):
+        """
+        Records the outcome of the job run by a worker.
+
+        :param int i: The index of the worker in self.workers.
+        :param result: The result of the job (None if it failed).
+        :param str reason: Why the job failed, or None if it didn't.
+        """
+
+        worker = self.workers[i]
+        self.finished.append((worker["job"][0], result, reason))
+        worker["job"] = None
+        worker["num_tasks"] = worker["num_tasks"] + 1
+
+        if reason is not None:
+            # The worker may be stuck or have run out of memory.
+            self._replace_worker(i, True)
+        elif (self.max_tasks_per_worker is not None and
+                worker["num_tasks"] >= self.max_tasks_per_worker):
+            self._replace_worker(i, False)
+
+    def _poll(self):
+        """
+        Waits for at least one busy worker to finish (or exceed its time
+        limit).
+        """
+
+        busy = [i for i, w in enumerate(self.workers) if w["job"] is not None]
+
+        poll_time = None
+        if self.timeout is not None:
+            # Wake up when the next job would run out of time.
+            now = time.time()
+            poll_time = min([
+                self.workers[i]["start_time"] + self.timeout - now
+                for i in busy
+            ])
+            poll_time = max(poll_time, 0.0)
+
+        waitables = []
+        for i in busy:
+            waitables.append(self.workers[i]["conn"])
+            waitables.append(self.workers[i]["process"].sentinel)
+        ready = wait(waitables, poll_time)
+
+        for i in busy:
+            worker = self.workers[i]
+            if worker["conn"] in ready:
+                try:
+                    status, value = worker["conn"].recv()
+                except (EOFError, OSError):
+                    status, value = "died", None
+            elif worker["process"].sentinel in ready:
+                status, value = "died", None
+            elif (self.timeout is not None and
+                    time.time() - worker["start_time"] >= self.timeout):
+                status = "failed"
+                value = "exceeded the time limit of " + str(self.timeout) + \
+                    " seconds"
+            else:
+                continue
+
+            if status == "done":
+                self._finish(i, value, None)
+            elif status == "failed":
+                self._finish(i, None, value)
+            elif status == "died":
+                self._finish(i, None, "the worker process died unexpectedly")
+            else:
+                self.close()
+                raise Exception("A worker process failed:\n" + value)
+
+    def submit(self, seq, func, args):
+        """
+        Submits a job to the pool.
+
+        :param seq: An identifier that is returned with the result.
+        :param python_obj func: The function to run.
+        :param tuple args: The arguments to pass to func.
+        """
+
+        self.waiting.append((seq, func, args))
+        self.num_pending = self.num_pending + 1
+        self._dispatch()
+
+    def get(self):
+        """
+        Waits for the next job to finish.
+
+        :returns: tuple (seq, result, reason), where seq is the identifier
+            passed to submit(). If the job exceeded its limits, result is None
+            and reason describes what happened. Otherwise reason is None.
+        """
+
+        if self.num_pending == 0:
+            raise Exception("ProcessPool.get() called with no jobs pending.")
+
+        while len(self.finished) == 0:
+            self._poll()
+            self._dispatch()
+
+        self.num_pending = self.num_pending - 1
+        return self.finished.popleft()
+
+    def close(self):
+        """
+        Tells the worker processes to stop and waits for them to exit. Busy
+        workers (e.g., if a job failed) are terminated instead.
+        """
+
+        for worker in self.workers:
+            try:
+                if worker["job"] is None:
+                    worker["conn"].send('STOP')
+                else:
+                    worker["process"].terminate()
+            except:
+                worker["process"].terminate()
+
+        for worker in self.workers:
+            worker["process"].join()
+            worker["conn"].close()
+        self.workers = []
+
+###
+# Worker function
+###
+
+def pool_worker(conn, memory_limit=None, settings=None):
+    """
+    The worker function used by ProcessPool. Receives jobs through conn and
+    sends back ("done", result), ("failed", reason) if the job ran out of
+    memory, or ("error", traceback) if it raised any other exception.
+
+    :param multiprocessing.Connection conn: The worker's end of the pipe.
+    :param int memory_limit: The amount of memory (in MB) this worker may
+        allocate beyond what it started with. None means no limit.
+    :param dict settings: The settings of the main process, from
+        worker_settings(). None means keep the current ones.
+    """
+
+    if settings is not None:
+        apply_worker_settings(settings)
+
+    if memory_limit is not None:
+        limit_memory(memory_limit)
+
+    # The messages logged while running each job are written together, once
+    # the job is done.
+    Utils.buffer_logs()
+
+    while True:
+        job = conn.recv()
+        if job == 'STOP':
+            break
+
+        func, args = job
+        try:
+            result = func(*args)
+            Utils.flush_logs()
+            conn.send(("done", result))
+        except MemoryError:
+            conn.send((
+                "failed",
+                "exceeded the memory limit of " + str(memory_limit) + " MB"
+            ))
+            break
+        except Exception as e:
+            if "bad_alloc" in str(e):
+                # RDKit reports running out of memory this way.
+                conn.send((
+                    "failed",
+                    "exceeded the memory limit of " + str(memory_limit) + " MB"
+                ))
+                break
+            import traceback
+            Utils.flush_logs()
+            conn.send(("error", traceback.format_exc()))
+
+    Utils.flush_logs()
+    conn.close()
+
+def limit_memory(memory_limit):
+    """
+    Limits the address space of the current process to its present size plus
+    memory_limit MB. Does nothing on platforms without resource limits.
+
+    :param int memory_limit: The additional memory allowed, in MB.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return
+
+    current = 0
+    try:
+        # The size of the address space inherited from the parent.
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * resource.getpagesize()
+    except:
+        current = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    limit = current + int(memory_limit) * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except:
+        pass
+
 ###
 # Helper functions
 ###
@@ -0,0 +1,65 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Imported by the fork server that starts Gypsum-DL's worker processes (see
+Parallelizer.get_context()). Loads the modules the workers need (RDKit,
+NumPy, SciPy, and all of the steps) and compiles the substructure patterns
+they share, so that every worker forked from the server starts with them
+ready.
+"""
+
+import __future__
+
+import gypsum_dl.Start
+
+from gypsum_dl.molvs.tautomer import TAUTOMER_TRANSFORMS
+from gypsum_dl.molvs.tautomer import TAUTOMER_SCORES
+from gypsum_dl.molvs.normalize import NORMALIZATIONS
+from gypsum_dl.molvs.charge import ACID_BASE_PAIRS
+from gypsum_dl.molvs.charge import CHARGE_CORRECTIONS
+from gypsum_dl.molvs.fragment import REMOVE_FRAGMENTS
+from gypsum_dl.molvs.standardize import get_standardizer
+
+def compile_patterns():
+    """Compiles the SMARTS patterns of the MolVS tables. MolVS compiles each
+    one the first time it is used and then keeps it, so doing it here spares
+    each worker from doing it again."""
+
+    for transform in TAUTOMER_TRANSFORMS:
+        transform.tautomer
+    for score in TAUTOMER_SCORES:
+        score.smarts
+    for normalization in NORMALIZATIONS:
+        normalization.transform
+        normalization.reactant
+    for pair in ACID_BASE_PAIRS:
+        pair.acid
+        pair.base
+    for correction in CHARGE_CORRECTIONS:
+        correction.smarts
+    for fragment in REMOVE_FRAGMENTS:
+        fragment.smarts
+
+def build_standardizer():
+    """Builds the shared MolVS Standardizer and the sub-objects it uses to
+    standardize molecules (see MyMol.standardize_smiles())."""
+
+    standardizer = get_standardizer()
+    standardizer.disconnect_metals
+    standardizer.normalize
+    standardizer.reionize
+
+compile_patterns()
+build_standardizer()
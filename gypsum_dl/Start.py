@@ -22,12 +22,22 @@ import __future__
 import sys
 import json
 import os
+import time
+import threading
 from datetime import datetime
 from collections import OrderedDict
 
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
 import gypsum_dl.Utils as Utils
+import gypsum_dl.MolCache as MolCache
 from gypsum_dl.Parallelizer import Parallelizer
 from gypsum_dl.Parallelizer import flatten_list
+from gypsum_dl.Parallelizer import ProcessPool
+from gypsum_dl.Parallelizer import limits_are_set
 
 try:
     from rdkit.Chem import AllChem
@@ -46,9 +56,12 @@ except:
     Utils.exception("You need to install scipy and its dependencies.")
 
 from gypsum_dl.MolContainer import MolContainer
+from gypsum_dl.MyMol import set_force_field
+from gypsum_dl.MyMol import set_scoring_threads
 from gypsum_dl.Steps.SMILES.PrepareSmiles import prepare_smiles
 from gypsum_dl.Steps.ThreeD.PrepareThreeD import prepare_3d
 from gypsum_dl.Steps.IO.ProcessOutput import proccess_output
+from gypsum_dl.Steps.IO.ProcessOutput import OutputStream
 from gypsum_dl.Steps.IO.LoadFiles import load_smiles_file
 from gypsum_dl.Steps.IO.LoadFiles import load_sdf_file
 
@@ -90,6 +103,15 @@ def prepare_molecules(args):
         # warning necessary.
         params = set_parameters(args)
 
+    # Set up the screen and (optional) JSONL logging.
+    Utils.setup_logging(params["log_level"], params["log_file"])
+    Utils.log_event("run_start", source=params["source"])
+
+    # Set the force field used to score and minimize the 3D models, and the
+    # seed for reproducible results.
+    set_force_field(params["force_field"])
+    Utils.set_seed(params["seed"])
+
     # If running in serial mode, make sure only one processor is used.
     if params["job_manager"] == "serial":
         if params["num_processors"] != 1:
@@ -132,10 +154,18 @@ def prepare_molecules(args):
     # Throw a message if running on windows. Windows doesn't deal with with
     # multiple processors, so use only 1.
     if sys.platform == "win32":
-        Utils.log("WARNING: Multiprocessing is not supported on Windows. Tasks will be run in Serial mode.")
+        Utils.log("WARNING: Multiprocessing is not supported on Windows. Tasks will be run in Serial mode.", level=Utils.WARNING)
         params["num_processors"] = 1
         params["job_manager"] = "serial"
 
+    # The limits placed on the calculations for each molecule.
+    limits = get_limits(params)
+
+    # Threads can't be stopped, so the limits can only be enforced by running
+    # each calculation in a worker process.
+    if params["job_manager"] == "threads" and limits_are_set(limits):
+        Utils.log("WARNING: Limits are placed on the calculations for each molecule, so worker processes will be used rather than threads.", level=Utils.WARNING)
+
     # Launch mpi workers if that's what's specified.
     if params["job_manager"] == 'mpi':
         params["Parallelizer"] = Parallelizer(params["job_manager"], params["num_processors"])
@@ -144,23 +174,47 @@ def prepare_molecules(args):
         # problems with importing the MPI environment and mpi4py. So we will
         # flag it to skip the MPI mode and just go to multiprocess/serial.
         # This is a saftey precaution
-        params["Parallelizer"] = Parallelizer(params["job_manager"], params["num_processors"], True)
+        params["Parallelizer"] = Parallelizer(params["job_manager"], params["num_processors"], True, **limits)
+
+        # The variants of the molecules are ranked by energy in this process,
+        # while the workers are idle, so several can be embedded at once.
+        set_scoring_threads(params["Parallelizer"].num_procs)
 
     # Let the user know that their command-line parameters will be ignored, if
     # they have specified a json file.
     if need_to_print_override_warning == True:
-        Utils.log("WARNING: Using the --json flag overrides all other flags.")
+        Utils.log("WARNING: Using the --json flag overrides all other flags.", level=Utils.WARNING)
 
     # If running in mpi mode, separate_output_files must be set to true.
     if params["job_manager"] == "mpi" and params["separate_output_files"] == False:
-        Utils.log("WARNING: Running in mpi mode, but separate_output_files is not set to True. Setting separate_output_files to True anyway.")
+        Utils.log("WARNING: Running in mpi mode, but separate_output_files is not set to True. Setting separate_output_files to True anyway.", level=Utils.WARNING)
         params["separate_output_files"] = True
 
     # Outputing HTML files not supported in mpi mode.
     if params["job_manager"] == "mpi" and params["add_html_output"] == True:
-        Utils.log("WARNING: Running in mpi mode, but add_html_output is set to True. HTML output is not supported in mpi mode.")
+        Utils.log("WARNING: Running in mpi mode, but add_html_output is set to True. HTML output is not supported in mpi mode.", level=Utils.WARNING)
         params["add_html_output"] = False
 
+    # The pipeline runs on local worker processes, so it isn't used in mpi
+    # mode (which already runs each container through all steps on a single
+    # node).
+    if params["job_manager"] == "mpi" and params["pipeline_steps"] == True:
+        Utils.log("WARNING: Running in mpi mode, but pipeline_steps is set to True. Pipelining the steps is not supported in mpi mode.", level=Utils.WARNING)
+        params["pipeline_steps"] = False
+
+    # Local worker pools on each node are only used in mpi mode.
+    if params["job_manager"] != "mpi" and params["mpi_local_processors"] != 1:
+        Utils.log("WARNING: mpi_local_processors is only used in mpi mode. Use num_processors instead.", level=Utils.WARNING)
+
+    # The tautomer cache that is saved is the main process's, which only
+    # receives the tautomers when the steps are run from the main process.
+    if params["tautomer_cache_file"] != "" and (params["job_manager"] == "mpi" or params["pipeline_steps"] == True):
+        Utils.log("WARNING: tautomer_cache_file is set, but the tautomer cache can't be saved in mpi mode or when pipeline_steps is set to True.", level=Utils.WARNING)
+        params["tautomer_cache_file"] = ""
+
+    if params["tautomer_cache_file"] != "":
+        MolCache.load_tautomers(params["tautomer_cache_file"])
+
     # Load SMILES data
     if isinstance(params["source"], str):
         # Smiles must be array of strs.
@@ -204,12 +258,12 @@ def prepare_molecules(args):
             Utils.exception(msg)
 
         if detect_unassigned_bonds(smiles) is None:
-            Utils.log("WARNING: Throwing out SMILES because of unassigned bonds: " + smiles)
+            Utils.log("WARNING: Throwing out SMILES because of unassigned bonds: " + smiles, level=Utils.WARNING)
             continue
 
         new_contnr = MolContainer(smiles, name, idx_counter, props)
         if new_contnr.orig_smi_canonical==None or type(new_contnr.orig_smi_canonical) !=str:
-            Utils.log("WARNING: Throwing out SMILES because of it couldn't convert to mol: " + smiles)
+            Utils.log("WARNING: Throwing out SMILES because of it couldn't convert to mol: " + smiles, level=Utils.WARNING)
             continue
 
         contnrs.append(new_contnr)
@@ -227,7 +281,13 @@ def prepare_molecules(args):
     # molecule container on a single thread.
     if params["Parallelizer"].return_mode() != "mpi":
         # Non-MPI (e.g., multiprocessing)
-        execute_gypsum_dl(contnrs, params)
+        if params["pipeline_steps"] == True:
+            execute_gypsum_dl_pipeline(contnrs, params)
+        else:
+            execute_gypsum_dl(contnrs, params)
+
+        if params["tautomer_cache_file"] != "":
+            MolCache.save_tautomers(params["tautomer_cache_file"])
     else:
         # MPI mode. Group the molecule containers so they can be passed to the
         # parallelizer.
@@ -239,9 +299,23 @@ def prepare_molecules(args):
             else:
                 temp_param[key] = params[key]
 
-        for contnr in contnrs:
-            contnr.contnr_idx = 0  # Because each container being run in isolation.
-            job_input.append(tuple([[contnr], temp_param]))
+        if params["mpi_local_processors"] == 1:
+            # Each container is a separate job, run in serial on whichever
+            # node it is sent to (see execute_gypsum_dl()).
+            for contnr in contnrs:
+                contnr.contnr_idx = 0  # Because each container being run in isolation.
+                job_input.append(tuple([[contnr], temp_param]))
+        else:
+            # Hybrid mode. Each node gets a single job, with its share of the
+            # containers, and runs each step on its own pool of workers.
+            num_nodes = params["Parallelizer"].compute_nodes()
+            for i in range(num_nodes):
+                node_contnrs = contnrs[i::num_nodes]
+                if len(node_contnrs) == 0:
+                    continue
+                for idx, contnr in enumerate(node_contnrs):
+                    contnr.update_idx(idx)
+                job_input.append(tuple([node_contnrs, temp_param]))
         job_input = tuple(job_input)
 
         params["Parallelizer"].run(job_input, execute_gypsum_dl)
@@ -256,6 +330,7 @@ def prepare_molecules(args):
     Utils.log("\nStart time at: " + str(start_time))
     Utils.log("End time at:   " + str(end_time))
     Utils.log("Total time at: " + str(run_time))
+    Utils.log_event("run_done", seconds=run_time.total_seconds())
 
     # Kill mpi workers if necessary.
     params["Parallelizer"].end(params["job_manager"])
@@ -268,14 +343,47 @@ def execute_gypsum_dl(contnrs, params):
     :param params: A dictionary containing all of the parameters.
     :type params: dict
     """
+    # In mpi mode, this is run on another node, where logging must be set up
+    # too. The messages about each container are written out together.
+    mpi_node = params["job_manager"] == "mpi"
+    if mpi_node:
+        Utils.setup_logging(params["log_level"], params["log_file"])
+        Utils.buffer_logs()
+        set_force_field(params["force_field"])
+        Utils.set_seed(params["seed"])
+
+        # The steps run in serial on each node, unless a pool of local
+        # workers is requested (hybrid mode). If limits are placed on the
+        # calculations, they must also be run in separate (local) worker
+        # processes so they can be enforced. Flagged as low level so mpi4py
+        # isn't imported again.
+        limits = get_limits(params)
+        local_procs = params["mpi_local_processors"]
+        if local_procs != 1 or limits_are_set(limits):
+            local_mode = params["mpi_local_job_manager"] if local_procs != 1 else "serial"
+            params = dict(params)  # Other jobs on this node share params.
+            params["Parallelizer"] = Parallelizer(local_mode, local_procs, True, **limits)
+            params["num_processors"] = params["Parallelizer"].num_procs
+            set_scoring_threads(params["num_processors"])
+
     # Start creating the models.
 
     # Prepare the smiles. Desalt, consider alternate ionization, tautometeric,
     # stereoisomeric forms, etc.
+    start = time.time()
     prepare_smiles(contnrs, params)
+    Utils.log_event(
+        "stage_done", stage="smiles", containers=len(contnrs),
+        seconds=time.time() - start
+    )
 
     # Convert the processed SMILES strings to 3D.
+    start = time.time()
     prepare_3d(contnrs, params)
+    Utils.log_event(
+        "stage_done", stage="3d", containers=len(contnrs),
+        seconds=time.time() - start
+    )
 
     # Add in name and unique id to each molecule.
     add_mol_id_props(contnrs)
@@ -289,6 +397,181 @@ def execute_gypsum_dl(contnrs, params):
     # Process the output.
     proccess_output(contnrs, params)
 
+    if mpi_node:
+        Utils.flush_logs()
+
+def execute_gypsum_dl_pipeline(contnrs, params):
+    """Like execute_gypsum_dl(), but the manipulations are run as a pipeline
+    of stages (SMILES preparation, 3D preparation, and output). Each container
+    moves on to the next stage as soon as it has finished the current one,
+    rather than waiting for all the other containers. So one slow molecule
+    doesn't hold up the rest, and output is written as it becomes available.
+
+    The stages of each container are run on their own in a pool of worker
+    processes. The number of containers in the pool at any one time, and the
+    number waiting to be written, are bounded so that memory use stays under
+    control.
+
+    The per-molecule limits (see get_limits()) apply to each stage of a
+    container as a whole, not to each molecular variant as they do in
+    execute_gypsum_dl(). So if a single variant takes too long, the whole
+    container is recorded as failed.
+
+    :param contnrs: A list of all molecules.
+    :type contnrs: list
+    :param params: A dictionary containing all of the parameters.
+    :type params: dict
+    """
+
+    if len(contnrs) == 0:
+        return
+
+    # Each stage works on a single container, on a single processor.
+    stage_params = {}
+    for key in list(params.keys()):
+        if key == "Parallelizer":
+            stage_params["Parallelizer"] = None
+        else:
+            stage_params[key] = params[key]
+
+    stages = [run_smiles_stage]
+    if not params["2d_output_only"]:
+        stages.append(run_3d_stage)
+
+    pool = ProcessPool(
+        params["Parallelizer"].return_node(), **params["Parallelizer"].limits
+    )
+    max_in_flight = 2 * pool.num_procs
+
+    # Finished containers are written by a separate thread, so the pool can
+    # keep working in the meantime.
+    output_queue = Queue(maxsize=max_in_flight)
+    output_errors = []
+    writer = threading.Thread(
+        target=write_pipeline_output,
+        args=(output_queue, params, output_errors)
+    )
+    writer.start()
+
+    try:
+        next_idx = 0
+        while next_idx < len(contnrs) or pool.num_pending > 0:
+            # Feed new containers into the first stage, as long as there's
+            # room.
+            while next_idx < len(contnrs) and pool.num_pending < max_in_flight:
+                contnr = contnrs[next_idx]
+                contnr.contnr_idx = 0  # Because each container being run in isolation.
+                pool.submit((next_idx, 0), stages[0], (contnr, stage_params))
+                next_idx = next_idx + 1
+
+            # Move the next finished container on to the next stage.
+            (idx, stage_idx), contnr, reason = pool.get()
+            if reason is not None:
+                # This container exceeded its limits. Record it as failed,
+                # and move on.
+                params["Parallelizer"].failed_jobs.append(
+                    (stages[stage_idx].__name__, (contnrs[idx],), reason)
+                )
+            elif stage_idx + 1 < len(stages):
+                pool.submit(
+                    (idx, stage_idx + 1), stages[stage_idx + 1],
+                    (contnr, stage_params)
+                )
+            else:
+                output_queue.put(contnr)
+    finally:
+        pool.close()
+        output_queue.put(None)
+        writer.join()
+
+    if len(output_errors) > 0:
+        Utils.exception("Could not save output:\n" + output_errors[0])
+
+def run_smiles_stage(contnr, params):
+    """The SMILES-preparation stage of the pipeline. Run in a worker process.
+
+    :param contnr: The container (MolContainer.MolContainer).
+    :type contnr: MolContainer.MolContainer
+    :param params: A dictionary containing all of the parameters.
+    :type params: dict
+    :return: The container, with its SMILES prepared.
+    :rtype: MolContainer.MolContainer
+    """
+
+    prepare_smiles([contnr], params)
+    return contnr
+
+def run_3d_stage(contnr, params):
+    """The 3D-preparation stage of the pipeline. Run in a worker process.
+
+    :param contnr: The container (MolContainer.MolContainer).
+    :type contnr: MolContainer.MolContainer
+    :param params: A dictionary containing all of the parameters.
+    :type params: dict
+    :return: The container, with its 3D models.
+    :rtype: MolContainer.MolContainer
+    """
+
+    prepare_3d([contnr], params)
+    return contnr
+
+def write_pipeline_output(output_queue, params, errors):
+    """The output stage of the pipeline. Run in a thread of the main process.
+    Writes each container to the disk as it arrives, until None is received.
+
+    :param output_queue: The queue of finished containers.
+    :type output_queue: queue.Queue
+    :param params: A dictionary containing all of the parameters.
+    :type params: dict
+    :param errors: A list to which a description of any error is appended.
+    :type errors: list
+    """
+
+    failed_contnrs = []
+    cont_id = 0
+    out = None
+
+    while True:
+        contnr = output_queue.get()
+        if contnr is None:
+            break
+
+        # If something went wrong, keep emptying the queue so the pipeline
+        # doesn't stall.
+        if len(errors) > 0:
+            continue
+
+        try:
+            if out is None:
+                out = OutputStream(params)
+
+            # Add in name and unique id to each molecule.
+            cont_id = add_mol_id_props([contnr], cont_id)
+
+            # Output the current SMILES.
+            Utils.print_current_smiles([contnr])
+
+            if len(contnr.mols) == 0:
+                failed_contnrs.append(contnr)
+
+            out.write(contnr)
+        except:
+            import traceback
+            errors.append(traceback.format_exc())
+
+    if len(errors) > 0:
+        return
+
+    try:
+        if out is not None:
+            out.close()
+
+        # Write any mols that fail entirely to a file.
+        deal_with_failed_molecules(failed_contnrs, params)
+    except:
+        import traceback
+        errors.append(traceback.format_exc())
+
 def detect_unassigned_bonds(smiles):
     """Detects whether a give smiles string has unassigned bonds.
 
@@ -342,6 +625,18 @@ def set_parameters(params_unicode):
         "let_tautomers_change_chirality": False,
         "use_durrant_lab_filters": False,
         "job_manager" : "multiprocessing",
+        "mpi_local_processors": 1,
+        "mpi_local_job_manager": "multiprocessing",
+        "pipeline_steps": False,
+        "molecule_timeout": 0.0,
+        "molecule_memory_limit": 0,
+        "max_tasks_per_worker": 0,
+        "minimization_threads": 1,
+        "force_field": "UFF",
+        "seed": -1,
+        "log_level": "INFO",
+        "log_file": "",
+        "tautomer_cache_file": "",
         "cache_prerun": False,
         "test": False
     })
@@ -499,23 +794,81 @@ def finalize_params(params):
     # Make sure job_manager is always lower case.
     params["job_manager"] = params["job_manager"].lower()
 
+    params["mpi_local_job_manager"] = params["mpi_local_job_manager"].lower()
+    if params["mpi_local_job_manager"] not in ["multiprocessing", "threads"]:
+        Utils.exception(
+            "The parameter \"mpi_local_job_manager\" must be " +
+            "multiprocessing or threads."
+        )
+
+    if params["minimization_threads"] < 0:
+        Utils.exception(
+            "The parameter \"minimization_threads\" must be 0 (one per " +
+            "CPU core) or greater."
+        )
+
+    # Make sure the force field is one that's recognized.
+    params["force_field"] = params["force_field"].upper()
+    if params["force_field"] not in ["UFF", "MMFF94", "MMFF94S"]:
+        Utils.exception(
+            "The parameter \"force_field\" must be UFF, MMFF94, or MMFF94s."
+        )
+
+    # Make sure the log level is one that's recognized.
+    params["log_level"] = params["log_level"].upper()
+    if params["log_level"] not in ["DEBUG", "INFO", "WARNING", "ERROR"]:
+        Utils.exception(
+            "The parameter \"log_level\" must be DEBUG, INFO, WARNING, " +
+            "or ERROR."
+        )
+
+    if params["log_file"] != "":
+        params["log_file"] = os.path.abspath(params["log_file"])
+
+    if params["tautomer_cache_file"] != "":
+        params["tautomer_cache_file"] = os.path.abspath(params["tautomer_cache_file"])
+
     return params
 
-def add_mol_id_props(contnrs):
+def get_limits(params):
+    """Gets the limits placed on the calculations for each molecule, in the
+       form the Parallelizer expects. Usually each calculation is one step
+       run on one molecular variant. When pipeline_steps is set, it is
+       instead one stage (all the SMILES steps, or all the 3D steps) run on
+       one input molecule and all its variants.
+
+    :param params: The parameters.
+    :type params: dict
+    :return: The limits (timeout, memory_limit, and max_tasks_per_worker).
+    :rtype: dict
+    """
+
+    return {
+        "timeout": params["molecule_timeout"],
+        "memory_limit": params["molecule_memory_limit"],
+        "max_tasks_per_worker": params["max_tasks_per_worker"]
+    }
+
+def add_mol_id_props(contnrs, cont_id=0):
     """Once all molecules have been generated, go through each and add the
        name and a unique id (for writing to the SDF file, for example).
 
     :param contnrs: A list of containers (MolContainer.MolContainer).
     :type contnrs: list
+    :param cont_id: The last unique id already assigned. Defaults to 0.
+    :type cont_id: int, optional
+    :return: The last unique id assigned.
+    :rtype: int
     """
 
-    cont_id = 0
     for contnr in contnrs:
         for mol in contnr.mols:
             cont_id = cont_id + 1
             mol.set_rdkit_mol_prop("UniqueID", str(cont_id))
             mol.set_all_rdkit_mol_props()
 
+    return cont_id
+
 def deal_with_failed_molecules(contnrs, params):
     """Removes and logs failed molecules.
 
@@ -527,10 +880,33 @@ def deal_with_failed_molecules(contnrs, params):
     """
 
     failed_ones = []  # To keep track of failed molecules
+
+    # First, the molecules that exceeded their time or memory limits. Note
+    # that other variants of the same input molecule may have succeeded.
+    failed_ids = set([])
+    if params["Parallelizer"] is not None:
+        for func_name, args, reason in params["Parallelizer"].failed_jobs:
+            smi, name = describe_failed_job(args)
+            failed_ids.add((smi, name))
+            Utils.log_event(
+                "molecule_failed", smiles=smi, name=name, step=func_name,
+                reason=reason
+            )
+            astr = smi + "\t" + name + "\t" + "(" + func_name + " " + \
+                reason + ")"
+            failed_ones.append(astr)
+
+    # Now the input molecules for which no models were generated at all.
     for contnr in contnrs:
         if len(contnr.mols) == 0:
+            if (contnr.orig_smi, contnr.name) in failed_ids:
+                # Already listed above, with the reason.
+                continue
             astr = contnr.orig_smi + "\t" + contnr.name
             failed_ones.append(astr)
+            Utils.log_event(
+                "molecule_failed", smiles=contnr.orig_smi, name=contnr.name
+            )
 
     # Let the user know if there's more than one failed molecule.
     if len(failed_ones) > 0:
@@ -544,3 +920,26 @@ def deal_with_failed_molecules(contnrs, params):
         outfile = open(params["output_folder"] + os.sep + "gypsum_dl_failed.smi", 'w')
         outfile.write("\n".join(failed_ones))
         outfile.close()
+
+def describe_failed_job(args):
+    """Gets the SMILES string and name of the molecule a failed job was
+    working on.
+
+    :param args: The arguments passed to the failed job.
+    :type args: tuple
+    :return: A (smiles, name) tuple. For a container, the SMILES is that of
+       the input molecule. For a variant, it is that of the variant itself.
+    :rtype: tuple
+    """
+
+    for arg in args:
+        if isinstance(arg, MolContainer):
+            return arg.orig_smi, arg.name
+        if hasattr(arg, "genealogy") and hasattr(arg, "orig_smi"):
+            # A MyMol.MyMol object.
+            smi = arg.smiles()
+            if smi is None:
+                smi = arg.orig_smi
+            return smi, arg.name
+
+    return "", ""
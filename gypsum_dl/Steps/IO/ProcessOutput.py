@@ -20,6 +20,8 @@ disk (output).
 import __future__
 
 from gypsum_dl.Steps.IO.SaveToSDF import save_to_sdf
+from gypsum_dl.Steps.IO.SaveToSDF import start_sdf_output
+from gypsum_dl.Steps.IO.SaveToSDF import save_contnr_to_sdf
 from gypsum_dl.Steps.IO.SaveToPDB import convert_sdfs_to_PDBs
 from gypsum_dl.Steps.IO.Web2DOutput import web_2d_output
 from gypsum_dl import Utils
@@ -43,3 +45,60 @@ def proccess_output(contnrs, params):
     if params["add_pdb_output"] == True:
         Utils.log("\nMaking PDB output files\n")
         convert_sdfs_to_PDBs(contnrs, output_folder)
+
+class OutputStream(object):
+    """Writes the molecular models to the disk one container at a time, as
+    they become available. Used when the preparation steps are run as a
+    pipeline, so output need not wait until every molecule is finished."""
+
+    def __init__(self, params):
+        """The constructor. Opens the output file(s).
+
+        :param params: The parameters.
+        :type params: dict
+        """
+
+        self.params = params
+        self.separate_output_files = params["separate_output_files"]
+        self.output_folder = params["output_folder"]
+
+        # HTML output is written all at once, so those containers must be
+        # kept.
+        self.contnrs_for_html = []
+
+        self.sdf_writer = start_sdf_output(
+            params, self.separate_output_files, self.output_folder
+        )
+
+        Utils.log("Saving molecules associated with...")
+
+    def write(self, contnr):
+        """Writes the models of a single container to the disk.
+
+        :param contnr: The container (MolContainer.MolContainer).
+        :type contnr: MolContainer.MolContainer
+        """
+
+        save_contnr_to_sdf(
+            contnr, self.sdf_writer, self.separate_output_files,
+            self.output_folder
+        )
+        if self.sdf_writer is not None:
+            self.sdf_writer.flush()
+
+        if self.params["add_pdb_output"] == True:
+            convert_sdfs_to_PDBs([contnr], self.output_folder)
+
+        if self.params["add_html_output"] == True:
+            self.contnrs_for_html.append(contnr)
+
+    def close(self):
+        """Closes the output file(s), and writes the HTML output if
+        requested."""
+
+        if self.sdf_writer is not None:
+            self.sdf_writer.close()
+            self.sdf_writer = None
+
+        if self.params["add_html_output"] == True:
+            web_2d_output(self.contnrs_for_html, self.output_folder)
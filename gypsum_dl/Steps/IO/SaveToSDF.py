@@ -41,6 +41,33 @@ def save_to_sdf(contnrs, params, separate_output_files, output_folder):
     """
 
     # Save an empty molecule with the parameters.
+    w = start_sdf_output(params, separate_output_files, output_folder)
+
+    # Also save the file or files containing the output molecules.
+    Utils.log("Saving molecules associated with...")
+    for i, contnr in enumerate(contnrs):
+        save_contnr_to_sdf(contnr, w, separate_output_files, output_folder)
+
+    if separate_output_files == False:
+        w.flush()
+        w.close()
+
+def start_sdf_output(params, separate_output_files, output_folder):
+    """Saves an empty molecule describing the parameters to the disk. This
+    molecule is the first entry of the output SDF file.
+
+    :param params: The parameters.
+    :type params: dict
+    :param separate_output_files: Whether save each molecule to a different
+       file.
+    :type separate_output_files: bool
+    :param output_folder: The output folder.
+    :type output_folder: str
+    :return: The open SDWriter to which the output molecules should be
+       written, or None if each molecule is saved to a different file.
+    :rtype: rdkit.Chem.rdmolfiles.SDWriter | None
+    """
+
     if separate_output_files == False:
         w = Chem.SDWriter(output_folder + os.sep + "gypsum_dl_success.sdf")
     else:
@@ -55,36 +82,47 @@ def save_to_sdf(contnrs, params, separate_output_files, output_folder):
     if separate_output_files == True:
         w.flush()
         w.close()
+        return None
 
-    # Also save the file or files containing the output molecules.
-    Utils.log("Saving molecules associated with...")
-    for i, contnr in enumerate(contnrs):
-        # Add the container properties to the rdkit_mol object so they get
-        # written to the SDF file.
-        contnr.add_container_properties()
-
-        # Let the user know which molecule you're on.
-        Utils.log("\t" + contnr.orig_smi)
-
-        # Save the file(s).
-        if separate_output_files == True:
-            # sdf_file = "{}{}__{}.pdb".format(output_folder + os.sep, slug(name), conformer_counter)
-            sdf_file = "{}{}__input{}.sdf".format(
-                output_folder + os.sep,
-                Utils.slug(contnr.name),
-                contnr.contnr_idx_orig + 1
-            )
-            w = Chem.SDWriter(sdf_file)
-            # w = Chem.SDWriter(output_folder + os.sep + "output." + str(i + 1) + ".sdf")
-
-        for m in contnr.mols:
-            m.load_conformers_into_rdkit_mol()
-            w.write(m.rdkit_mol)
-
-        if separate_output_files == True:
-            w.flush()
-            w.close()
+    return w
 
-    if separate_output_files == False:
+def save_contnr_to_sdf(contnr, w, separate_output_files, output_folder):
+    """Saves the 3D models of a single container to the disk.
+
+    :param contnr: The container (MolContainer.MolContainer).
+    :type contnr: MolContainer.MolContainer
+    :param w: The open SDWriter returned by start_sdf_output(). Ignored if
+       separate_output_files is True.
+    :type w: rdkit.Chem.rdmolfiles.SDWriter | None
+    :param separate_output_files: Whether save each molecule to a different
+       file.
+    :type separate_output_files: bool
+    :param output_folder: The output folder.
+    :type output_folder: str
+    """
+
+    # Add the container properties to the rdkit_mol object so they get
+    # written to the SDF file.
+    contnr.add_container_properties()
+
+    # Let the user know which molecule you're on.
+    Utils.log("\t" + contnr.orig_smi)
+
+    # Save the file(s).
+    if separate_output_files == True:
+        # sdf_file = "{}{}__{}.pdb".format(output_folder + os.sep, slug(name), conformer_counter)
+        sdf_file = "{}{}__input{}.sdf".format(
+            output_folder + os.sep,
+            Utils.slug(contnr.name),
+            contnr.contnr_idx_orig + 1
+        )
+        w = Chem.SDWriter(sdf_file)
+        # w = Chem.SDWriter(output_folder + os.sep + "output." + str(i + 1) + ".sdf")
+
+    for m in contnr.mols:
+        m.load_conformers_into_rdkit_mol()
+        w.write(m.rdkit_mol)
+
+    if separate_output_files == True:
         w.flush()
         w.close()
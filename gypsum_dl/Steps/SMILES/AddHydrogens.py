@@ -17,15 +17,17 @@ This module identifies and enumerates the possible protonation sites of
 molecules.
 """
 
-from rdkit import Chem
-
 import gypsum_dl.Parallelizer as Parallelizer
 import gypsum_dl.Utils as Utils
 import gypsum_dl.ChemUtils as ChemUtils
 import gypsum_dl.MyMol as MyMol
 import gypsum_dl.MolContainer as MolCont
 
-from gypsum_dl.Steps.SMILES.dimorphite_dl.dimorphite_dl import Protonate
+from gypsum_dl.Steps.SMILES.dimorphite_dl.dimorphite_dl import Protonator
+
+# The Dimorphite-DL protonators used in this process, by their settings. Each
+# loads its substructures once, and is then reused for every molecule.
+PROTONATORS = {}
 
 def add_hydrogens(contnrs, min_pH, max_pH, st_dev, max_variants_per_compound,
                   thoroughness, num_procs, job_manager,
@@ -80,6 +82,8 @@ def add_hydrogens(contnrs, min_pH, max_pH, st_dev, max_variants_per_compound,
         for i in inputs:
             results.append(parallel_add_H(i[0],i[1]))
 
+    # Remove None values (e.g., molecules that exceeded their time limit).
+    results = Parallelizer.strip_none(results)
     results = Parallelizer.flatten_list(results)
 
     # Dimorphite-DL might not have generated ionization states for some
@@ -116,6 +120,26 @@ def add_hydrogens(contnrs, min_pH, max_pH, st_dev, max_variants_per_compound,
         contnrs, results, max_variants_per_compound, thoroughness
     )
 
+def get_protonator(protonation_settings):
+    """Gets the Dimorphite-DL protonator for the given settings, creating it
+       the first time it is needed in this process.
+
+    :param protonation_settings: Protonation settings to pass to Dimorphite-DL.
+    :type protonation_settings: dict
+    :return: The protonator.
+    :rtype: dimorphite_dl.Protonator
+    """
+
+    key = tuple(sorted(protonation_settings.items()))
+    protonator = PROTONATORS.get(key)
+    if protonator is None:
+        # Created outside any lock. Threads that get here at the same time
+        # just make identical protonators.
+        protonator = Protonator(**protonation_settings)
+        PROTONATORS[key] = protonator
+    return protonator
+
+@Parallelizer.thread_safe
 def parallel_add_H(contnr, protonation_settings):
     """Creates alternate ionization variants for a given molecule container.
        This is the function that gets fed into the parallelizer.
@@ -134,18 +158,12 @@ def parallel_add_H(contnr, protonation_settings):
         Utils.log("type container.orig_smi_canonical: " + str(type(contnr.orig_smi_canonical)))
         Utils.exception("container.orig_smi_canonical: " + contnr.orig_smi_canonical)
 
-    # Add the SMILES string to the protonation parameters.
-    protonation_settings["smiles"] = contnr.orig_smi_canonical
-
-    # Protonate the SMILESstring. This is Dimorphite-DL.
-    smis = Protonate(protonation_settings)
-
-    # Convert the protonated SMILES strings into a list of rdkit molecule
-    # objects.
-    rdkit_mols = [Chem.MolFromSmiles(smi.strip()) for smi in smis]
+    # Protonate the molecule. This is Dimorphite-DL.
+    protonator = get_protonator(protonation_settings)
+    rdkit_mols = protonator.protonate(contnr.mol_orig_frm_inp_smi.rdkit_mol)
 
     # Convert from rdkit mols to MyMol.MyMol.
-    addH_mols = [MyMol.MyMol(mol) for mol in rdkit_mols if mol is not None]
+    addH_mols = [MyMol.MyMol(mol) for mol in rdkit_mols]
 
     # Remove MyMols with odd substructures.
     addH_mols = [mol for mol in addH_mols if mol.remove_bizarre_substruc() is False]
@@ -65,7 +65,7 @@ def durrant_lab_filters(contnrs, num_procs, job_manager, parallelizer_obj):
             params, parallel_durrant_lab_filter, num_procs, job_manager
         )
     else:
-        for c in params:
+        for c in contnrs:
             tmp.append(parallel_durrant_lab_filter(c, prohibited_substructs))
 
     # Note that results is a list of containers.
@@ -106,6 +106,7 @@ def enumerate_chiral_molecules(contnrs, max_variants_per_compound, thoroughness,
         contnrs, flat, max_variants_per_compound, thoroughness
     )
 
+@Parallelizer.thread_safe
 def parallel_get_chiral(mol, max_variants_per_compound, thoroughness):
     """A parallelizable function for enumerating chiralities.
 
@@ -160,7 +161,9 @@ def parallel_get_chiral(mol, max_variants_per_compound, thoroughness):
     # Randomly select a few of the chiral combinations to examine. This is to
     # reduce the potential  combinatorial explosion.
     num_to_keep_initially = thoroughness * max_variants_per_compound
-    options = Utils.random_sample(options, num_to_keep_initially, "")
+    options = Utils.random_sample(
+        options, num_to_keep_initially, "", mol.smiles()
+    )
 
     # Go through the chirality combinations and make a molecule with that
     # chirality.
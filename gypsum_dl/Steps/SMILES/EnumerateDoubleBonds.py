@@ -110,6 +110,7 @@ def enumerate_double_bonds(contnrs, max_variants_per_compound, thoroughness, num
         contnrs, flat, max_variants_per_compound, thoroughness
     )
 
+@Parallelizer.thread_safe
 def parallel_get_double_bonded(mol, max_variants_per_compound):
     """A parallelizable function for enumerating double bonds.
 
@@ -227,7 +228,8 @@ def parallel_get_double_bonded(mol, max_variants_per_compound):
             continue
 
     # Remove ones that don't have "/" or "\". These are not real enumerated ones.
-    smiles_to_consider = [s for s in smiles_to_consider if "/" in s or "\\" in s]
+    # Sorted, so the order doesn't vary from run to run.
+    smiles_to_consider = [s for s in sorted(smiles_to_consider) if "/" in s or "\\" in s]
 
     # Get the maximum number of / + \ in any string.
     cnts = [s.count("/") + s.count("\\") for s in smiles_to_consider]
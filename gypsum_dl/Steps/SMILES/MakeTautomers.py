@@ -24,6 +24,7 @@ import gypsum_dl.Parallelizer as Parallelizer
 import gypsum_dl.Utils as Utils
 import gypsum_dl.ChemUtils as ChemUtils
 import gypsum_dl.MyMol as MyMol
+import gypsum_dl.MolCache as MolCache
 import gypsum_dl.MolObjectHandling as MOH
 
 try:
@@ -74,11 +75,18 @@ def make_tauts(contnrs, max_variants_per_compound, thoroughness, num_procs, job_
 
     Utils.log("Generating tautomers for all molecules...")
 
-    # Create the parameters to feed into the parallelizer object.
+    # Create the parameters to feed into the parallelizer object. Many
+    # molecules are identical to ones seen before (e.g., common fragments of a
+    # combinatorial library), so pass along any tautomers already in the
+    # cache. Those needn't be enumerated again.
     params = []
     for contnr in contnrs:
         for mol_index, mol in enumerate(contnr.mols):
-            params.append(tuple([contnr, mol_index, max_variants_per_compound]))
+            key = MolCache.tautomers_key(mol.smiles(), max_variants_per_compound)
+            params.append(tuple([
+                contnr, mol_index, max_variants_per_compound,
+                MolCache.cached_tautomers(key)
+            ]))
     params = tuple(params)
 
     # Run the tautomizer through the parallel object.
@@ -87,11 +95,14 @@ def make_tauts(contnrs, max_variants_per_compound, thoroughness, num_procs, job_
         tmp = parallelizer_obj.run(params, parallel_make_taut, num_procs, job_manager)
     else:
         for i in params:
-            tmp.append(parallel_make_taut(i[0],i[1],i[2]))
+            tmp.append(parallel_make_taut(i[0],i[1],i[2],i[3]))
 
-    # Flatten the resulting list of lists.
-    none_data = tmp
-    taut_data = Parallelizer.flatten_list(none_data)
+    # Cache the tautomers (they may have been enumerated in other processes)
+    # and collect the resulting molecules.
+    taut_data = []
+    for key, taut_smis, tauts in Parallelizer.strip_none(tmp):
+        MolCache.cache_tautomers(key, taut_smis)
+        taut_data.extend(tauts)
 
     # Remove bad tautomers.
     taut_data = tauts_no_break_arom_rngs(contnrs, taut_data, num_procs,
@@ -111,7 +122,8 @@ def make_tauts(contnrs, max_variants_per_compound, thoroughness, num_procs, job_
         contnrs, taut_data, max_variants_per_compound, thoroughness
     )
 
-def parallel_make_taut(contnr, mol_index, max_variants_per_compound):
+@Parallelizer.thread_safe
+def parallel_make_taut(contnr, mol_index, max_variants_per_compound, taut_smis=None):
     """Makes alternate tautomers for a given molecule container. This is the
        function that gets fed into the parallelizer.
 
@@ -123,18 +135,74 @@ def parallel_make_taut(contnr, mol_index, max_variants_per_compound):
        only this number of variants (molecules) will be advanced to the next
        step.
     :type max_variants_per_compound: int
-    :return: A list of MyMol.MyMol objects, containing the alternate
-        tautomeric forms.
-    :rtype: list
+    :param taut_smis: The SMILES strings of the tautomers, if they were
+       already enumerated. Defaults to None, in which case they are taken
+       from this process's cache, or enumerated.
+    :type taut_smis: list, optional
+    :return: A tuple, (key, taut_smis, tauts). key is the key under which the
+        tautomers are cached, taut_smis are the SMILES strings of the
+        enumerated tautomers, and tauts is a list of MyMol.MyMol objects,
+        containing the alternate tautomeric forms. None if the tautomers
+        could not be generated.
+    :rtype: tuple
     """
 
     # Get the MyMol.MyMol within the molecule container corresponding to the
     # given molecule index.
     mol = contnr.mols[mol_index]
 
+    key = MolCache.tautomers_key(mol.smiles(), max_variants_per_compound)
+    if taut_smis is None:
+        taut_smis = MolCache.cached_tautomers(key)
+    if taut_smis is None:
+        taut_smis = enumerate_tauts(contnr, mol, max_variants_per_compound)
+        if taut_smis is None:
+            return None
+        MolCache.cache_tautomers(key, taut_smis)
+
+    # Make all those tautomers into MyMol objects.
+    tauts_mols = [MyMol.MyMol(smi) for smi in taut_smis]
+
+    # Keep only those that have reasonable substructures.
+    tauts_mols = [t for t in tauts_mols if t.remove_bizarre_substruc() == False]
+
+    # If there's more than one, let the user know that.
+    if len(tauts_mols) > 1:
+        Utils.log("\t" + mol.smiles(True) + " has tautomers.")
+
+    # Now collect the final results.
+    results = []
+
+    for tm in tauts_mols:
+        tm.inherit_contnr_props(contnr)
+        tm.genealogy = mol.genealogy[:]
+        tm.name = mol.name
+
+        if tm.smiles() != mol.smiles():
+            tm.genealogy.append(tm.smiles(True) + " (tautomer)")
+
+        results.append(tm)
+
+    return (key, taut_smis, results)
+
+def enumerate_tauts(contnr, mol, max_variants_per_compound):
+    """Enumerates the tautomers of a molecule, using MolVS.
+
+    :param contnr: The molecule container.
+    :type contnr: MolContainer.MolContainer
+    :param mol: The molecule.
+    :type mol: MyMol.MyMol
+    :param max_variants_per_compound: The maximum number of tautomers to
+       enumerate.
+    :type max_variants_per_compound: int
+    :return: A list of the SMILES strings of the tautomers, or None if they
+       could not be enumerated.
+    :rtype: list or None
+    """
+
     # Create a temporary RDKit mol object, since that's what MolVS works with.
-    # TODO: There should be a copy function
-    m = MyMol.MyMol(mol.smiles()).rdkit_mol
+    # This is a fresh copy, from the per-process cache.
+    m, can_smi = MolCache.sanitized_mol_from_smiles(mol.smiles())
 
     # For tautomers to work, you need to not have any explicit hydrogens.
     m = Chem.RemoveHs(m)
@@ -163,30 +231,18 @@ def parallel_make_taut(contnr, mol_index, max_variants_per_compound):
     )
     tauts_rdkit_mols = enum.enumerate(m)
 
-    # Make all those tautomers into MyMol objects.
-    tauts_mols = [MyMol.MyMol(m) for m in tauts_rdkit_mols]
-
-    # Keep only those that have reasonable substructures.
-    tauts_mols = [t for t in tauts_mols if t.remove_bizarre_substruc() == False]
-
-    # If there's more than one, let the user know that.
-    if len(tauts_mols) > 1:
-        Utils.log("\t" + mol.smiles(True) + " has tautomers.")
-
-    # Now collect the final results.
-    results = []
-
-    for tm in tauts_mols:
-        tm.inherit_contnr_props(contnr)
-        tm.genealogy = mol.genealogy[:]
-        tm.name = mol.name
+    # Keep the SMILES strings, which can be cached. Tautomers that can't be
+    # put in canonical form are discarded.
+    taut_smis = []
+    for t in tauts_rdkit_mols:
+        try:
+            taut_smis.append(
+                Chem.MolToSmiles(t, isomericSmiles=True, canonical=True)
+            )
+        except:
+            pass
 
-        if tm.smiles() != mol.smiles():
-            tm.genealogy.append(tm.smiles(True) + " (tautomer)")
-
-        results.append(tm)
-
-    return results
+    return taut_smis
 
 def tauts_no_break_arom_rngs(contnrs, taut_data, num_procs, job_manager, parallelizer_obj):
     """For a given molecule, the number of atomatic rings should never change
@@ -323,6 +379,7 @@ def tauts_no_change_hs_to_cs_unless_alpha_to_carbnyl(contnrs, taut_data, num_pro
 
     return results
 
+@Parallelizer.thread_safe
 def parallel_check_nonarom_rings(taut, contnr):
     """A parallelizable helper function that checks that tautomers do not
        break any nonaromatic rings present in the original object.
@@ -351,6 +408,7 @@ def parallel_check_nonarom_rings(taut, contnr):
             "), broke an aromatic ring, so I'm discarding it."
         )
 
+@Parallelizer.thread_safe
 def parallel_check_chiral_centers(taut, contnr):
     """A parallelizable helper function that checks that tautomers do not break
        any chiral centers in the original molecule.
@@ -384,6 +442,7 @@ def parallel_check_chiral_centers(taut, contnr):
             ", so I'm deleting it."
         )
 
+@Parallelizer.thread_safe
 def parallel_check_carbon_hydrogens(taut, contnr):
     """A parallelizable helper function that checks that tautomers do not
        change the hydrogens on inappropriate carbons.
@@ -47,7 +47,8 @@ def prepare_smiles(contnrs, params):
     let_tautomers_change_chirality = params["let_tautomers_change_chirality"]
     parallelizer_obj = params["Parallelizer"]
 
-    debug = True
+    # Print the smiles after each step only if debugging messages are shown.
+    debug = Utils.log_enabled(Utils.DEBUG)
 
     # Desalt the molecules.
     # Utils.log("Begin Desaltings")
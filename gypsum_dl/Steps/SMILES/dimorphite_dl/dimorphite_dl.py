@@ -18,10 +18,12 @@ strings.
 """
 
 from __future__ import print_function
-import copy
 import os
 import argparse
 import sys
+import gzip
+import time
+import multiprocessing
 
 try:
     # Python2
@@ -30,24 +32,22 @@ except ImportError:
     # Python3
     from io import StringIO
 
-# Always let the user know a help file is available.
-print("\nFor help, use: python dimorphite_dl.py --help")
-
-# And always report citation information.
-print("\nIf you use Dimorphite-DL in your research, please cite:")
-print("Ropp PJ, Kaminsky JC, Yablonski S, Durrant JD (2019) Dimorphite-DL: An")
-print("open-source program for enumerating the ionization states of drug-like small")
-print("molecules. J Cheminform 11:14. doi:10.1186/s13321-019-0336-9.\n")
-
 try:
     import rdkit
     from rdkit import Chem
     from rdkit.Chem import AllChem
+    from rdkit import RDLogger
 except:
     msg = "Dimorphite-DL requires RDKit. See https://www.rdkit.org/"
     print(msg)
     raise Exception(msg)
 
+# Many of the SMILES strings generated while protonating are invalid, and
+# RDKit complains about each one it fails to parse. Silence RDKit's messages
+# once for the whole process, rather than hiding them around every call to
+# Chem.MolFromSmiles() (see UtilFuncs.convert_smiles_str_to_mol()).
+RDLogger.DisableLog('rdApp.*')
+
 def main(params=None):
     """The main definition run when you call the script from the commandline.
 
@@ -78,18 +78,39 @@ def main(params=None):
         # Run tests.
         TestFuncs.test()
     else:
-        # Run protonation
+        # Run protonation, in parallel if more than one processor is
+        # requested.
+        start_time = time.time()
+        if args.get("num_processors", 1) == 1:
+            protonated_smis = Protonate(args)
+        else:
+            protonated_smis = ParallelProtonate(args)
+
+        num_output = 0
         if "output_file" in args and args["output_file"] is not None:
-            # An output file was specified, so write to that.
-            with open(args["output_file"], "w") as file:
-                for protonated_smi in Protonate(args):
+            # An output file was specified, so write to that (compressed if
+            # it ends in .gz).
+            with UtilFuncs.open_file(args["output_file"], "w") as file:
+                for protonated_smi in protonated_smis:
                     file.write(protonated_smi + "\n")
+                    num_output = num_output + 1
         elif "return_as_list" in args and args["return_as_list"] == True:
-            return list(Protonate(args))
+            return list(protonated_smis)
         else:
             # No output file specified. Just print it to the screen.
-            for protonated_smi in Protonate(args):
+            for protonated_smi in protonated_smis:
                 print(protonated_smi)
+                num_output = num_output + 1
+
+        # If being run from the command line, report the throughput.
+        if __name__ == "__main__":
+            run_time = time.time() - start_time
+            UtilFuncs.eprint(
+                "\nProtonated {} molecules ({} output lines) in {:.1f} seconds ({:.1f} molecules/second).".format(
+                    protonated_smis.num_inputs, num_output, run_time,
+                    protonated_smis.num_inputs / max(run_time, 1e-6)
+                )
+            )
 
 class MyParser(argparse.ArgumentParser):
     """Overwrite default parse so it displays help file on error. See
@@ -123,6 +144,7 @@ examples:
   python dimorphite_dl.py --smiles "CCC(=O)O" --min_ph -3.0 --max_ph -2.0
   python dimorphite_dl.py --smiles "CCCN" --min_ph -3.0 --max_ph -2.0 --output_file output.smi
   python dimorphite_dl.py --smiles_file sample_molecules.smi --pka_precision 2.0 --label_states
+  python dimorphite_dl.py --smiles_file library.smi.gz --output_file output.smi.gz --num_processors 0
   python dimorphite_dl.py --test""")
         print("")
 
@@ -150,9 +172,17 @@ class ArgParseFuncs:
         parser.add_argument('--smiles', metavar='SMI', type=str,
                             help='SMILES string to protonate')
         parser.add_argument('--smiles_file', metavar="FILE", type=str,
-                            help='file that contains SMILES strings to protonate')
+                            help='file that contains SMILES strings to protonate ' + \
+                                '(gzipped if it ends in .gz)')
         parser.add_argument('--output_file', metavar="FILE", type=str,
-                            help='output file to write protonated SMILES (optional)')
+                            help='output file to write protonated SMILES (optional, ' + \
+                                'gzipped if it ends in .gz)')
+        parser.add_argument('--num_processors', metavar="N", type=int, default=1,
+                            help='number of processors to use. 0 means all ' + \
+                                'available processors (default: 1)')
+        parser.add_argument('--chunk_size', metavar="C", type=int, default=100,
+                            help='number of input lines to send to a processor ' + \
+                                'at a time, if using more than one (default: 100)')
         parser.add_argument('--max_variants', metavar="MXV", type=int, default=128,
                             help='limit number of variants per input compound (default: 128)')
         parser.add_argument('--label_states', action="store_true",
@@ -177,7 +207,9 @@ class ArgParseFuncs:
                     'pka_precision' : 1.0,
                     'label_states' : False,
                     'test' : False,
-                    'max_variants': 128}
+                    'max_variants': 128,
+                    'num_processors': 1,
+                    'chunk_size': 100}
 
         for key in defaults:
             if key not in args:
@@ -203,6 +235,142 @@ class ArgParseFuncs:
 
         return args
 
+class Neutralizer(object):
+    """Neutralizes molecules to the extent possible. The substructures to look
+    for are compiled only once, when the object is created, and the changes
+    are made directly to the matching atoms, rather than by running RDKit
+    reactions (each of which copies the whole molecule)."""
+
+    def __init__(self):
+        """Compiles the substructures to neutralize. Each is paired with the
+        function that neutralizes a match (see the reaction SMARTS in the
+        comments)."""
+
+        smarts_and_funcs = [
+            # [Ov1-1:1]>>[Ov2+0:1]-[H]
+            # To handle O- bonded to only one atom (add hydrogen).
+            ['[Ov1-1]', self._neutralize_and_add_h],
+
+            # [#7v4+1:1]-[H]>>[#7v3+0:1]
+            # To handle N+ bonded to a hydrogen (remove hydrogen).
+            ['[#7v4+1]-[H]', self._neutralize_and_remove_h],
+
+            # [Ov2-:1]>>[Ov2+0:1]
+            # To handle O- bonded to two atoms. Should not be Negative.
+            ['[Ov2-]', self._neutralize],
+
+            # [#7v3+1:1]>>[#7v3+0:1]
+            # To handle N+ bonded to three atoms. Should not be positive.
+            ['[#7v3+1]', self._neutralize],
+
+            # [#7v2-1:1]>>[#7+0:1]-[H]
+            # To handle N- Bonded to two atoms. Add hydrogen.
+            ['[#7v2-1]', self._neutralize_and_add_h],
+
+            # [N:1]=[N+0:2]=[N:3]-[H]>>[N:1]=[N+1:2]=[N+0:3]-[H]
+            # To handle bad azide. Must be protonated. (Now handled elsewhere,
+            # before SMILES converted to Mol object.)
+
+            # [H]-[N:1]-[N:2]#[N:3]>>[N:1]=[N+1:2]=[N:3]-[H]
+            # To handle bad azide. R-N-N#N should be R-N=[N+]=N
+            ['[H]-[N]-[N]#[N]', self._fix_azide]
+        ]
+
+        self.substructs_and_funcs = [
+            (Chem.MolFromSmarts(smarts), func)
+            for smarts, func in smarts_and_funcs
+        ]
+
+    def neutralize(self, mol):
+        """Neutralizes a molecule. The molecule passed in is not changed.
+
+        :param rdkit.Chem.rdchem.Mol mol: The rdkit Mol objet to be neutralized.
+        :return: The neutralized Mol object (with explicit hydrogens).
+        """
+
+        # Add hydrogens (respects valence, so incomplete).
+        mol.UpdatePropertyCache(strict=False)
+        mol = Chem.RWMol(Chem.AddHs(mol))
+
+        while True:  # Keep going until all these issues have been resolved.
+            for substruct, func in self.substructs_and_funcs:
+                matches = mol.GetSubstructMatches(substruct)
+                if len(matches) > 0:
+                    break
+            else:
+                # Nothing left to neutralize.
+                break
+
+            # The RDKit reactions this replaces only kept the fragment with
+            # the first match (e.g., dropping counterions). Do the same, so
+            # the results don't change.
+            frags = Chem.GetMolFrags(mol)
+            if len(frags) > 1:
+                frag_idx = [
+                    i for i, frag in enumerate(frags) if matches[0][0] in frag
+                ][0]
+                mol = Chem.RWMol(
+                    Chem.GetMolFrags(mol, asMols=True, sanitizeFrags=False)[frag_idx]
+                )
+                continue
+
+            # Fix every match of the substructure. An atom (e.g., an N+ bonded
+            # to several hydrogens) is fixed only once.
+            atoms_done = set([])
+            atoms_to_remove = []
+            for match in matches:
+                if any(idx in atoms_done for idx in match):
+                    continue
+                atoms_done.update(match)
+                func(mol, match, atoms_to_remove)
+
+            # Remove atoms from the end, so the other indexes don't change.
+            for idx in sorted(atoms_to_remove, reverse=True):
+                mol.RemoveAtom(idx)
+
+            mol.UpdatePropertyCache(strict=False)  # Update valences
+
+        return mol.GetMol()
+
+    @staticmethod
+    def _neutralize(mol, match, atoms_to_remove):
+        """Removes the charge of the first atom of a match."""
+
+        mol.GetAtomWithIdx(match[0]).SetFormalCharge(0)
+
+    @staticmethod
+    def _neutralize_and_add_h(mol, match, atoms_to_remove):
+        """Removes the charge of the first atom of a match, and bonds it to a
+        new hydrogen atom."""
+
+        mol.GetAtomWithIdx(match[0]).SetFormalCharge(0)
+        h_idx = mol.AddAtom(Chem.Atom(1))
+        mol.AddBond(match[0], h_idx, Chem.BondType.SINGLE)
+
+    @staticmethod
+    def _neutralize_and_remove_h(mol, match, atoms_to_remove):
+        """Removes the charge of the first atom of a match, and the hydrogen
+        atom (the second atom of the match) bonded to it."""
+
+        mol.GetAtomWithIdx(match[0]).SetFormalCharge(0)
+        atoms_to_remove.append(match[1])
+
+    @staticmethod
+    def _fix_azide(mol, match, atoms_to_remove):
+        """Turns [H]-N-N#N into N=[N+]=N-[H] by moving the hydrogen to the
+        terminal nitrogen."""
+
+        h_idx, n1_idx, n2_idx, n3_idx = match
+        mol.RemoveBond(h_idx, n1_idx)
+        mol.AddBond(n3_idx, h_idx, Chem.BondType.SINGLE)
+        mol.GetBondBetweenAtoms(n1_idx, n2_idx).SetBondType(Chem.BondType.DOUBLE)
+        mol.GetBondBetweenAtoms(n2_idx, n3_idx).SetBondType(Chem.BondType.DOUBLE)
+        mol.GetAtomWithIdx(n2_idx).SetFormalCharge(1)
+
+# Compiled once per process and shared by all calls to
+# UtilFuncs.neutralize_mol().
+NEUTRALIZER = Neutralizer()
+
 class UtilFuncs:
     """A namespace to store functions for manipulating mol objects. To keep
     things organized."""
@@ -216,51 +384,7 @@ class UtilFuncs:
         :return: The neutralized Mol object.
         """
 
-        # Get the reaction data
-        rxn_data = [
-            ['[Ov1-1:1]', '[Ov2+0:1]-[H]'],  # To handle O- bonded to only one atom (add hydrogen).
-            ['[#7v4+1:1]-[H]', '[#7v3+0:1]'],  # To handle N+ bonded to a hydrogen (remove hydrogen).
-            ['[Ov2-:1]', '[Ov2+0:1]'],  # To handle O- bonded to two atoms. Should not be Negative.
-            ['[#7v3+1:1]', '[#7v3+0:1]'],  # To handle N+ bonded to three atoms. Should not be positive.
-            ['[#7v2-1:1]', '[#7+0:1]-[H]'],  # To handle N- Bonded to two atoms. Add hydrogen.
-            # ['[N:1]=[N+0:2]=[N:3]-[H]', '[N:1]=[N+1:2]=[N+0:3]-[H]'],  # To handle bad azide. Must be
-                                                                         # protonated. (Now handled
-                                                                         # elsewhere, before SMILES
-                                                                         # converted to Mol object.)
-            ['[H]-[N:1]-[N:2]#[N:3]', '[N:1]=[N+1:2]=[N:3]-[H]']  # To handle bad azide. R-N-N#N should
-                                                                  # be R-N=[N+]=N
-        ]
-
-        # Add substructures and reactions (initially none)
-        for i, rxn_datum in enumerate(rxn_data):
-            rxn_data[i].append(Chem.MolFromSmarts(rxn_datum[0]))
-            rxn_data[i].append(None)
-
-        # Add hydrogens (respects valence, so incomplete).
-        mol.UpdatePropertyCache(strict=False)
-        mol = Chem.AddHs(mol)
-
-        while True:  # Keep going until all these issues have been resolved.
-            current_rxn = None  # The reaction to perform.
-            current_rxn_str = None
-
-            for i, rxn_datum in enumerate(rxn_data):
-                reactant_smarts, product_smarts, substruct_match_mol, rxn_placeholder = rxn_datum
-                if mol.HasSubstructMatch(substruct_match_mol):
-                    if rxn_placeholder is None:
-                        current_rxn_str = reactant_smarts + '>>' + product_smarts
-                        current_rxn = AllChem.ReactionFromSmarts(current_rxn_str)
-                        rxn_data[i][3] = current_rxn  # Update the placeholder.
-                    else:
-                        current_rxn = rxn_data[i][3]
-                    break
-
-            # Perform the reaction if necessary
-            if current_rxn is None:  # No reaction left, so break out of while loop.
-                break
-            else:
-                mol = current_rxn.RunReactants((mol,))[0][0]
-                mol.UpdatePropertyCache(strict=False)  # Update valences
+        mol = NEUTRALIZER.neutralize(mol)
 
         # The mols have been altered from the reactions described above, we
         # need to resanitize them. Make sure aromatic rings are shown as such
@@ -293,22 +417,10 @@ class UtilFuncs:
         smiles_str = smiles_str.replace("N=N=N", "N=[N+]=N")
         smiles_str = smiles_str.replace("NN#N", "N=[N+]=N")
 
-        # Now convert to a mol object. Note the trick that is necessary to
-        # capture RDKit error/warning messages. See
-        # https://stackoverflow.com/questions/24277488/in-python-how-to-capture-the-stdout-from-a-c-shared-library-to-a-variable
-        stderr_fileno = sys.stderr.fileno()
-        stderr_save = os.dup(stderr_fileno)
-        stderr_pipe = os.pipe()
-        os.dup2(stderr_pipe[1], stderr_fileno)
-        os.close(stderr_pipe[1])
-
+        # Now convert to a mol object. RDKit's error/warning messages are
+        # disabled when this module is imported.
         mol = Chem.MolFromSmiles(smiles_str)
 
-        os.close(stderr_fileno)
-        os.close(stderr_pipe[0])
-        os.dup2(stderr_save, stderr_fileno)
-        os.close(stderr_save)
-
         # Check that there are None type errors Chem.MolFromSmiles has
         # sanitize on which means if there is even a small error in the SMILES
         # (kekulize, nitrogen charge...) then mol=None. ie.
@@ -317,6 +429,52 @@ class UtilFuncs:
         # cautious.
         return None if mol is None else mol
 
+    @staticmethod
+    def prepare_smiles_str(smiles_str):
+        """Converts a SMILES string to an RDKit Mol object, neutralizes it, and
+        regenerates the SMILES string (to standardize). This series of tests is
+        to make sure the SMILES string is properly formed and to get it into a
+        canonical form.
+
+        :param string smiles_str: The SMILES string.
+        :return: The canonical SMILES string of the neutralized molecule, or
+            None if it is poorly formed.
+        """
+
+        mol = UtilFuncs.convert_smiles_str_to_mol(smiles_str)
+        if mol is None:
+            return None
+
+        # Handle nuetralizing the molecules.
+        mol = UtilFuncs.neutralize_mol(mol)
+        if mol is None:
+            return None
+
+        # Remove the hydrogens.
+        try:
+            mol = Chem.RemoveHs(mol)
+        except:
+            return None
+
+        if mol is None:
+            return None
+
+        return Chem.MolToSmiles(mol, isomericSmiles=True)
+
+    @staticmethod
+    def open_file(filename, mode):
+        """Opens a text file, compressed with gzip if the filename ends in
+        .gz.
+
+        :param string filename: The filename.
+        :param string mode: "r" to read or "w" to write.
+        :return: The file object.
+        """
+
+        if filename.endswith(".gz"):
+            return gzip.open(filename, mode + "t")
+        return open(filename, mode)
+
     @staticmethod
     def eprint(*args, **kwargs):
         """Error messages should be printed to STDERR. See
@@ -337,7 +495,7 @@ class LoadSMIFile(object):
 
         if type(filename) is str:
             # It's a filename
-            self.f = open(filename, "r")
+            self.f = UtilFuncs.open_file(filename, "r")
         else:
             # It's a file object (i.e., StringIO)
             self.f = filename
@@ -386,34 +544,13 @@ class LoadSMIFile(object):
             # Generate mol object
             smiles_str = splits[0]
 
-            # Convert from SMILES string to RDKIT Mol. This series of tests is
-            # to make sure the SMILES string is properly formed and to get it
-            # into a canonical form. Filter if failed.
-            mol = UtilFuncs.convert_smiles_str_to_mol(smiles_str)
-            if mol is None:
-                UtilFuncs.eprint("WARNING: Skipping poorly formed SMILES string: " + line)
-                return self.next()
-
-            # Handle nuetralizing the molecules. Filter if failed.
-            mol = UtilFuncs.neutralize_mol(mol)
-            if mol is None:
-                UtilFuncs.eprint("WARNING: Skipping poorly formed SMILES string: " + line)
-                return self.next()
-
-            # Remove the hydrogens.
-            try:
-                mol = Chem.RemoveHs(mol)
-            except:
+            # Convert from SMILES string to RDKIT Mol, neutralize it, and
+            # regenerate the SMILES string (to standardize). Filter if failed.
+            new_mol_string = UtilFuncs.prepare_smiles_str(smiles_str)
+            if new_mol_string is None:
                 UtilFuncs.eprint("WARNING: Skipping poorly formed SMILES string: " + line)
                 return self.next()
 
-            if mol is None:
-                UtilFuncs.eprint("WARNING: Skipping poorly formed SMILES string: " + line)
-                return self.next()
-
-            # Regenerate the smiles string (to standardize).
-            new_mol_string = Chem.MolToSmiles(mol, isomericSmiles=True)
-
             return {
                 "smiles": new_mol_string,
                 "data": splits[1:]
@@ -425,11 +562,14 @@ class LoadSMIFile(object):
 class Protonate(object):
     """A generator class for protonating SMILES strings, one at a time."""
 
-    def __init__(self, args):
+    def __init__(self, args, protonator=None):
         """Initialize the generator.
 
         :param args: A dictionary containing the arguments.
         :type args: dict
+        :param protonator: The Protonator to use. If None (the default), one
+            is made from the arguments.
+        :type protonator: Protonator, optional
         """
 
         # Make the args an object variable variable.
@@ -442,10 +582,17 @@ class Protonate(object):
         # Clean and normalize the args
         self.args = ArgParseFuncs.clean_args(args)
 
-        # Load the substructures that can be protonated.
-        self.subs = ProtSubstructFuncs.load_protonation_substructs_calc_state_for_ph(
-            self.args["min_ph"], self.args["max_ph"], self.args["pka_precision"]
-        )
+        # The number of input molecules read so far.
+        self.num_inputs = 0
+
+        # Does the actual protonating (and loads the substructures that can be
+        # protonated).
+        if protonator is None:
+            protonator = Protonator(
+                self.args["min_ph"], self.args["max_ph"],
+                self.args["pka_precision"], self.args["max_variants"]
+            )
+        self.protonator = protonator
 
     def __iter__(self):
         """Returns this generator object.
@@ -492,6 +639,8 @@ class Protonate(object):
             # There are no more input smiles strings...
             raise StopIteration()
 
+        self.num_inputs = self.num_inputs + 1
+
         orig_smi = smile_and_datum["smiles"]
         data = smile_and_datum["data"]  # Everything on SMILES line but the
                                         # SMILES string itself (e.g., the
@@ -501,6 +650,252 @@ class Protonate(object):
         # name).
         tag = " ".join(data)
 
+        new_smis_and_mols, sites = self.protonator.protonate_prepared_smiles(orig_smi)
+        new_smis = [smi for smi, mol in new_smis_and_mols]
+
+        # If the user wants to see the target states, add those to the ends of
+        # each line.
+        if self.args["label_states"]:
+            states = '\t'.join([x[1] for x in sites])
+            new_lines = [x + "\t" + tag + "\t" + states for x in new_smis]
+        else:
+            new_lines = [x + "\t" + tag for x in new_smis]
+
+        self.cur_prot_SMI = new_lines
+
+        return self.next()
+
+# The arguments and Protonator used by this worker process, when protonating
+# in parallel (see ParallelProtonate).
+WORKER_ARGS = None
+WORKER_PROTONATOR = None
+
+class ParallelProtonate(object):
+    """A generator class for protonating SMILES strings on several processors.
+    The input lines are sent to the processors in chunks, and the protonated
+    SMILES strings are returned in the same order as the input lines."""
+
+    def __init__(self, args):
+        """Initialize the generator.
+
+        :param args: A dictionary containing the arguments.
+        :type args: dict
+        """
+
+        # Clean and normalize the args
+        self.args = ArgParseFuncs.clean_args(args)
+
+        # The number of input molecules protonated so far.
+        self.num_inputs = 0
+
+    def __iter__(self):
+        """Protonates the input lines, chunk by chunk.
+
+        :return: A generator of the protonated SMILES strings (with their
+                 data), in order.
+        :rtype: generator
+        """
+
+        num_procs = self.args["num_processors"]
+        if num_procs <= 0:
+            num_procs = multiprocessing.cpu_count()
+
+        worker_args = {}
+        for key in ["min_ph", "max_ph", "pka_precision", "max_variants", "label_states"]:
+            worker_args[key] = self.args[key]
+
+        # Only a few chunks per processor are read ahead, so the input file
+        # never has to fit in memory.
+        chunks = ParallelProtonate.read_chunks(
+            self.args["smiles_and_data"].f, self.args["chunk_size"]
+        )
+        max_pending = 2 * num_procs
+
+        pool = multiprocessing.Pool(
+            num_procs, ParallelProtonate.init_worker, (worker_args,)
+        )
+        try:
+            pending = []
+            for chunk in chunks:
+                pending.append(
+                    pool.apply_async(ParallelProtonate.protonate_chunk, (chunk,))
+                )
+                if len(pending) >= max_pending:
+                    for protonated_smi in self._collect(pending.pop(0)):
+                        yield protonated_smi
+
+            while len(pending) > 0:
+                for protonated_smi in self._collect(pending.pop(0)):
+                    yield protonated_smi
+        finally:
+            pool.terminate()
+
+    def _collect(self, result):
+        """Waits for the protonated SMILES strings of a chunk.
+
+        :param result: The result of the chunk, from the pool.
+        :type result: multiprocessing.pool.AsyncResult
+        :return: The protonated SMILES strings (with their data).
+        :rtype: list
+        """
+
+        protonated_smis, num_inputs = result.get()
+        self.num_inputs = self.num_inputs + num_inputs
+        return protonated_smis
+
+    @staticmethod
+    def read_chunks(file, chunk_size):
+        """Reads the lines of a file in chunks.
+
+        :param file: The file object.
+        :param int chunk_size: The number of lines per chunk.
+        :return: A generator of the chunks (strings of chunk_size lines).
+        :rtype: generator
+        """
+
+        lines = []
+        for line in file:
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                yield "".join(lines)
+                lines = []
+        if len(lines) > 0:
+            yield "".join(lines)
+        file.close()
+
+    @staticmethod
+    def init_worker(worker_args):
+        """Sets up a worker process. Its Protonator is made once, and used for
+        all the chunks it protonates.
+
+        :param worker_args: The protonation arguments.
+        :type worker_args: dict
+        """
+
+        global WORKER_ARGS, WORKER_PROTONATOR
+
+        WORKER_ARGS = worker_args
+        WORKER_PROTONATOR = Protonator(
+            worker_args["min_ph"], worker_args["max_ph"],
+            worker_args["pka_precision"], worker_args["max_variants"]
+        )
+
+    @staticmethod
+    def protonate_chunk(chunk):
+        """Protonates a chunk of input lines, in a worker process.
+
+        :param string chunk: The input lines.
+        :return: A tuple. The first item is the list of protonated SMILES
+            strings (with their data). The second is the number of input
+            molecules.
+        :rtype: tuple
+        """
+
+        args = dict(WORKER_ARGS)
+        args["smiles_file"] = StringIO(chunk)
+        protonate = Protonate(args, WORKER_PROTONATOR)
+        protonated_smis = list(protonate)
+
+        return protonated_smis, protonate.num_inputs
+
+class Protonator(object):
+    """Protonates RDKit Mol objects (or SMILES strings). The substructures
+    that can be protonated are loaded once, when the object is created, so it
+    is best to create one Protonator and use it for many molecules."""
+
+    def __init__(self, min_ph=6.4, max_ph=8.4, pka_precision=1.0,
+                 max_variants=128):
+        """Initialize the protonator.
+
+        :param float min_ph: The minimum pH to consider, defaults to 6.4.
+        :param float max_ph: The maximum pH to consider, defaults to 8.4.
+        :param float pka_precision: The pKa precision factor (number of
+            standard devations), defaults to 1.0.
+        :param int max_variants: The maximum number of variants per input
+            compound, defaults to 128.
+        """
+
+        self.max_variants = max_variants
+
+        # Load the substructures that can be protonated.
+        self.subs = ProtSubstructFuncs.load_protonation_substructs_calc_state_for_ph(
+            min_ph, max_ph, pka_precision
+        )
+
+    def protonate_many(self, mols):
+        """Protonates molecules, one at a time.
+
+        :param mols: The rdkit.Chem.rdchem.Mol objects to protonate. Any
+            iterable (e.g., a generator) will do.
+        :type mols: iterable
+        :return: A generator that yields, for each input molecule, a list of
+            its protonated rdkit.Chem.rdchem.Mol objects (see protonate()).
+        :rtype: generator
+        """
+
+        for mol in mols:
+            yield self.protonate(mol)
+
+    def protonate(self, mol):
+        """Protonates a molecule. The protonated molecules have the same
+        properties as the input one.
+
+        :param rdkit.Chem.rdchem.Mol mol: The molecule to protonate.
+        :return: A list of the protonated rdkit.Chem.rdchem.Mol objects. Empty
+            if the molecule is poorly formed.
+        :rtype: list
+        """
+
+        smiles_str = Chem.MolToSmiles(mol, isomericSmiles=True)
+        props = mol.GetPropsAsDict()
+
+        protonated_mols = self.protonate_smiles(smiles_str)
+        for m in protonated_mols:
+            for prop, val in props.items():
+                if type(val) is int:
+                    m.SetIntProp(prop, val)
+                elif type(val) is float:
+                    m.SetDoubleProp(prop, val)
+                elif type(val) is bool:
+                    m.SetBoolProp(prop, val)
+                else:
+                    m.SetProp(prop, str(val))
+
+        return protonated_mols
+
+    def protonate_smiles(self, smiles_str):
+        """Protonates a molecule given as a SMILES string.
+
+        :param string smiles_str: The SMILES string.
+        :return: A list of the protonated rdkit.Chem.rdchem.Mol objects. Empty
+            if the SMILES string is poorly formed.
+        :rtype: list
+        """
+
+        # The neutralized molecule is converted to a canonical SMILES string
+        # and back. This gives every molecule the same atom order (which
+        # determines the protonation sites found) and atoms free of any
+        # explicit hydrogen counts left over from the input.
+        orig_smi = UtilFuncs.prepare_smiles_str(smiles_str)
+        if orig_smi is None:
+            UtilFuncs.eprint("WARNING: Skipping poorly formed SMILES string: " + str(smiles_str))
+            return []
+
+        new_smis_and_mols, sites = self.protonate_prepared_smiles(orig_smi)
+        return [mol for smi, mol in new_smis_and_mols if mol is not None]
+
+    def protonate_prepared_smiles(self, orig_smi):
+        """Protonates a molecule given as a canonical SMILES string of the
+        neutralized molecule (see UtilFuncs.prepare_smiles_str()).
+
+        :param string orig_smi: The SMILES string.
+        :return: A tuple. The first item is a list of (SMILES string,
+            rdkit.Chem.rdchem.Mol) tuples for the protonated molecules. The
+            second is the list of protonation sites (see
+            ProtSubstructFuncs.get_prot_sites_and_target_states()).
+        :rtype: tuple
+        """
+
         # sites is a list of (atom index, "PROTONATED|DEPROTONATED|BOTH",
         # reaction name, mol). Note that the second entry indicates what state
         # the site SHOULD be in (not the one it IS in per the SMILES string).
@@ -508,21 +903,30 @@ class Protonate(object):
         # during training.
         sites, mol_used_to_idx_sites = ProtSubstructFuncs.get_prot_sites_and_target_states(orig_smi, self.subs)
 
-        new_mols = [mol_used_to_idx_sites]
         if (len(sites) > 0):
-            for site in sites:
-                # Make a new smiles with the correct protonation state. Note that
-                # new_smis is a growing list. This is how multiple protonation
-                # sites are handled.
-                new_mols = ProtSubstructFuncs.protonate_site(new_mols, site)
-                if len(new_mols) > self.args["max_variants"]:
-                    new_mols = new_mols[:self.args["max_variants"]]
-                    UtilFuncs.eprint("WARNING: Limited number of variants to " +
-                                     str(self.args["max_variants"]) + ": " +
-                                     orig_smi)
+            # Enumerate the protonation states as charge vectors over the
+            # sites. Only the first max_variants are made into molecules.
+            # Remove hydrogen atoms first. The heavy atoms keep their indexes.
+            try:
+                mol_used_to_idx_sites = Chem.RemoveHs(mol_used_to_idx_sites)
+            except:
+                UtilFuncs.eprint("WARNING: Skipping poorly formed SMILES string: " + orig_smi)
+                mol_used_to_idx_sites = None
+
+            new_mols = []
+            if mol_used_to_idx_sites is not None:
+                site_charges = ProtSubstructFuncs.get_site_charges(
+                    mol_used_to_idx_sites, sites
+                )
+                charge_vectors = ProtSubstructFuncs.get_charge_vectors(
+                    site_charges, self.max_variants, orig_smi
+                )
+                new_mols = ProtSubstructFuncs.make_protonated_mols(
+                    mol_used_to_idx_sites, sites, charge_vectors
+                )
         else:
-            # Deprotonate the mols (because protonate_site never called to do
-            # it).
+            # Deprotonate the mols (because make_protonated_mols never called
+            # to do it).
             mol_used_to_idx_sites = Chem.RemoveHs(mol_used_to_idx_sites)
             new_mols = [mol_used_to_idx_sites]
 
@@ -530,32 +934,27 @@ class Protonate(object):
         # Phosphonates, when the pH is between the two pKa values and the
         # stdev value is big enough, for example, will generate two identical
         # BOTH states. Let's remove this redundancy.
-        new_smis = list(set([
+        # Sorted, so the order doesn't vary from run to run.
+        new_smis = sorted(set([
             Chem.MolToSmiles(m, isomericSmiles=True, canonical=True) for m in new_mols
         ]))
 
         # Sometimes Dimorphite-DL generates molecules that aren't actually
         # possible. Simply convert these to mol objects to eliminate the bad
-        # ones (that are None).
-        new_smis = [s for s in new_smis if UtilFuncs.convert_smiles_str_to_mol(s) is not None]
+        # ones (that are None). The mol objects are kept, so they don't need
+        # to be made again.
+        new_smis_and_mols = [
+            (smi, UtilFuncs.convert_smiles_str_to_mol(smi)) for smi in new_smis
+        ]
+        new_smis_and_mols = [(smi, mol) for smi, mol in new_smis_and_mols if mol is not None]
 
         # If there are no smi left, return the input one at the very least.
         # All generated forms have apparently been judged
         # inappropriate/malformed.
-        if len(new_smis) == 0:
-            new_smis = [orig_smi]
-
-        # If the user wants to see the target states, add those to the ends of
-        # each line.
-        if self.args["label_states"]:
-            states = '\t'.join([x[1] for x in sites])
-            new_lines = [x + "\t" + tag + "\t" + states for x in new_smis]
-        else:
-            new_lines = [x + "\t" + tag for x in new_smis]
+        if len(new_smis_and_mols) == 0:
+            new_smis_and_mols = [(orig_smi, UtilFuncs.convert_smiles_str_to_mol(orig_smi))]
 
-        self.cur_prot_SMI = new_lines
-
-        return self.next()
+        return new_smis_and_mols, sites
 
 class ProtSubstructFuncs:
     """A namespace to store functions for loading the substructures that can
@@ -694,93 +1093,148 @@ class ProtSubstructFuncs:
         return protonation_sites, mol_used_to_idx_sites
 
     @staticmethod
-    def protonate_site(mols, site):
-        """Given a list of molecule objects, we protonate the site.
-
-        :param list mols:  The list of molecule objects.
-        :param tuple site: Information about the protonation site.
-                           (idx, target_prot_state, prot_site_name)
-        :return: A list of the appropriately protonated molecule objects.
+    def get_site_charges(mol, sites):
+        """Gets the charges each protonation site can take (-1 for
+        deprotonated, 0 for protonated). Charges that make the molecule
+        impossible (i.e., that fail sanitization) are left out, so they never
+        take up any of the variants.
+
+        :param rdkit.Chem.rdchem.Mol mol: The molecule, without hydrogen atoms.
+        :param list sites: The protonation sites. Each is a tuple (idx,
+            target_prot_state, prot_site_name).
+        :return: A list with the list of charges of each site.
         """
 
-        # Decouple the atom index and its target protonation state from the
-        # site tuple
-        idx, target_prot_state, prot_site_name = site
-
         state_to_charge = {"DEPROTONATED": [-1],
                            "PROTONATED": [0],
                            "BOTH": [-1, 0]}
 
-        charges = state_to_charge[target_prot_state]
+        site_charges = []
+        for site in sites:
+            charges = []
+            for charge in state_to_charge[site[1]]:
+                mol_copy = Chem.Mol(mol)
+                ProtSubstructFuncs.set_site_charge(mol_copy, site, charge)
+                try:
+                    Chem.SanitizeMol(mol_copy)
+                except:
+                    continue
+                charges.append(charge)
+            site_charges.append(charges)
+
+        return site_charges
 
-        # Now make the actual smiles match the target protonation state.
-        output_mols = ProtSubstructFuncs.set_protonation_charge(
-            mols, idx, charges, prot_site_name
-        )
+    @staticmethod
+    def get_charge_vectors(site_charges, max_variants=128, smi=""):
+        """Enumerates the protonation states of a molecule as charge vectors,
+        with one charge per protonation site.
+
+        The vectors are built site by site. Sites that can take two charges
+        double the number of vectors, so after each site only the first
+        max_variants are kept.
+
+        :param list site_charges: The list of charges of each site (see
+            get_site_charges()).
+        :param int max_variants: The maximum number of vectors, defaults to
+            128.
+        :param string smi: The SMILES string of the molecule, for warnings.
+        :return: A list of the unique charge vectors (tuples).
+        """
 
-        return output_mols
+        charge_vectors = [()]
+        for charges in site_charges:
+            charge_vectors = [
+                vector + (charge,) for charge in charges for vector in charge_vectors
+            ]
+            if len(charge_vectors) > max_variants:
+                charge_vectors = charge_vectors[:max_variants]
+                UtilFuncs.eprint("WARNING: Limited number of variants to " +
+                                 str(max_variants) + ": " + smi)
+
+        # Remove duplicates, keeping the order.
+        unique_vectors = []
+        seen = set([])
+        for vector in charge_vectors:
+            if vector not in seen:
+                seen.add(vector)
+                unique_vectors.append(vector)
+
+        return unique_vectors
 
     @staticmethod
-    def set_protonation_charge(mols, idx, charges, prot_site_name):
-        """Sets the atomic charge on a particular site for a set of SMILES.
-
-        :param list mols:                  A list of the input molecule
-                                           objects.
-        :param int idx:                    The index of the atom to consider.
-        :param list charges:               A list of the charges (ints) to
-                                           assign at this site.
-        :param string prot_site_name:      The name of the protonation site.
-        :return: A list of the processed (protonated/deprotonated) molecule
-                 objects.
+    def make_protonated_mols(mol, sites, charge_vectors):
+        """Makes a protonated molecule for each charge vector. Each is a single
+        copy of the molecule, with the charges of the protonation sites set.
+
+        :param rdkit.Chem.rdchem.Mol mol: The molecule, without hydrogen atoms.
+        :param list sites: The protonation sites. Each is a tuple (idx,
+            target_prot_state, prot_site_name).
+        :param list charge_vectors: The charge vectors (see
+            get_charge_vectors()).
+        :return: A list of the protonated molecule objects.
         """
 
-        # Sets up the output list and the Nitrogen charge
         output = []
+        for charge_vector in charge_vectors:
+            mol_copy = Chem.Mol(mol)
+            for site, charge in zip(sites, charge_vector):
+                ProtSubstructFuncs.set_site_charge(mol_copy, site, charge)
+            mol_copy.UpdatePropertyCache()
+            output.append(mol_copy)
 
-        for charge in charges:
-            # The charge for Nitrogens is 1 higher than others (i.e.,
-            # protonated state is positively charged).
-            nitro_charge = charge + 1
-
-            # But there are a few nitrogen moieties where the acidic group is
-            # the neutral one. Amides are a good example. I gave some thought
-            # re. how to best flag these. I decided that those
-            # nitrogen-containing moieties where the acidic group is neutral
-            # (rather than positively charged) will have "*" in the name.
-            if "*" in prot_site_name:
-                nitro_charge = nitro_charge - 1  # Undo what was done previously.
+        return output
 
-            for mol in mols:
-                # Make a copy of the molecule.
-                mol_copy = copy.deepcopy(mol)
+    @staticmethod
+    def set_site_charge(mol, site, charge):
+        """Sets the charge of the atom at a protonation site.
+
+        :param rdkit.Chem.rdchem.Mol mol: The molecule, without hydrogen atoms.
+            It is changed in place.
+        :param tuple site: The protonation site (idx, target_prot_state,
+            prot_site_name).
+        :param int charge: The charge of the protonation state (-1 for
+            deprotonated, 0 for protonated).
+        """
 
-                # Remove hydrogen atoms.
-                try:
-                    mol_copy = Chem.RemoveHs(mol_copy)
-                except:
-                    UtilFuncs.eprint("WARNING: Skipping poorly formed SMILES string: " + Chem.MolToSmiles(mol_copy))
-                    continue
+        idx, target_prot_state, prot_site_name = site
+        atom = mol.GetAtomWithIdx(idx)
+        atom.SetFormalCharge(
+            ProtSubstructFuncs.get_atom_charge(atom, charge, prot_site_name)
+        )
 
-                atom = mol_copy.GetAtomWithIdx(idx)
+        # Deprotonating protonated aromatic nitrogen gives [nH-]. Change this
+        # to [n-].
+        if atom.GetAtomicNum() == 7 and atom.GetIsAromatic() and \
+                atom.GetFormalCharge() == -1 and atom.GetNumExplicitHs() > 0:
+            atom.SetNumExplicitHs(0)
 
-                # Assign the protonation charge, with special care for
-                # nitrogens
-                element = atom.GetAtomicNum()
-                if element == 7:
-                    atom.SetFormalCharge(nitro_charge)
-                else:
-                    atom.SetFormalCharge(charge)
+    @staticmethod
+    def get_atom_charge(atom, charge, prot_site_name):
+        """Gets the charge to assign to the atom at a protonation site.
+
+        :param rdkit.Chem.rdchem.Atom atom: The atom.
+        :param int charge: The charge of the protonation state (-1 for
+            deprotonated, 0 for protonated).
+        :param string prot_site_name: The name of the protonation site.
+        :return: The charge (int).
+        """
 
-                # Deprotonating protonated aromatic nitrogen gives [nH-]. Change this
-                # to [n-].
-                if "[nH-]" in Chem.MolToSmiles(mol_copy):
-                    atom.SetNumExplicitHs(0)
+        if atom.GetAtomicNum() != 7:
+            return charge
 
-                mol_copy.UpdatePropertyCache()
+        # The charge for Nitrogens is 1 higher than others (i.e., protonated
+        # state is positively charged).
+        nitro_charge = charge + 1
 
-                output.append(mol_copy)
+        # But there are a few nitrogen moieties where the acidic group is the
+        # neutral one. Amides are a good example. I gave some thought re. how
+        # to best flag these. I decided that those nitrogen-containing
+        # moieties where the acidic group is neutral (rather than positively
+        # charged) will have "*" in the name.
+        if "*" in prot_site_name:
+            nitro_charge = nitro_charge - 1  # Undo what was done previously.
 
-        return output
+        return nitro_charge
 
 class ProtectUnprotectFuncs:
     """A namespace for storing functions that are useful for protecting and
@@ -1076,7 +1530,9 @@ def run_with_mol_list(mol_lst, **kwargs):
     from another Python script rather than the command line. Note that this
     function is for passing Dimorphite-DL a list of RDKit Mol objects, together
     with command-line parameters. If you want to use only the same parameters
-    that you would use from the command line, import run() instead.
+    that you would use from the command line, import run() instead. To
+    protonate many molecules, or molecules as they become available, use a
+    Protonator object instead.
 
     :param mol_lst: A list of rdkit.Chem.rdchem.Mol objects.
     :type mol_lst: list
@@ -1096,41 +1552,30 @@ def run_with_mol_list(mol_lst, **kwargs):
             UtilFuncs.eprint(msg)
             raise Exception(msg)
 
-    # Set the return_as_list flag so main() will return the protonated smiles
-    # as a list.
-    kwargs["return_as_list"] = True
-
-    # Having reviewed the code, it will be very difficult to rewrite it so
-    # that a list of Mol objects can be used directly. Intead, convert this
-    # list of mols to smiles and pass that. Not efficient, but it will work.
-    protonated_smiles_and_props = []
-    for m in mol_lst:
-        props = m.GetPropsAsDict()
-        kwargs["smiles"] = Chem.MolToSmiles(m, isomericSmiles=True)
-        protonated_smiles_and_props.extend(
-            [(s.split("\t")[0], props) for s in main(kwargs)]
-        )
+    # Any parameters not specified take the same defaults as on the command
+    # line.
+    protonator_params = {}
+    for key in ["min_ph", "max_ph", "pka_precision", "max_variants"]:
+        if kwargs.get(key) is not None:
+            protonator_params[key] = kwargs[key]
+    protonator = Protonator(**protonator_params)
 
-    # Now convert the list of protonated smiles strings back to RDKit Mol
-    # objects. Also, add back in the properties from the original mol objects.
     mols = []
-    for s, props in protonated_smiles_and_props:
-        m = Chem.MolFromSmiles(s)
-        if m:
-            for prop, val in props.items():
-                if type(val) is int:
-                    m.SetIntProp(prop, val)
-                elif type(val) is float:
-                    m.SetDoubleProp(prop, val)
-                elif type(val) is bool:
-                    m.SetBoolProp(prop, val)
-                else:
-                    m.SetProp(prop, str(val))
-            mols.append(m)
-        else:
-            UtilFuncs.eprint("WARNING: Could not process molecule with SMILES string " + s + " and properties " + str(props))
+    for protonated_mols in protonator.protonate_many(mol_lst):
+        mols.extend(protonated_mols)
 
     return mols
 
 if __name__ == "__main__":
+    # Always let the user know a help file is available. (Only when run as a
+    # script, so that importing this module, e.g., in each worker process,
+    # prints nothing.)
+    print("\nFor help, use: python dimorphite_dl.py --help")
+
+    # And always report citation information.
+    print("\nIf you use Dimorphite-DL in your research, please cite:")
+    print("Ropp PJ, Kaminsky JC, Yablonski S, Durrant JD (2019) Dimorphite-DL: An")
+    print("open-source program for enumerating the ionization states of drug-like small")
+    print("molecules. J Cheminform 11:14. doi:10.1186/s13321-019-0336-9.\n")
+
     main()
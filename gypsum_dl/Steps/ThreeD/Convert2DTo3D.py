@@ -81,6 +81,7 @@ def convert_2d_to_3d(contnrs, max_variants_per_compound, thoroughness, num_procs
         contnrs, clear, max_variants_per_compound, thoroughness, False
     )
 
+@Parallelizer.thread_safe
 def parallel_make_3d(mol):
     """Does the 2D to 3D conversion. Meant to run within parallelizer.
 
@@ -20,31 +20,17 @@ conformations.
 
 import __future__
 
-import copy
-import warnings
-
 import gypsum_dl.Parallelizer as Parallelizer
 import gypsum_dl.Utils as Utils
 import gypsum_dl.ChemUtils as ChemUtils
 from gypsum_dl.MyMol import MyConformer
 
-try:
-    from rdkit import Chem
-    from rdkit.Chem import AllChem
-except:
-    Utils.exception("You need to install rdkit and its dependencies.")
-
 try:
     import numpy
 except:
     Utils.exception("You need to install numpy and its dependencies.")
 
-try:
-    from scipy.cluster.vq import kmeans2
-except:
-    Utils.exception("You need to install scipy and its dependencies.")
-
-def generate_alternate_3d_nonaromatic_ring_confs(contnrs, max_variants_per_compound, thoroughness, num_procs, second_embed, job_manager, parallelizer_obj):
+def generate_alternate_3d_nonaromatic_ring_confs(contnrs, max_variants_per_compound, thoroughness, num_procs, second_embed, job_manager, parallelizer_obj, minimization_threads=1):
     """Docking programs like Vina rotate chemical moieties around their
        rotatable bonds, so it's not necessary to generate a larger rotomer
        library for each molecule. The one exception to this rule is
@@ -77,6 +63,10 @@ def generate_alternate_3d_nonaromatic_ring_confs(contnrs, max_variants_per_compo
     :type job_manager: string
     :param parallelizer_obj: The Parallelizer object.
     :type parallelizer_obj: Parallelizer.Parallelizer
+    :param minimization_threads: The number of threads each process uses to
+       minimize the conformers of a molecule. 0 means one per CPU core.
+       Defaults to 1.
+    :type minimization_threads: int, optional
     :return: Returns None if no ring conformers are generated
     :rtype: None
     """
@@ -95,7 +85,7 @@ def generate_alternate_3d_nonaromatic_ring_confs(contnrs, max_variants_per_compo
         if contnr.num_nonaro_rngs > 0:
             ones_with_nonaro_rngs.add(contnr_idx)
             for mol in contnr.mols:
-                params.append(tuple([mol, max_variants_per_compound, thoroughness, second_embed]))
+                params.append(tuple([mol, max_variants_per_compound, thoroughness, second_embed, minimization_threads]))
     params = tuple(params)
 
     # If there are no compounds with non-aromatic rings, no need to continue.
@@ -108,10 +98,12 @@ def generate_alternate_3d_nonaromatic_ring_confs(contnrs, max_variants_per_compo
         tmp = parallelizer_obj.run(params, parallel_get_ring_confs, num_procs, job_manager)
     else:
         for i in params:
-            tmp.append(parallel_get_ring_confs(i[0],i[1],i[2],i[3]))
+            tmp.append(parallel_get_ring_confs(i[0],i[1],i[2],i[3],i[4]))
 
-    # Flatten the results.
-    results = Parallelizer.flatten_list(tmp)
+    # Flatten the results. None values are molecules for which alternate
+    # conformations couldn't be generated (e.g., because they exceeded their
+    # time limit). Those keep their current conformations.
+    results = Parallelizer.flatten_list(Parallelizer.strip_none(tmp))
 
     # Group by mol. You can't use existing functions because they would
     # require you to recalculate already calculated energies.
@@ -154,7 +146,8 @@ def generate_alternate_3d_nonaromatic_ring_confs(contnrs, max_variants_per_compo
                     "of nonaromatic ring)"
                 )
 
-def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second_embed):
+@Parallelizer.thread_safe
+def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second_embed, minimization_threads=1):
     """Gets alternate ring conformations. Meant to run with the parallelizer class.
 
     :param mol: The molecule to process (with non-aromatic ring(s)).
@@ -176,6 +169,9 @@ def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second
         run time, but sometimes converts certain molecules that would
         otherwise fail.
     :type second_embed: bool
+    :param minimization_threads: The number of threads to use when
+       minimizing. 0 means one per CPU core. Defaults to 1.
+    :type minimization_threads: int, optional
     :return: A list of MyMol.MyMol objects, with alternate ring conformations.
     :rtype: list
     """
@@ -190,33 +186,11 @@ def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second
     # Get the ring atom indecies
     rings = mol.get_idxs_of_nonaro_rng_atms()
 
-    # Convert that into the bond indecies.
-    rings_by_bond_indexes = []  # A list of lists, where each inner list has
-                                # the indexes of the bonds that comprise a
-                                # ring.
-    for ring_atom_indecies in rings:
-        bond_indexes = []
-        for ring_atm_idx in ring_atom_indecies:
-            a = mol.rdkit_mol.GetAtomWithIdx(ring_atm_idx)
-            bonds = a.GetBonds()
-            for bond in bonds:
-                atom_indecies = [
-                    bond.GetBeginAtomIdx(), bond.GetEndAtomIdx()
-                ]
-                atom_indecies.remove(ring_atm_idx)
-                other_atm_idx = atom_indecies[0]
-                if other_atm_idx in ring_atom_indecies:
-                    bond_indexes.append(bond.GetIdx())
-        bond_indexes = list(set(bond_indexes))
-        bond_indexes.sort()
-
-        rings_by_bond_indexes.append(bond_indexes)
-
     # Generate a bunch of conformations, ordered from best energy to worst.
     # Note that this is cached. Minimizing too.
     mol.add_conformers(
         thoroughness * max_variants_per_compound,
-        0.1, True
+        0.1, True, minimization_threads
     )
 
     if len(mol.conformers) > 0:
@@ -225,25 +199,17 @@ def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second
         # [H]c1nc(N2C(=O)[C@@]3(C([H])([H])[H])[C@@]4([H])O[C@@]([H])(C([H])([H])C4([H])[H])[C@]3(C([H])([H])[H])C2=O)sc1[H]
         # So don't save this one anyway.
 
-        # Get the scores (lowest energy) of these minimized conformers.
-        mol.load_conformers_into_rdkit_mol()
+        # Get the coordinates of all the conformers, as a single array.
+        coords = numpy.array(
+            [c.conformer().GetPositions() for c in mol.conformers]
+        )
 
-        # Extract just the rings.
-        ring_mols = [Chem.PathToSubmol(mol.rdkit_mol, bi)
-                        for bi in rings_by_bond_indexes]
-
-        # Align get the rmsds relative to the first conformation, for each
-        # ring separately.
-        list_of_rmslists = [[]] * len(ring_mols)
-        for k in range(len(ring_mols)):
-            list_of_rmslists[k] = []
-            AllChem.AlignMolConformers(
-                ring_mols[k], RMSlist=list_of_rmslists[k]
-            )
-
-        # Get points for each conformer (rmsd_ring1, rmsd_ring2, rmsd_ring3)
-        pts = numpy.array(list_of_rmslists).T
-        pts = numpy.vstack((numpy.array([[0.0] * pts.shape[1]]), pts))
+        # Get points for each conformer (rmsd_ring1, rmsd_ring2, rmsd_ring3).
+        # Each is the rmsd of a ring relative to its conformation in the first
+        # (lowest energy) conformer.
+        pts = numpy.array(
+            [ring_rmsds_to_first_conf(coords, ring) for ring in rings]
+        ).T
 
         # Cluster those points, get lowest-energy member of each.
         if len(pts) < max_variants_per_compound:
@@ -251,12 +217,7 @@ def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second
         else:
             num_clusters = max_variants_per_compound
 
-        # When kmeans2 runs on insufficient clusters, it can sometimes throw
-        # an error about empty clusters. This is not necessary to throw for
-        # the user and so we have supressed it here.
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            groups = kmeans2(pts, num_clusters, minit='points')[1]
+        groups = cluster_ring_confs(pts, num_clusters)
 
         # Note that you have some geometrically diverse conformations here,
         # but there could be other versions (enantiomers, tautomers, etc.)
@@ -264,20 +225,19 @@ def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second
         # selecting from all these together, so similar ones could end up
         # together.
 
-        best_ones = {}  # Key is group id from kmeans (int). Values are the
+        best_ones = {}  # Key is group id (int). Values are the
                         # MyMol.MyConformers objects.
-        conformers = mol.rdkit_mol.GetConformers()
+        best_confs = []  # In order of energy.
         for k, grp in enumerate(groups):
-            if not grp in list(best_ones.keys()):
+            if not grp in best_ones:
                 best_ones[grp] = mol.conformers[k]
-        best_confs = best_ones.values()  # best_confs has the
-                                         # MyMol.MyConformers objects.
+                best_confs.append(mol.conformers[k])
 
         # Convert rdkit mols to MyMol.MyMol and save those MyMol.MyMol objects
         # for returning.
         results = []
         for conf in best_confs:
-            new_mol = copy.deepcopy(mol)
+            new_mol = mol.copy_without_conformers()
             c = MyConformer(new_mol, conf.conformer(), second_embed)
             new_mol.conformers = [c]
             energy = c.energy
@@ -295,3 +255,73 @@ def parallel_get_ring_confs(mol, max_variants_per_compound, thoroughness, second
 
     # If you get here, something went wrong.
     return None
+
+def ring_rmsds_to_first_conf(coords, ring):
+    """Calculates the rmsd between the atoms of a ring in each conformer and
+    those in the first conformer, after optimal superposition (Kabsch
+    algorithm). All conformers are handled at once.
+
+    :param coords: The coordinates of all the atoms of all the conformers, as
+       an array of shape (conformers, atoms, 3).
+    :type coords: numpy.array
+    :param ring: The indexes of the ring atoms.
+    :type ring: list
+    :return: The rmsds, one per conformer (the first is 0.0).
+    :rtype: numpy.array
+    """
+
+    # Center each conformer's ring on the origin.
+    pts = coords[:, ring, :]
+    pts = pts - pts.mean(axis=1)[:, numpy.newaxis, :]
+    ref = pts[0]
+
+    # The covariance matrix of each conformer with the first one. The sum of
+    # its singular values (with the last one negated if the best rotation
+    # would be a reflection) gives the rmsd after the best rotation.
+    covar = numpy.einsum("nai,aj->nij", pts, ref)
+    sing_vals = numpy.linalg.svd(covar, compute_uv=False)
+    sing_vals[:, 2] = sing_vals[:, 2] * numpy.where(
+        numpy.linalg.det(covar) < 0, -1.0, 1.0
+    )
+
+    sq_sums = (pts ** 2).sum(axis=(1, 2)) + (ref ** 2).sum()
+    msd = (sq_sums - 2.0 * sing_vals.sum(axis=1)) / len(ring)
+    rmsds = numpy.sqrt(numpy.maximum(msd, 0.0))
+    rmsds[0] = 0.0
+
+    return rmsds
+
+def cluster_ring_confs(pts, num_clusters):
+    """Deterministically groups conformers with similar ring conformations.
+    The first point (the lowest-energy conformer) is the first cluster
+    center. Each subsequent center is the point farthest from all the
+    centers chosen so far, until there are num_clusters centers (or no
+    points differ from the centers). Each point then joins its nearest
+    center.
+
+    :param pts: The points (one row per conformer, one column per ring), in
+       order of increasing energy.
+    :type pts: numpy.array
+    :param num_clusters: The maximum number of clusters.
+    :type num_clusters: int
+    :return: The cluster index of each point.
+    :rtype: numpy.array
+    """
+
+    # Distance of each point to its nearest center so far.
+    centers = [0]
+    min_dists = numpy.sqrt(((pts - pts[0]) ** 2).sum(axis=1))
+    while len(centers) < num_clusters:
+        farthest = int(numpy.argmax(min_dists))  # Lowest index if tied.
+        if min_dists[farthest] == 0.0:
+            # The remaining points are all identical to centers.
+            break
+        centers.append(farthest)
+        dists = numpy.sqrt(((pts - pts[farthest]) ** 2).sum(axis=1))
+        min_dists = numpy.minimum(min_dists, dists)
+
+    # Assign each point to the nearest center.
+    dists_to_centers = numpy.sqrt(
+        ((pts[:, numpy.newaxis, :] - pts[centers][numpy.newaxis, :, :]) ** 2).sum(axis=2)
+    )
+    return numpy.argmin(dists_to_centers, axis=1)
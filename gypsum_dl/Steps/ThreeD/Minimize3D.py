@@ -19,13 +19,13 @@ geometry.
 
 import __future__
 
-import copy
-
 import gypsum_dl.Utils as Utils
 import gypsum_dl.ChemUtils as ChemUtils
+import gypsum_dl.Parallelizer as Parallelizer
 from gypsum_dl.MyMol import MyConformer
+from gypsum_dl.MyMol import minimize_conformers
 
-def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, second_embed, job_manager, parallelizer_obj):
+def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, second_embed, job_manager, parallelizer_obj, minimization_threads=1):
     """This function minimizes a 3D molecular conformation. In an attempt to
        not get trapped in a local minimum, it actually generates a number of
        conformers, minimizes the best ones, and then saves the best of the
@@ -56,6 +56,10 @@ def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, sec
     :type job_manager: string
     :param parallelizer_obj: The Parallelizer object.
     :type parallelizer_obj: Parallelizer.Parallelizer
+    :param minimization_threads: The number of threads each process uses to
+       minimize the conformers of a molecule. 0 means one per CPU core.
+       Defaults to 1.
+    :type minimization_threads: int, optional
     """
 
     # Let the user know you're on this step.
@@ -70,7 +74,7 @@ def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, sec
             # so they can be skipped here.
             for mol in contnr.mols:
                 ones_without_nonaro_rngs.add(mol.contnr_idx)
-                params.append(tuple([mol, max_variants_per_compound, thoroughness, second_embed]))
+                params.append(tuple([mol, max_variants_per_compound, thoroughness, second_embed, minimization_threads]))
     params = tuple(params)
 
     # Run the inputs through the parallelizer.
@@ -79,7 +83,7 @@ def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, sec
         tmp = parallelizer_obj.run(params, parallel_minit, num_procs, job_manager)
     else:
         for i in params:
-            tmp.append(parallel_minit(i[0],i[1],i[2],i[3]))
+            tmp.append(parallel_minit(i[0],i[1],i[2],i[3],i[4]))
 
 
     # Save energy into MyMol object, and get a list of just those objects.
@@ -89,7 +93,7 @@ def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, sec
                                      # optimized structures.
     results = []  # Will contain MyMol.MyMol objects, with the saved energies
                   # inside.
-    for mol in tmp:
+    for mol in Parallelizer.strip_none(tmp):
         mol.mol_props["Energy"] = mol.conformers[0].energy
         results.append(mol)
         contnr_list_not_empty.add(mol.contnr_idx)
@@ -104,6 +108,13 @@ def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, sec
     for mol in results:
         contnrs[mol.contnr_idx].add_mol(mol)
 
+    # Molecules that could not be minimized (e.g., because they exceeded
+    # their time limit) are None. If none of the variants of a container
+    # could be minimized, its unminimized variants are kept instead.
+    for i in ones_without_nonaro_rngs - contnr_list_not_empty:
+        for mol in contnrs[i].mols:
+            mol.genealogy.append("(WARNING: Could not optimize 3D geometry)")
+
     # Alert the user to any errors.
     for contnr in contnrs:
         for mol in contnr.mols:
@@ -113,7 +124,8 @@ def minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, sec
                 )
                 mol.conformers = []
 
-def parallel_minit(mol, max_variants_per_compound, thoroughness, second_embed):
+@Parallelizer.thread_safe
+def parallel_minit(mol, max_variants_per_compound, thoroughness, second_embed, minimization_threads=1):
     """Minimizes the geometries of a MyMol.MyMol object. Meant to be run
     within parallelizer.
 
@@ -136,6 +148,9 @@ def parallel_minit(mol, max_variants_per_compound, thoroughness, second_embed):
         run time, but sometimes converts certain molecules that would
         otherwise fail.
     :type second_embed: bool
+    :param minimization_threads: The number of threads to use when
+       minimizing. 0 means one per CPU core. Defaults to 1.
+    :type minimization_threads: int, optional
     :return: A molecule with the minimized conformers inside it.
     :rtype: MyMol.MyMol
     """
@@ -153,16 +168,17 @@ def parallel_minit(mol, max_variants_per_compound, thoroughness, second_embed):
         # O=C([C@@]1([C@@H]2O[C@@H]([C@@]1(C3=O)C)CC2)C)N3c4sccn4
 
         # Further minimize the unoptimized conformers that were among the best
-        # scoring.
+        # scoring. All at once, so RDKit can use several threads.
         max_vars_per_cmpd = max_variants_per_compound
-        for i in range(len(mol.conformers[:max_vars_per_cmpd])):
-            mol.conformers[i].minimize()
+        minimize_conformers(
+            mol.conformers[:max_vars_per_cmpd], minimization_threads
+        )
 
         # Remove similar conformers
         # mol.eliminate_structurally_similar_conformers()
 
         # Get the best scoring (lowest energy) of these minimized conformers
-        new_mol = copy.deepcopy(mol)
+        new_mol = mol.copy_without_conformers()
         c = MyConformer(new_mol, mol.conformers[0].conformer(), second_embed)
         new_mol.conformers = [c]
         best_energy = c.energy
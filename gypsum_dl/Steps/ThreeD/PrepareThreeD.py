@@ -39,6 +39,7 @@ def prepare_3d(contnrs, params):
     num_procs = params["num_processors"]
     job_manager = params["job_manager"]
     parallelizer_obj = params["Parallelizer"]
+    minimization_threads = params["minimization_threads"]
 
     # Do the 2d to 3d conversionl, if requested.
     if not params["2d_output_only"]:
@@ -50,9 +51,10 @@ def prepare_3d(contnrs, params):
         if not params["skip_alternate_ring_conformations"]:
             generate_alternate_3d_nonaromatic_ring_confs(
                 contnrs, max_variants_per_compound, thoroughness, num_procs,
-                second_embed, job_manager, parallelizer_obj
+                second_embed, job_manager, parallelizer_obj,
+                minimization_threads
             )
 
         # Minimize the molecules, if requested.
         if not params["skip_optimize_geometry"]:
-            minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, second_embed, job_manager, parallelizer_obj)
+            minimize_3d(contnrs, max_variants_per_compound, thoroughness, num_procs, second_embed, job_manager, parallelizer_obj, minimization_threads)
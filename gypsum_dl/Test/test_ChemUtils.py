@@ -0,0 +1,122 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the ChemUtils module.
+"""
+
+import math
+import unittest
+from unittest import mock
+
+import numpy
+
+from gypsum_dl import ChemUtils
+from gypsum_dl import MyMol
+from gypsum_dl import Utils
+
+SMILES = ["CCO", "CCN", "CCC", "CCCl", "CCF", "CCBr", "CC=O", "CC#N"]
+
+
+class TestKeepLowestEnergyMols(unittest.TestCase):
+    def test_keep_lowest(self):
+        mols = ["a", "b", "c", "d", "e"]
+        energies = numpy.array([3.0, float("nan"), 1.0, 2.0, 1.0])
+
+        # Ties are kept in their original order.
+        self.assertEqual(
+            ChemUtils.keep_lowest_enrgy_mols(mols, energies, 3), ["c", "e", "d"]
+        )
+
+        # Molecules that could not be scored are never kept.
+        self.assertEqual(
+            ChemUtils.keep_lowest_enrgy_mols(mols, energies, 10),
+            ["c", "e", "d", "a"]
+        )
+
+    def test_all_nan(self):
+        energies = numpy.array([float("nan"), float("nan")])
+        self.assertEqual(ChemUtils.keep_lowest_enrgy_mols(["a", "b"], energies, 1), [])
+
+
+class TestPickCandidatesToScore(unittest.TestCase):
+    def setUp(self):
+        self.old_seed = Utils.SEED
+        Utils.set_seed(1)
+
+    def tearDown(self):
+        Utils.set_seed(self.old_seed)
+
+    def test_few_mols(self):
+        mols = [MyMol.MyMol(smi) for smi in ["CCO", "CCN", "OCC"]]
+        candidates, must_score = ChemUtils.pick_candidates_to_score(mols, 3, 2)
+
+        # Duplicates are removed, and the rest needn't be scored.
+        self.assertFalse(must_score)
+        self.assertEqual([m.smiles() for m in candidates], ["CCN", "CCO"])
+
+    def test_many_mols(self):
+        mols = [MyMol.MyMol(smi) for smi in SMILES]
+        candidates, must_score = ChemUtils.pick_candidates_to_score(mols, 2, 2)
+        self.assertTrue(must_score)
+        self.assertEqual(len(candidates), 4)
+
+        # The choice doesn't depend on the order of the input.
+        reordered, must_score = ChemUtils.pick_candidates_to_score(
+            [MyMol.MyMol(smi) for smi in reversed(SMILES)], 2, 2
+        )
+        self.assertEqual(
+            [m.smiles() for m in reordered], [m.smiles() for m in candidates]
+        )
+
+
+class TestScoreMols(unittest.TestCase):
+    def setUp(self):
+        self.old_seed = Utils.SEED
+        Utils.set_seed(1)
+
+    def tearDown(self):
+        Utils.set_seed(self.old_seed)
+
+    def test_same_as_one_at_a_time(self):
+        smiles = ["CCO", "CCCN", "c1ccccc1O"]
+        mols = [MyMol.MyMol(smi) for smi in smiles]
+        energies = MyMol.score_mols(mols + [mols[0]], num_threads=2)
+
+        self.assertEqual(len(energies), 4)
+        self.assertEqual(energies[3], energies[0])
+        for mol, smi, energy in zip(mols, smiles, energies):
+            # The conformers made while scoring are kept.
+            self.assertEqual(mol.conformers[0].energy, energy)
+
+            expected = MyMol.MyMol(smi)
+            expected.make_first_3d_conf_no_min()
+            self.assertAlmostEqual(energy, expected.conformers[0].energy)
+
+    def test_failed_embedding_is_nan(self):
+        mols = [MyMol.MyMol("CCO"), MyMol.MyMol("CCN")]
+        with mock.patch.object(
+            mols[1], "make_first_3d_conf_no_min", side_effect=Exception
+        ):
+            energies = MyMol.score_mols(mols)
+
+        self.assertFalse(math.isnan(energies[0]))
+        self.assertTrue(math.isnan(energies[1]))
+        self.assertEqual(
+            ChemUtils.keep_lowest_enrgy_mols(mols, energies, 2), [mols[0]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
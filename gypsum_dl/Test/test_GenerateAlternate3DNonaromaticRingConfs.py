@@ -0,0 +1,97 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the GenerateAlternate3DNonaromaticRingConfs step.
+"""
+
+import unittest
+
+import numpy
+from rdkit import Chem
+from rdkit.Chem import AllChem
+from rdkit.Chem import rdMolAlign
+
+from gypsum_dl.Steps.ThreeD.GenerateAlternate3DNonaromaticRingConfs import \
+    cluster_ring_confs, ring_rmsds_to_first_conf
+
+
+class TestRingRmsds(unittest.TestCase):
+    def test_matches_rdkit(self):
+        mol = Chem.AddHs(Chem.MolFromSmiles("OC1CCC(N)CC1CF"))
+        conf_ids = list(AllChem.EmbedMultipleConfs(mol, 8, randomSeed=42))
+        ring = list(mol.GetRingInfo().AtomRings()[0])
+        coords = numpy.array(
+            [mol.GetConformer(i).GetPositions() for i in conf_ids]
+        )
+
+        rmsds = ring_rmsds_to_first_conf(coords, ring)
+
+        self.assertEqual(rmsds[0], 0.0)
+        atom_map = [(a, a) for a in ring]
+        for i, conf_id in enumerate(conf_ids[1:], 1):
+            expected = rdMolAlign.AlignMol(
+                Chem.Mol(mol), mol, prbCid=conf_id, refCid=conf_ids[0],
+                atomMap=atom_map
+            )
+            self.assertAlmostEqual(rmsds[i], expected, places=5)
+
+    def test_rigid_motion_and_reflection(self):
+        ring = [0, 1, 2, 3, 4, 5]
+        rng = numpy.random.RandomState(0)
+        first = rng.rand(6, 3)
+
+        # A rotated and translated copy has the same shape.
+        angle = 0.7
+        rot = numpy.array([
+            [numpy.cos(angle), -numpy.sin(angle), 0.0],
+            [numpy.sin(angle), numpy.cos(angle), 0.0],
+            [0.0, 0.0, 1.0]
+        ])
+        moved = first.dot(rot.T) + 5.0
+
+        # A mirror image can't be superimposed by a rotation.
+        mirrored = first * numpy.array([1.0, 1.0, -1.0])
+
+        rmsds = ring_rmsds_to_first_conf(
+            numpy.array([first, moved, mirrored]), ring
+        )
+        self.assertAlmostEqual(rmsds[1], 0.0, places=6)
+        self.assertGreater(rmsds[2], 0.01)
+
+
+class TestClusterRingConfs(unittest.TestCase):
+    def test_farthest_point_clusters(self):
+        pts = numpy.array([[0.0], [0.1], [5.0], [5.2], [2.4], [0.05]])
+        clusters = cluster_ring_confs(pts, 3)
+
+        # Centers are point 0, then the farthest (point 3), then the point
+        # farthest from both (point 4).
+        self.assertEqual(list(clusters), [0, 0, 1, 1, 2, 0])
+
+    def test_identical_points(self):
+        pts = numpy.zeros((4, 2))
+        self.assertEqual(list(cluster_ring_confs(pts, 3)), [0, 0, 0, 0])
+
+    def test_deterministic(self):
+        rng = numpy.random.RandomState(1)
+        pts = rng.rand(30, 2)
+        self.assertEqual(
+            list(cluster_ring_confs(pts, 5)), list(cluster_ring_confs(pts, 5))
+        )
+        self.assertEqual(len(set(cluster_ring_confs(pts, 5))), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
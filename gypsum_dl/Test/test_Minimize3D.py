@@ -0,0 +1,63 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the Minimize3D step.
+"""
+
+import unittest
+from unittest import mock
+
+from gypsum_dl.MolContainer import MolContainer
+import gypsum_dl.Steps.ThreeD.Minimize3D as Minimize3D
+
+
+class TestMinimize3D(unittest.TestCase):
+    def make_contnr(self, idx):
+        contnr = MolContainer("CCO", "mol" + str(idx), idx, {})
+        contnr.add_smiles("CCO")
+        contnr.add_smiles("CCN")
+        for mol in contnr.mols:
+            mol.contnr_idx = idx
+        return contnr
+
+    def test_unminimized_variants_are_kept_with_warning(self):
+        contnrs = [self.make_contnr(0)]
+        with mock.patch.object(Minimize3D, "parallel_minit", return_value=None):
+            Minimize3D.minimize_3d(contnrs, 2, 1, 1, False, "serial", None)
+
+        self.assertEqual(len(contnrs[0].mols), 2)
+        for mol in contnrs[0].mols:
+            self.assertEqual(
+                mol.genealogy[-1], "(WARNING: Could not optimize 3D geometry)"
+            )
+
+    def test_failed_variant_dropped_when_others_minimized(self):
+        contnrs = [self.make_contnr(0)]
+        real_minit = Minimize3D.parallel_minit
+
+        def minit(mol, *args):
+            if mol.smiles() == "CCN":
+                return None
+            return real_minit(mol, *args)
+
+        with mock.patch.object(Minimize3D, "parallel_minit", side_effect=minit):
+            Minimize3D.minimize_3d(contnrs, 2, 1, 1, False, "serial", None)
+
+        self.assertEqual([m.smiles() for m in contnrs[0].mols], ["CCO"])
+        self.assertIn("Energy", contnrs[0].mols[0].mol_props)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the MolCache module.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy
+from rdkit import Chem
+
+from gypsum_dl import MolCache
+from gypsum_dl import MyMol
+from gypsum_dl.MolContainer import MolContainer
+from gypsum_dl.Steps.SMILES import MakeTautomers
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_and_put(self):
+        cache = MolCache.LRUCache(2)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("b", MolCache.MISSING), MolCache.MISSING)
+
+        cache.put("b", None)
+        self.assertIsNone(cache.get("b", MolCache.MISSING))
+
+    def test_eviction(self):
+        cache = MolCache.LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")  # So "b" is now the least recently used.
+        cache.put("c", 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+        cache.put("a", 4)  # Replacing an entry doesn't evict anything.
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 4)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_threads(self):
+        cache = MolCache.LRUCache(50)
+        errors = []
+
+        def work(offset):
+            try:
+                for i in range(2000):
+                    key = (offset + i) % 200
+                    cache.put(key, key)
+                    value = cache.get((key + 1) % 200, MolCache.MISSING)
+                    if value is not MolCache.MISSING and value != (key + 1) % 200:
+                        errors.append(value)
+                    cache.items()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=work, args=(i * 7,)) for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache), 50)
+
+
+class TestSanitizedMols(unittest.TestCase):
+    def test_returns_copies(self):
+        m1, can_smi = MolCache.sanitized_mol_from_smiles("OC(C)=O")
+        self.assertEqual(can_smi, "CC(=O)O")
+
+        m1.GetAtomWithIdx(0).SetAtomicNum(7)
+        m2, can_smi2 = MolCache.sanitized_mol_from_smiles("OC(C)=O")
+        self.assertIsNot(m1, m2)
+        self.assertEqual(Chem.MolToSmiles(m2), "CC(=O)O")
+        self.assertEqual(can_smi2, "CC(=O)O")
+
+    def test_bad_smiles(self):
+        self.assertEqual(
+            MolCache.sanitized_mol_from_smiles("C1CC"), (None, None)
+        )
+
+
+class TestConformerFromPositions(unittest.TestCase):
+    def test_positions(self):
+        positions = [[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]]
+        conformer = MolCache.conformer_from_positions(positions)
+        self.assertEqual(conformer.GetNumAtoms(), 2)
+        self.assertTrue(conformer.Is3D())
+        self.assertTrue(numpy.array_equal(conformer.GetPositions(), positions))
+
+
+class TestTautomerCache(unittest.TestCase):
+    def setUp(self):
+        MolCache.TAUTOMERS.clear()
+        self.addCleanup(MolCache.TAUTOMERS.clear)
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.filename = os.path.join(self.tmp_dir, "tautomers.json")
+
+    def make_tauts(self, smiles):
+        contnr = MolContainer(smiles, "mol", 0, {})
+        contnr.add_mol(MyMol.MyMol(smiles))
+        key, taut_smis, tauts = MakeTautomers.parallel_make_taut(contnr, 0, 5)
+        return key, [taut.smiles() for taut in tauts]
+
+    def test_save_and_load(self):
+        MolCache.cache_tautomers(MolCache.tautomers_key("CCO", 5), ["CCO"])
+        MolCache.cache_tautomers(
+            MolCache.tautomers_key("Oc1ccccn1", 5), ["Oc1ccccn1", "O=c1cccc[nH]1"]
+        )
+        MolCache.cache_tautomers(MolCache.tautomers_key("CCO", 2), ["CCO"])
+        entries = MolCache.TAUTOMERS.items()
+
+        MolCache.save_tautomers(self.filename)
+        self.assertEqual(os.listdir(self.tmp_dir), ["tautomers.json"])
+
+        MolCache.TAUTOMERS.clear()
+        MolCache.load_tautomers(self.filename)
+
+        # Including the order, so the least recently used are evicted first.
+        self.assertEqual(MolCache.TAUTOMERS.items(), entries)
+
+    def test_missing_or_bad_file(self):
+        MolCache.cache_tautomers(MolCache.tautomers_key("CCO", 5), ["CCO"])
+        entries = MolCache.TAUTOMERS.items()
+
+        MolCache.load_tautomers(self.filename)
+        self.assertEqual(MolCache.TAUTOMERS.items(), entries)
+
+        with open(self.filename, "w") as f:
+            f.write("[[")
+        MolCache.load_tautomers(self.filename)
+        self.assertEqual(MolCache.TAUTOMERS.items(), entries)
+
+    def test_loaded_tautomers_are_used(self):
+        key, tauts = self.make_tauts("Oc1ccccn1")
+        self.assertEqual(sorted(tauts), ["O=c1cccc[nH]1", "Oc1ccccn1"])
+        self.assertEqual(key, MolCache.tautomers_key("Oc1ccccn1", 5))
+
+        MolCache.save_tautomers(self.filename)
+        MolCache.TAUTOMERS.clear()
+        MolCache.load_tautomers(self.filename)
+
+        # The tautomers now come from the cache, without MolVS.
+        with mock.patch.object(
+            MakeTautomers, "enumerate_tauts", side_effect=AssertionError
+        ):
+            self.assertEqual(self.make_tauts("Oc1ccccn1"), (key, tauts))
+
+
+if __name__ == "__main__":
+    unittest.main()
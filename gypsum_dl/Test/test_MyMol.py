@@ -0,0 +1,70 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the MyMol module.
+"""
+
+import unittest
+
+from rdkit import Chem
+from rdkit.Chem import rdMolAlign
+
+from gypsum_dl import MyMol
+
+
+class TestMyMol(unittest.TestCase):
+    def test_smiles(self):
+        mol = MyMol.MyMol("OC(C)=O")
+        self.assertEqual(mol.smiles(), "CC(=O)O")
+
+    def test_smiles_after_rdkit_mol_changes(self):
+        mol = MyMol.MyMol("C[NH3+]")
+        mol.rdkit_mol = Chem.AddHs(mol.rdkit_mol)
+        self.assertEqual(
+            mol.smiles(), Chem.MolToSmiles(mol.rdkit_mol, isomericSmiles=True)
+        )
+        self.assertIn("[H]", mol.smiles())
+
+
+class TestMyConformer(unittest.TestCase):
+    def setUp(self):
+        # No symmetry, so GetBestRMS has only one atom mapping to consider.
+        self.mol = MyMol.MyMol(Chem.AddHs(Chem.MolFromSmiles("NCCC(O)CCF")))
+        self.mol.add_conformers(4, 0.1, minimize=False)
+
+    def test_conformers_share_one_mol(self):
+        confs = self.mol.conformers
+        self.assertGreater(len(confs), 1)
+        for conf in confs:
+            self.assertIs(conf.mol, self.mol.conformer_host())
+
+    def test_rmsd_to_me_matches_rdkit(self):
+        confs = self.mol.conformers
+        self.assertGreater(len(confs), 1)
+        ref = confs[0]
+        for other in confs[1:]:
+            ref.align_to_me(other)
+            rmsd = ref.rmsd_to_me(other)
+
+            ref_mol = Chem.RemoveHs(Chem.Mol(ref.mol, confId=ref.conf_id))
+            other_mol = Chem.RemoveHs(Chem.Mol(other.mol, confId=other.conf_id))
+            expected = rdMolAlign.GetBestRMS(other_mol, ref_mol)
+
+            self.assertGreater(rmsd, 0.0)
+            self.assertAlmostEqual(rmsd, expected, places=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
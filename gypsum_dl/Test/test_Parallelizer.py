@@ -0,0 +1,159 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the Parallelizer module.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from gypsum_dl.Parallelizer import ProcessPool
+
+REPO_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+
+
+class TestProcessPool(unittest.TestCase):
+    # The jobs are builtins, so the workers can always unpickle them.
+
+    def test_results(self):
+        pool = ProcessPool(2)
+        try:
+            for i in range(5):
+                pool.submit(i, abs, (-i,))
+            results = sorted(pool.get() for i in range(5))
+        finally:
+            pool.close()
+
+        self.assertEqual(results, [(i, i, None) for i in range(5)])
+
+    def test_timeout(self):
+        pool = ProcessPool(1, timeout=0.5)
+        try:
+            pool.submit("slow", time.sleep, (30,))
+            pool.submit("fast", abs, (-1,))
+
+            start = time.time()
+            seq, result, reason = pool.get()
+            self.assertLess(time.time() - start, 15)
+            self.assertEqual(seq, "slow")
+            self.assertIsNone(result)
+            self.assertIn("time limit", reason)
+
+            # The pool keeps going with a fresh worker.
+            self.assertEqual(pool.get(), ("fast", 1, None))
+        finally:
+            pool.close()
+
+    def test_memory_limit(self):
+        pool = ProcessPool(1, memory_limit=50)
+        try:
+            pool.submit("big", bytearray, (4 * 1024 ** 3,))
+            pool.submit("small", abs, (-1,))
+
+            seq, result, reason = pool.get()
+            self.assertEqual(seq, "big")
+            self.assertIsNone(result)
+            self.assertIn("memory limit", reason)
+
+            self.assertEqual(pool.get(), ("small", 1, None))
+        finally:
+            pool.close()
+
+    def test_max_tasks_per_worker(self):
+        pool = ProcessPool(1, max_tasks_per_worker=2)
+        try:
+            for i in range(4):
+                pool.submit(i, os.getpid, ())
+            pids = [pool.get()[1] for i in range(4)]
+        finally:
+            pool.close()
+
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_get_without_jobs(self):
+        for timeout in [None, 1.0]:
+            pool = ProcessPool(1, timeout=timeout)
+            try:
+                self.assertRaises(Exception, pool.get)
+            finally:
+                pool.close()
+
+
+
+class TestStartMethods(unittest.TestCase):
+    # Each test runs in a fresh interpreter, because the start method is
+    # chosen once per process.
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_script(self, code):
+        script = os.path.join(self.tmp_dir, "script.py")
+        with open(script, "w") as f:
+            f.write(code)
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = REPO_DIR
+        return subprocess.run(
+            [sys.executable, script], cwd=self.tmp_dir, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True, timeout=300
+        )
+
+    def test_script_without_main_guard(self):
+        # Library callers needn't guard their scripts, unless they opt into
+        # the fork server.
+        result = self.run_script(
+            "from gypsum_dl.Parallelizer import ProcessPool\n"
+            "pool = ProcessPool(2)\n"
+            "pool.submit(0, abs, (-3,))\n"
+            "print('RESULT', pool.get())\n"
+            "pool.close()\n"
+        )
+        self.assertEqual(result.returncode, 0, result.stdout)
+        self.assertIn("RESULT (0, 3, None)", result.stdout)
+
+    def test_forkserver(self):
+        result = self.run_script(
+            "import os\n"
+            "from gypsum_dl import Parallelizer\n"
+            "if __name__ == '__main__':\n"
+            "    os.environ['PYTHONPATH'] = 'unchanged'\n"
+            "    Parallelizer.use_forkserver()\n"
+            "    context = Parallelizer.get_context()\n"
+            "    pool = Parallelizer.ProcessPool(1)\n"
+            "    pool.submit(0, abs, (-3,))\n"
+            "    print('RESULT', context.get_start_method(), pool.get(),\n"
+            "          os.environ['PYTHONPATH'])\n"
+            "    pool.close()\n"
+        )
+        self.assertEqual(result.returncode, 0, result.stdout)
+        self.assertIn("RESULT forkserver (0, 3, None) unchanged", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
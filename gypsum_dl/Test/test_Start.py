@@ -0,0 +1,85 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of complete Gypsum-DL runs.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+    "run_gypsum_dl.py"
+)
+
+# Molecules with several ionization states, tautomers, unspecified chiral
+# centers and a nonaromatic ring, so several random choices are made.
+SMILES = [
+    "CCC=O tautomer_and_cis_trans",
+    "ClC(C[C@@](Cl)(C)F)(F)C(C(C)C)=O two_chiral_and_tautomer",
+    "NC1CCC(CC(=O)O)CC1 ring_and_ionization",
+]
+
+
+class TestSeededRuns(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, "input.smi")
+        with open(self.source, "w") as f:
+            f.write("\n".join(SMILES) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_gypsum(self, job_manager, num_processors):
+        """Runs Gypsum-DL in a separate process, so each run starts with
+        empty caches, and returns the molecules it saved."""
+
+        output_folder = os.path.join(self.tmp_dir, job_manager)
+        os.mkdir(output_folder)
+        subprocess.check_call(
+            [
+                sys.executable, SCRIPT, "--source", self.source,
+                "--output_folder", output_folder, "--seed", "7",
+                "--job_manager", job_manager,
+                "--num_processors", str(num_processors),
+                "--max_variants_per_compound", "3", "--thoroughness", "2",
+                "--log_level", "ERROR"
+            ],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+        with open(os.path.join(output_folder, "gypsum_dl_success.sdf")) as f:
+            records = f.read().split("$$$$\n")
+
+        # The first record lists the parameters, which differ between runs.
+        return records[1:]
+
+    def test_serial_and_multiprocessing_match(self):
+        serial = self.run_gypsum("serial", 1)
+        self.assertGreater(len(serial), len(SMILES))
+        self.assertEqual(self.run_gypsum("multiprocessing", 2), serial)
+
+    def test_serial_and_threads_match(self):
+        serial = self.run_gypsum("serial", 1)
+        self.assertEqual(self.run_gypsum("threads", 3), serial)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the Utils module.
+"""
+
+import unittest
+
+from gypsum_dl import Utils
+
+
+class TestSeeds(unittest.TestCase):
+    def setUp(self):
+        self.old_seed = Utils.SEED
+
+    def tearDown(self):
+        Utils.set_seed(self.old_seed)
+
+    def test_no_seed(self):
+        Utils.set_seed(None)
+        self.assertIsNone(Utils.seed_for("CCO"))
+
+    def test_seed_for(self):
+        Utils.set_seed(1)
+        seed = Utils.seed_for("CCO", 2)
+        self.assertEqual(seed, Utils.seed_for("CCO", 2))
+        self.assertTrue(0 <= seed < 2 ** 31)
+
+        # Different keys, or a different seed, give different seeds.
+        self.assertNotEqual(seed, Utils.seed_for("CCO", 3))
+        self.assertNotEqual(seed, Utils.seed_for("CCN", 2))
+        Utils.set_seed(2)
+        self.assertNotEqual(seed, Utils.seed_for("CCO", 2))
+
+    def test_seed_for_is_stable(self):
+        # The seeds must not depend on the process (e.g., on hash()), or the
+        # workers would make different choices.
+        Utils.set_seed(1)
+        self.assertEqual(Utils.seed_for("CCO"), 760231574)
+
+    def test_random_sample(self):
+        Utils.set_seed(1)
+        lst = list(range(20))
+        sample = Utils.random_sample(lst, 5, "", "CCO")
+        self.assertEqual(len(sample), 5)
+        self.assertEqual(sample, Utils.random_sample(lst, 5, "", "CCO"))
+        self.assertEqual(sorted(Utils.random_sample(lst, 30, "", "CCO")), lst)
+
+
+if __name__ == "__main__":
+    unittest.main()
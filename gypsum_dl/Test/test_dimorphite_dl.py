@@ -0,0 +1,307 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the dimorphite_dl module.
+"""
+
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+from gypsum_dl.Steps.SMILES.dimorphite_dl import dimorphite_dl
+
+NEUTRALIZE_SMILES = [
+    "CC(=O)[O-]", "CC[O-]", "[O-]c1ccccc1", "C[O-].[Na+]", "C[NH3+]",
+    "C[NH2+]C", "[NH4+]", "c1cc[nH+]cc1", "[NH3+]CC([O-])=O",
+    "O=C([O-])C[NH+](C)C", "C[N+](C)(C)C", "C[N+](=O)[O-]", "C[N-]C",
+    "C[N-]S(=O)(=O)C", "C[NH][N+]#N", "C[S-]", "CC(=[NH2+])N",
+    "C[C@H]([NH3+])C(=O)[O-]", "CC(C)Cc1ccc(cc1)C(C)C(=O)[O-]",
+    "CC(=O)[O-].C[NH3+]", "CCO.[Na+]",
+]
+
+
+def reaction_neutralize_mol(mol):
+    """Neutralizes a molecule with RDKit reactions, as
+    UtilFuncs.neutralize_mol() did before Neutralizer."""
+
+    rxn_data = [
+        ['[Ov1-1:1]', '[Ov2+0:1]-[H]'],
+        ['[#7v4+1:1]-[H]', '[#7v3+0:1]'],
+        ['[Ov2-:1]', '[Ov2+0:1]'],
+        ['[#7v3+1:1]', '[#7v3+0:1]'],
+        ['[#7v2-1:1]', '[#7+0:1]-[H]'],
+        ['[H]-[N:1]-[N:2]#[N:3]', '[N:1]=[N+1:2]=[N:3]-[H]']
+    ]
+
+    mol.UpdatePropertyCache(strict=False)
+    mol = Chem.AddHs(mol)
+
+    while True:
+        for reactant_smarts, product_smarts in rxn_data:
+            if mol.HasSubstructMatch(Chem.MolFromSmarts(reactant_smarts)):
+                rxn = AllChem.ReactionFromSmarts(
+                    reactant_smarts + '>>' + product_smarts
+                )
+                break
+        else:
+            break
+
+        mol = rxn.RunReactants((mol,))[0][0]
+        mol.UpdatePropertyCache(strict=False)
+
+    sanitize_string = Chem.SanitizeMol(mol, catchErrors=True)
+    return mol if sanitize_string.name == "SANITIZE_NONE" else None
+
+
+def copy_per_site_protonate_smiles(protonator, smiles_str):
+    """Protonates a molecule by copying every variant at each site, as
+    Protonator.protonate_smiles() did before charge vectors."""
+
+    state_to_charge = {"DEPROTONATED": [-1],
+                       "PROTONATED": [0],
+                       "BOTH": [-1, 0]}
+
+    orig_smi = dimorphite_dl.UtilFuncs.prepare_smiles_str(smiles_str)
+    sites, mol = dimorphite_dl.ProtSubstructFuncs.get_prot_sites_and_target_states(
+        orig_smi, protonator.subs
+    )
+
+    new_mols = [mol]
+    for idx, target_prot_state, prot_site_name in sites:
+        output = []
+        for charge in state_to_charge[target_prot_state]:
+            nitro_charge = charge + 1
+            if "*" in prot_site_name:
+                nitro_charge = nitro_charge - 1
+
+            for m in new_mols:
+                mol_copy = copy.deepcopy(m)
+                try:
+                    mol_copy = Chem.RemoveHs(mol_copy)
+                except:
+                    continue
+
+                atom = mol_copy.GetAtomWithIdx(idx)
+                if atom.GetAtomicNum() == 7:
+                    atom.SetFormalCharge(nitro_charge)
+                else:
+                    atom.SetFormalCharge(charge)
+
+                if "[nH-]" in Chem.MolToSmiles(mol_copy):
+                    atom.SetNumExplicitHs(0)
+
+                mol_copy.UpdatePropertyCache()
+                output.append(mol_copy)
+
+        new_mols = output[:protonator.max_variants]
+
+    if len(sites) == 0:
+        new_mols = [Chem.RemoveHs(mol)]
+
+    new_smis = sorted(set([
+        Chem.MolToSmiles(m, isomericSmiles=True, canonical=True) for m in new_mols
+    ]))
+    new_smis = [
+        smi for smi in new_smis
+        if dimorphite_dl.UtilFuncs.convert_smiles_str_to_mol(smi) is not None
+    ]
+    return new_smis if len(new_smis) > 0 else [orig_smi]
+
+
+class TestNeutralizer(unittest.TestCase):
+    def neutralized_smiles(self, smiles):
+        mol = dimorphite_dl.UtilFuncs.neutralize_mol(Chem.MolFromSmiles(smiles))
+        return Chem.MolToSmiles(Chem.RemoveHs(mol))
+
+    def test_neutralize(self):
+        self.assertEqual(self.neutralized_smiles("CC(=O)[O-]"), "CC(=O)O")
+        self.assertEqual(self.neutralized_smiles("C[NH3+]"), "CN")
+        self.assertEqual(self.neutralized_smiles("C[N-]C"), "CNC")
+        self.assertEqual(
+            self.neutralized_smiles("[NH3+]CC([O-])=O"), "NCC(=O)O"
+        )
+
+        # Quaternary ammonium can't be neutralized.
+        self.assertEqual(self.neutralized_smiles("C[N+](C)(C)C"), "C[N+](C)(C)C")
+
+    def test_fix_azide(self):
+        self.assertEqual(self.neutralized_smiles("C[NH][N+]#N"), "CN=[N+]=N")
+
+    def test_fragments(self):
+        # Only the fragment with the first match is kept, as with reactions.
+        self.assertEqual(self.neutralized_smiles("C[O-].[Na+]"), "CO")
+        self.assertEqual(self.neutralized_smiles("CCO.[Na+]"), "CCO.[Na+]")
+
+    def test_input_not_changed(self):
+        mol = Chem.MolFromSmiles("CC(=O)[O-]")
+        dimorphite_dl.UtilFuncs.neutralize_mol(mol)
+        self.assertEqual(Chem.MolToSmiles(mol), "CC(=O)[O-]")
+
+    def test_same_as_reactions(self):
+        for smiles in NEUTRALIZE_SMILES:
+            mol = dimorphite_dl.UtilFuncs.neutralize_mol(Chem.MolFromSmiles(smiles))
+            expected = reaction_neutralize_mol(Chem.MolFromSmiles(smiles))
+            self.assertEqual(
+                Chem.MolToSmiles(Chem.RemoveHs(mol)),
+                Chem.MolToSmiles(Chem.RemoveHs(expected)),
+                smiles
+            )
+
+
+class TestProtonator(unittest.TestCase):
+    def setUp(self):
+        self.protonator = dimorphite_dl.Protonator(min_ph=2.0, max_ph=12.0)
+
+    def smiles_of(self, mols):
+        return sorted(Chem.MolToSmiles(mol) for mol in mols)
+
+    def test_protonate(self):
+        self.assertEqual(
+            self.smiles_of(self.protonator.protonate_smiles("NCC(=O)O")),
+            ["NCC(=O)O", "NCC(=O)[O-]", "[NH3+]CC(=O)O", "[NH3+]CC(=O)[O-]"]
+        )
+
+        protonator = dimorphite_dl.Protonator(min_ph=6.4, max_ph=8.4)
+        self.assertEqual(
+            self.smiles_of(protonator.protonate_smiles("CC(=O)O")),
+            ["CC(=O)[O-]"]
+        )
+        self.assertEqual(
+            self.smiles_of(protonator.protonate_smiles("c1ccccc1")),
+            ["c1ccccc1"]
+        )
+
+    def test_bad_smiles(self):
+        self.assertEqual(self.protonator.protonate_smiles("C1CC"), [])
+
+    def test_protonate_keeps_properties(self):
+        mol = Chem.MolFromSmiles("CCN")
+        mol.SetProp("name", "ethylamine")
+        mol.SetIntProp("id", 7)
+
+        protonated = self.protonator.protonate(mol)
+        self.assertEqual(len(protonated), 2)
+        for m in protonated:
+            self.assertEqual(m.GetProp("name"), "ethylamine")
+            self.assertEqual(m.GetIntProp("id"), 7)
+
+    def test_protonate_many(self):
+        smiles = ["NCC(=O)O", "CCN", "c1ccccc1"]
+        results = self.protonator.protonate_many(
+            Chem.MolFromSmiles(smi) for smi in smiles
+        )
+        self.assertIsInstance(results, types.GeneratorType)
+
+        results = list(results)
+        self.assertEqual(len(results), len(smiles))
+        for smi, mols in zip(smiles, results):
+            self.assertEqual(
+                self.smiles_of(mols),
+                self.smiles_of(self.protonator.protonate_smiles(smi))
+            )
+
+    # run() also parses the command line (here, pytest's).
+    @mock.patch.object(sys, "argv", ["dimorphite_dl.py"])
+    def test_same_as_command_line(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for smi in ["NCC(=O)O", "OP(O)(=O)O", "Cn1ccnc1", "c1cc[nH]c1"]:
+                output_file = os.path.join(tmp_dir, "output.smi")
+                dimorphite_dl.run(
+                    smiles=smi, min_ph=2.0, max_ph=12.0,
+                    output_file=output_file
+                )
+                with open(output_file) as f:
+                    expected = sorted(line.split()[0] for line in f if line.strip())
+
+                self.assertEqual(
+                    self.smiles_of(self.protonator.protonate_smiles(smi)),
+                    expected
+                )
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_run_with_mol_list(self):
+        mols = dimorphite_dl.run_with_mol_list(
+            [Chem.MolFromSmiles("NCC(=O)O")], min_ph=2.0, max_ph=12.0
+        )
+        self.assertEqual(
+            self.smiles_of(mols),
+            self.smiles_of(self.protonator.protonate_smiles("NCC(=O)O"))
+        )
+
+
+class TestChargeVectors(unittest.TestCase):
+    def get_charge_vectors(self, site_charges, max_variants=128):
+        return dimorphite_dl.ProtSubstructFuncs.get_charge_vectors(
+            site_charges, max_variants
+        )
+
+    def test_no_sites(self):
+        self.assertEqual(self.get_charge_vectors([]), [()])
+
+    def test_enumeration_order(self):
+        self.assertEqual(
+            self.get_charge_vectors([[-1, 0], [0], [-1, 0]]),
+            [(-1, 0, -1), (0, 0, -1), (-1, 0, 0), (0, 0, 0)]
+        )
+
+    def test_max_variants(self):
+        # Truncated after each site, like the lists of variants used to be.
+        self.assertEqual(
+            self.get_charge_vectors([[-1, 0], [-1, 0], [-1, 0]], 3),
+            [(-1, -1, -1), (0, -1, -1), (-1, 0, -1)]
+        )
+        self.assertEqual(len(self.get_charge_vectors([[-1, 0]] * 20, 128)), 128)
+
+    def test_impossible_charges(self):
+        # A site with no possible charges leaves no variants.
+        self.assertEqual(self.get_charge_vectors([[-1, 0], []]), [])
+
+    def test_same_as_copy_per_site(self):
+        sample_file = os.path.join(
+            os.path.dirname(dimorphite_dl.__file__), "sample_molecules.smi"
+        )
+        with open(sample_file) as f:
+            smiles = [line.split()[0] for line in f if line.strip()]
+        smiles += [
+            "OC(=O)CN(CC(O)=O)CCN(CC(O)=O)CC(O)=O", "NCCCCNCCCN",
+            "OP(O)(=O)OP(O)(=O)OP(O)(O)=O", "c1nc[nH]n1", "Cn1ccnc1",
+            "NCCc1c[nH]c2ccc(O)cc12", "OC(=O)c1cc(C(O)=O)cc(C(O)=O)c1",
+        ]
+
+        for max_variants in [1, 3, 128]:
+            for min_ph, max_ph in [(6.4, 8.4), (2.0, 12.0)]:
+                protonator = dimorphite_dl.Protonator(
+                    min_ph, max_ph, max_variants=max_variants
+                )
+                for smi in smiles:
+                    self.assertEqual(
+                        [Chem.MolToSmiles(m) for m in protonator.protonate_smiles(smi)],
+                        copy_per_site_protonate_smiles(protonator, smi),
+                        (smi, max_variants, min_ph, max_ph)
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
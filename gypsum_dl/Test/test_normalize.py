@@ -0,0 +1,88 @@
+# Copyright 2018 Jacob D. Durrant
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the MolVS normalize module.
+"""
+
+import unittest
+from unittest import mock
+
+from rdkit import Chem
+
+from gypsum_dl.molvs.normalize import NORMALIZATIONS, Normalizer
+
+NORMALIZE_SMILES = [
+    "CCO", "CN(=O)=O", "CS(C)=O", "C[S+2]([O-])([O-])C", "CN=N#N", "C=N#N",
+    "C[N+](C)=C[O-]", "C[n+]1ccccc1[O-]", "CC(=O)[O-].[Na+]",
+    "[O-][N+](=O)c1ccccc1", "C[S+]([O-])C", "[NH3+]CC([O-])=O",
+    "CN1C=NC2=C1C(=O)N(C(=O)N2C)C", "O=S(=O)(N)c1ccccc1",
+    "O=N(=O)c1ccc(cc1)S(C)=O", "CC(C)Cc1ccc(cc1)C(C)C(O)=O",
+]
+
+
+class UnscreenedNormalizer(Normalizer):
+    """Runs every transform, as MolVS does."""
+
+    def _is_applicable(self, mol, normalization):
+        return True
+
+
+class TestNormalizer(unittest.TestCase):
+    def normalized_smiles(self, normalizer, smiles):
+        return Chem.MolToSmiles(normalizer.normalize(Chem.MolFromSmiles(smiles)))
+
+    def test_normalize(self):
+        normalizer = Normalizer()
+        self.assertEqual(
+            self.normalized_smiles(normalizer, "CN(=O)=O"), "C[N+](=O)[O-]"
+        )
+        self.assertEqual(
+            self.normalized_smiles(normalizer, "CS(C)=O"), "C[S+](C)[O-]"
+        )
+
+    def test_same_as_unscreened(self):
+        normalizer = Normalizer()
+        unscreened = UnscreenedNormalizer()
+        for smiles in NORMALIZE_SMILES:
+            self.assertEqual(
+                self.normalized_smiles(normalizer, smiles),
+                self.normalized_smiles(unscreened, smiles),
+                smiles
+            )
+
+    def test_no_reactions_if_nothing_matches(self):
+        normalizer = Normalizer()
+        with mock.patch.object(
+            normalizer, "_apply_transform", wraps=normalizer._apply_transform
+        ) as apply_transform:
+            self.normalized_smiles(normalizer, "CC(C)Cc1ccc(cc1)C(C)C(O)=O")
+        self.assertEqual(apply_transform.call_count, 0)
+
+    def test_rules_checked_once_per_pass(self):
+        normalizer = Normalizer()
+        with mock.patch.object(
+            normalizer, "_is_applicable", wraps=normalizer._is_applicable
+        ) as is_applicable:
+            # The rules are checked up to the sulfoxide one, which applies,
+            # then all are checked again.
+            self.normalized_smiles(normalizer, "CS(C)=O")
+
+        names = [normalization.name for normalization in NORMALIZATIONS]
+        num_checks = names.index("Sulfoxide to -S+(O-)-") + 1 + len(names)
+        self.assertEqual(is_applicable.call_count, num_checks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,6 +22,185 @@ import subprocess
 import textwrap
 import random
 import string
+import sys
+import json
+import hashlib
+import logging
+import logging.handlers
+
+# The logging levels, so other modules need not import logging themselves.
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+# All Gypsum-DL messages go through this logger. Structured events (for the
+# optional JSONL log file) go through its "events" child, which is only
+# enabled when such a file is requested.
+LOGGER = logging.getLogger("gypsum_dl")
+EVENT_LOGGER = logging.getLogger("gypsum_dl.events")
+LOGGING_CONFIG = None  # The (log_level, log_file) last set up.
+
+# The seed from which all random choices are derived (see set_seed()), or
+# None if results need not be reproducible.
+SEED = None
+
+class WrappedTextFormatter(logging.Formatter):
+    """Formats messages for the screen, wrapping them at 80 characters and
+    preserving their leading indentation. The (relatively expensive) wrapping
+    is only done for messages that are actually displayed."""
+
+    def format(self, record):
+        """Formats a log record.
+
+        :param record: The log record.
+        :type record: logging.LogRecord
+        :return: The formatted message.
+        :rtype: str
+        """
+
+        txt = record.getMessage()
+        whitespace_before = txt[:len(txt) - len(txt.lstrip())].replace("\t", "    ")
+        return textwrap.fill(
+            txt.strip(), width = 80, initial_indent = whitespace_before,
+            subsequent_indent = whitespace_before + "    "
+        )
+
+class JSONLinesFormatter(logging.Formatter):
+    """Formats log records as single-line JSON objects, for machine-readable
+    log files."""
+
+    def format(self, record):
+        """Formats a log record.
+
+        :param record: The log record.
+        :type record: logging.LogRecord
+        :return: The record as a line of JSON.
+        :rtype: str
+        """
+
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "pid": record.process,
+            "event": getattr(record, "event", "message"),
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+class StdoutHandler(logging.StreamHandler):
+    """A handler that always writes to the current sys.stdout (which may be
+    replaced after the handler is created)."""
+
+    def __init__(self):
+        logging.StreamHandler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+def setup_logging(log_level="INFO", log_file=""):
+    """Configures Gypsum-DL's logging. Messages at or above log_level are
+    printed to the screen. If log_file is given, messages and structured
+    events (e.g., the start and end of each step) are also appended to that
+    file, one JSON object per line.
+
+    :param log_level: The minimum level of the messages to print (DEBUG,
+       INFO, WARNING, or ERROR). Defaults to "INFO".
+    :type log_level: str, optional
+    :param log_file: The path to the JSONL log file, or "" for none. Defaults
+       to "".
+    :type log_file: str, optional
+    """
+
+    # Nothing to do if logging is already set up this way.
+    global LOGGING_CONFIG
+    if LOGGING_CONFIG == (log_level.upper(), log_file):
+        return
+    LOGGING_CONFIG = (log_level.upper(), log_file)
+
+    for logger in [LOGGER, EVENT_LOGGER]:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+    # Messages below the log level are discarded before they are even
+    # formatted.
+    LOGGER.setLevel(getattr(logging, log_level.upper()))
+    LOGGER.propagate = False
+    EVENT_LOGGER.propagate = False
+
+    screen = StdoutHandler()
+    screen.setFormatter(WrappedTextFormatter())
+    LOGGER.addHandler(screen)
+
+    if log_file != "":
+        json_handler = logging.FileHandler(log_file, mode="a")
+        json_handler.setFormatter(JSONLinesFormatter())
+        LOGGER.addHandler(json_handler)
+        EVENT_LOGGER.addHandler(json_handler)
+        EVENT_LOGGER.setLevel(logging.INFO)
+    else:
+        EVENT_LOGGER.setLevel(logging.CRITICAL + 1)
+
+def buffer_logs():
+    """Buffers the messages logged in this process, so they are written in
+    one go when flush_logs() is called (or when an error is logged). Used in
+    worker processes, so the messages of each task are written together and
+    the many small writes don't compete for the output stream."""
+
+    for logger in [LOGGER, EVENT_LOGGER]:
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.handlers.MemoryHandler):
+                continue
+
+            buffered = logging.handlers.MemoryHandler(
+                1000, flushLevel=logging.ERROR, target=handler
+            )
+            logger.removeHandler(handler)
+            logger.addHandler(buffered)
+
+def flush_logs():
+    """Writes any buffered messages (see buffer_logs())."""
+
+    for logger in [LOGGER, EVENT_LOGGER]:
+        for handler in logger.handlers:
+            handler.flush()
+
+def log_enabled(level):
+    """Checks whether messages of a given level will be logged. Useful to
+    avoid preparing debug output no one will see.
+
+    :param level: The level (e.g., Utils.DEBUG).
+    :type level: int
+    :return: True if messages of that level are logged.
+    :rtype: bool
+    """
+
+    return LOGGER.isEnabledFor(level)
+
+def log_event(event, **fields):
+    """Records a structured event in the JSONL log file, if there is one.
+
+    :param event: The name of the event (e.g., "step_done").
+    :type event: str
+    :param fields: Other data to record with the event.
+    """
+
+    if EVENT_LOGGER.isEnabledFor(logging.INFO):
+        EVENT_LOGGER.info(
+            event, extra={"event": event, "fields": fields}
+        )
+
+# Print messages to the screen by default, even if setup_logging() is never
+# called (e.g., when Gypsum-DL is used as a library).
+if LOGGING_CONFIG is None:
+    setup_logging()
 
 def group_mols_by_container_index(mol_lst):
     """Take a list of MyMol.MyMol objects, and place them in lists according to
@@ -51,11 +230,62 @@ def group_mols_by_container_index(mol_lst):
 
     # Remove redundant entries.
     for key in list(grouped_results.keys()):
-        grouped_results[key] = list(set(grouped_results[key]))
+        grouped_results[key] = uniq(grouped_results[key])
 
     return grouped_results
 
-def random_sample(lst, num, msg_if_cut=""):
+def uniq(lst):
+    """Removes redundant elements from a list. Unlike list(set(lst)), the
+    order of the elements is preserved, so it does not vary from run to run.
+
+    :param lst: The list of (hashable) elements.
+    :type lst: list
+    :return: A new list, with only the first of any equal elements.
+    :rtype: list
+    """
+
+    seen = set([])
+    uniq_lst = []
+    for item in lst:
+        if not item in seen:
+            seen.add(item)
+            uniq_lst.append(item)
+
+    return uniq_lst
+
+def set_seed(seed):
+    """Sets the seed from which all random choices (which variants to
+    sample, the starting coordinates of each 3D embedding, etc.) are derived.
+    Each choice gets its own seed, derived from this one and from the
+    molecule in question (see seed_for()), so results do not depend on the
+    order in which molecules are processed, or by which process.
+
+    :param seed: The seed. A negative number means results need not be
+       reproducible.
+    :type seed: int
+    """
+
+    global SEED
+
+    SEED = None if seed is None or seed < 0 else int(seed)
+
+def seed_for(*keys):
+    """Derives a seed for one random choice from the seed set with
+    set_seed() and some keys that identify the choice (e.g., a canonical
+    SMILES string). The same keys always give the same seed, in any process.
+
+    :return: A seed between 0 and 2^31 - 1, or None if no seed was set.
+    :rtype: int or None
+    """
+
+    if SEED is None:
+        return None
+
+    txt = "\t".join([str(SEED)] + [str(k) for k in keys])
+    digest = hashlib.md5(txt.encode("utf8")).hexdigest()
+    return int(digest[:8], 16) & 0x7FFFFFFF
+
+def random_sample(lst, num, msg_if_cut="", seed_key=""):
     """Randomly selects elements from a list.
 
     :param lst: The list of elements.
@@ -65,19 +295,27 @@ def random_sample(lst, num, msg_if_cut=""):
     :param msg_if_cut: The message to display if some elements must be ignored
        to construct the list. Defaults to "".
     :param msg_if_cut: str, optional
+    :param seed_key: Identifies this choice (e.g., the canonical SMILES
+       string of the molecule in question), if a seed was set with
+       set_seed(). Defaults to "".
+    :type seed_key: str, optional
     :return: A list that contains at most num elements.
     :rtype: list
     """
 
     try:
         # Remove redundancies.
-        lst = list(set(lst))
+        lst = uniq(lst)
     except:
         # Because someitems lst element may be unhashable.
-        pass
+        lst = lst[:]
 
     # Shuffle the list.
-    random.shuffle(lst)
+    seed = seed_for("random_sample", seed_key)
+    if seed is None:
+        random.shuffle(lst)
+    else:
+        random.Random(seed).shuffle(lst)
     if num < len(lst):
         # Keep the top ones.
         lst = lst[:num]
@@ -85,18 +323,28 @@ def random_sample(lst, num, msg_if_cut=""):
             log(msg_if_cut)
     return lst
 
-def log(txt):
-    """Prints a message to the screen.
+def log(txt, *args, **kwargs):
+    """Prints a message to the screen. If args are given, txt is treated as a
+    %-style format string, which is only filled in if the message is
+    actually logged.
 
     :param txt: The message to print.
     :type txt: str
+    :param level: The level of the message (e.g., Utils.DEBUG). Defaults to
+       Utils.INFO.
+    :type level: int, optional
+    """
+
+    LOGGER.log(kwargs.get("level", INFO), txt, *args)
+
+def debug(txt, *args):
+    """Logs a debugging message, not shown by default.
+
+    :param txt: The message (a %-style format string if args are given).
+    :type txt: str
     """
 
-    whitespace_before = txt[:len(txt) - len(txt.lstrip())].replace("\t", "    ")
-    print(textwrap.fill(
-        txt.strip(), width = 80, initial_indent = whitespace_before,
-        subsequent_indent = whitespace_before + "    "
-    ))
+    LOGGER.debug(txt, *args)
 
 def fnd_contnrs_not_represntd(contnrs, results):
     """Identify containers that have no representative elements in results.
@@ -141,12 +389,16 @@ def print_current_smiles(contnrs):
     :type contnrs: list
     """
 
-    # For debugging.
-    log("    Contents of MolContainers")
+    # For debugging. Only logged at the DEBUG level, so skip computing the
+    # smiles if no one will see them.
+    if not log_enabled(DEBUG):
+        return
+
+    debug("    Contents of MolContainers")
     for i, mol_cont in enumerate(contnrs):
-        log("\t\tMolContainer #" + str(i) + " (" + mol_cont.name + ")")
+        debug("\t\tMolContainer #%d (%s)", i, mol_cont.name)
         for i, s in enumerate(mol_cont.all_can_noh_smiles()):
-            log("\t\t\tMol #" + str(i) + ": " + s)
+            debug("\t\t\tMol #%d: %s", i, s)
 
 def exception(msg):
     """Prints an error to the screen and raises an exception.
@@ -156,12 +408,12 @@ def exception(msg):
     :raises Exception: The error.
     """
 
-    log(msg)
-    log("\n" + "=" * 79)
-    log("For help with usage:")
-    log("\tpython run_gypsum_dl.py --help")
-    log("=" * 79)
-    log("")
+    log(msg, level=ERROR)
+    log("\n" + "=" * 79, level=ERROR)
+    log("For help with usage:", level=ERROR)
+    log("\tpython run_gypsum_dl.py --help", level=ERROR)
+    log("=" * 79, level=ERROR)
+    log("", level=ERROR)
     raise Exception(msg)
 
 def slug(strng):
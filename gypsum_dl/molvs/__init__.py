@@ -12,7 +12,7 @@ from __future__ import unicode_literals
 from __future__ import division
 import logging
 
-from .standardize import Standardizer, standardize_smiles, enumerate_tautomers_smiles, canonicalize_tautomer_smiles
+from .standardize import Standardizer, get_standardizer, standardize_smiles, standardize_many, enumerate_tautomers_smiles, canonicalize_tautomer_smiles
 from .validate import Validator, validate_smiles
 from .errors import MolVSError, StandardizeError, ValidateError
 
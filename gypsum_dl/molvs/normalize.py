@@ -39,6 +39,11 @@ class Normalization(object):
         log.debug('Loading Normalization transform: %s', self.name)
         return AllChem.ReactionFromSmarts(str(self.transform_str))
 
+    @memoized_property
+    def reactant(self):
+        """The reactant template of the transform. The transform can only change molecules that match it."""
+        return self.transform.GetReactantTemplate(0)
+
     def __repr__(self):
         return 'Normalization({!r}, {!r})'.format(self.name, self.transform_str)
 
@@ -138,8 +143,12 @@ class Normalizer(object):
 
     def _normalize_fragment(self, mol):
         for n in six.moves.range(self.max_restarts):
-            # Iterate through Normalization transforms and apply each in order
+            # Iterate through Normalization transforms and apply each in order. Only those that match the molecule
+            # can change it, so the others are skipped without running their reactions. Each is checked only when it
+            # is reached, as the rules after one that changes the molecule are never tried on the old molecule.
             for normalization in self.normalizations:
+                if not self._is_applicable(mol, normalization):
+                    continue
                 product = self._apply_transform(mol, normalization.transform)
                 if product:
                     # If transform changed mol, go back to first rule and apply each again
@@ -153,6 +162,14 @@ class Normalizer(object):
         log.warning('Gave up normalization after %s restarts', self.max_restarts)
         return mol
 
+    def _is_applicable(self, mol, normalization):
+        """Return whether the reactant of a Normalization transform matches the molecule.
+
+        Checking for a match is much faster than running the reaction, so normalizing a molecule that needs no changes
+        is mostly a series of these checks.
+        """
+        return mol.HasSubstructMatch(normalization.reactant)
+
     def _apply_transform(self, mol, rule):
         """Repeatedly apply normalization transform to molecule until no changes occur.
 
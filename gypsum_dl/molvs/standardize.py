@@ -286,12 +286,31 @@ class Standardizer(object):
                                      max_tautomers=self.max_tautomers)
 
 
+#: The Standardizer with the default options shared by the convenience functions below (see get_standardizer()).
+_standardizer = None
+
+
+def get_standardizer():
+    """Return a Standardizer with the default options, shared by all the convenience functions in this module.
+
+    It is made the first time it is needed. Its sub-objects (Normalizer, Reionizer, Uncharger, etc.) are then built
+    once per process and reused for every molecule, rather than rebuilt for each one.
+
+    :returns: The shared Standardizer.
+    :rtype: :class:`~molvs.standardize.Standardizer`
+    """
+    global _standardizer
+    if _standardizer is None:
+        _standardizer = Standardizer()
+    return _standardizer
+
+
 def standardize_smiles(smiles):
     """Return a standardized canonical SMILES string given a SMILES string.
 
-    Note: This is a convenience function for quickly standardizing a single SMILES string. It is more efficient to use
-    the :class:`~molvs.standardize.Standardizer` class directly when working with many molecules or when custom options
-    are needed.
+    Note: This is a convenience function for quickly standardizing a single SMILES string. It uses the shared
+    Standardizer (see :func:`~molvs.standardize.get_standardizer`). Use the
+    :class:`~molvs.standardize.Standardizer` class directly when custom options are needed.
 
     :param string smiles: The SMILES for the molecule.
     :returns: The SMILES for the standardized molecule.
@@ -299,10 +318,34 @@ def standardize_smiles(smiles):
     """
     # Skip sanitize as standardize does this anyway
     mol = Chem.MolFromSmiles(smiles, sanitize=False)
-    mol = Standardizer().standardize(mol)
+    mol = get_standardizer().standardize(mol)
     return Chem.MolToSmiles(mol, isomericSmiles=True)
 
 
+def standardize_many(smiles_list):
+    """Return a list of standardized canonical SMILES strings given a list of SMILES strings.
+
+    All the molecules are standardized with the shared Standardizer (see
+    :func:`~molvs.standardize.get_standardizer`).
+
+    :param smiles_list: The SMILES for the molecules. Any iterable will do.
+    :returns: The SMILES for the standardized molecules, in the same order. None for each molecule that could not be
+              standardized.
+    :rtype: list of strings.
+    """
+    standardizer = get_standardizer()
+    results = []
+    for smiles in smiles_list:
+        try:
+            # Skip sanitize as standardize does this anyway
+            mol = Chem.MolFromSmiles(smiles, sanitize=False)
+            mol = standardizer.standardize(mol)
+            results.append(Chem.MolToSmiles(mol, isomericSmiles=True))
+        except Exception:
+            results.append(None)
+    return results
+
+
 def enumerate_tautomers_smiles(smiles):
     """Return a set of tautomers as SMILES strings, given a SMILES string.
 
@@ -312,7 +355,7 @@ def enumerate_tautomers_smiles(smiles):
     """
     # Skip sanitize as standardize does this anyway
     mol = Chem.MolFromSmiles(smiles, sanitize=False)
-    mol = Standardizer().standardize(mol)
+    mol = get_standardizer().standardize(mol)
     tautomers = TautomerEnumerator().enumerate(mol)
     return {Chem.MolToSmiles(m, isomericSmiles=True) for m in tautomers}
 
@@ -330,6 +373,6 @@ def canonicalize_tautomer_smiles(smiles):
     """
     # Skip sanitize as standardize does this anyway
     mol = Chem.MolFromSmiles(smiles, sanitize=False)
-    mol = Standardizer().standardize(mol)
+    mol = get_standardizer().standardize(mol)
     tautomer = TautomerCanonicalizer().canonicalize(mol)
     return Chem.MolToSmiles(tautomer, isomericSmiles=True)
@@ -10,7 +10,6 @@ This module contains tools for enumerating tautomers and determining a canonical
 from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
-import copy
 import logging
 
 from rdkit import Chem
@@ -246,22 +245,25 @@ class TautomerEnumerator(object):
         :rtype: list of rdkit.Chem.rdchem.Mol
         """
         smiles = Chem.MolToSmiles(mol, isomericSmiles=True)
-        tautomers = {smiles: copy.deepcopy(mol)}
+        tautomers = {smiles: Chem.Mol(mol)}
         # Create a kekulized form of the molecule to match the SMARTS against
-        kekulized = copy.deepcopy(mol)
+        kekulized = Chem.Mol(mol)
         Chem.Kekulize(kekulized)
         kekulized = {smiles: kekulized}
+        # The SMILES of each product seen so far (None if it could not be sanitized), keyed by its binary form. This is
+        # much cheaper to make than a canonical SMILES, and different matches often lead to the same product.
+        products = {}
         done = set()
         while len(tautomers) < self.max_tautomers:
-            for tsmiles in sorted(tautomers):
-                if tsmiles in done:
-                    continue
+            # Only the tautomers found since the last pass need to be sorted
+            for tsmiles in sorted(set(tautomers) - done):
+                parent = kekulized[tsmiles]
                 for transform in self.transforms:
-                    for match in kekulized[tsmiles].GetSubstructMatches(transform.tautomer):
+                    for match in parent.GetSubstructMatches(transform.tautomer):
                         # log.debug('Matched rule: %s to %s for %s', transform.name, tsmiles, match)
                         # Create a copy of in the input molecule so we can modify it
                         # Use kekule form so bonds are explicitly single/double instead of aromatic
-                        product = copy.deepcopy(kekulized[tsmiles])
+                        product = Chem.Mol(parent)
                         # Remove a hydrogen from the first matched atom and add one to the last
                         first = product.GetAtomWithIdx(match[0])
                         last = product.GetAtomWithIdx(match[-1])
@@ -289,13 +291,19 @@ class TautomerEnumerator(object):
                                 atom = product.GetAtomWithIdx(idx)
                                 # log.debug('%s: C%s -> C%s' % (atom.GetSymbol(), atom.GetFormalCharge(), atom.GetFormalCharge() + transform.charges[ci]))
                                 atom.SetFormalCharge(atom.GetFormalCharge() + transform.charges[ci])
+                        key = product.ToBinary()
+                        if key in products:
+                            log.debug('Applied rule: %s to %s, which gave a previous product', transform.name, tsmiles)
+                            continue
+                        products[key] = None
                         try:
                             Chem.SanitizeMol(product)
                             smiles = Chem.MolToSmiles(product, isomericSmiles=True)
+                            products[key] = smiles
                             log.debug('Applied rule: %s to %s', transform.name, tsmiles)
                             if smiles not in tautomers:
                                 log.debug('New tautomer produced: %s' % smiles)
-                                kekulized_product = copy.deepcopy(product)
+                                kekulized_product = Chem.Mol(product)
                                 Chem.Kekulize(kekulized_product)
                                 tautomers[smiles] = product
                                 kekulized[smiles] = kekulized_product
@@ -309,19 +317,38 @@ class TautomerEnumerator(object):
         else:
             log.warning('Tautomer enumeration stopped at maximum %s', self.max_tautomers)
         # Clean up stereochemistry
+        unfixed = None
         for tautomer in tautomers.values():
             Chem.AssignStereochemistry(tautomer, force=True, cleanIt=True)
             for bond in tautomer.GetBonds():
                 if bond.GetBondType() == BondType.DOUBLE and bond.GetStereo() > BondStereo.STEREOANY:
+                    if unfixed is None:
+                        unfixed = self._get_unfixed_bonds(tautomers.values())
+                    if bond.GetIdx() not in unfixed:
+                        continue
                     begin = bond.GetBeginAtomIdx()
                     end = bond.GetEndAtomIdx()
-                    for othertautomer in tautomers.values():
-                        if not othertautomer.GetBondBetweenAtoms(begin, end).GetBondType() == BondType.DOUBLE:
-                            neighbours = tautomer.GetAtomWithIdx(begin).GetBonds() + tautomer.GetAtomWithIdx(end).GetBonds()
-                            for otherbond in neighbours:
-                                if otherbond.GetBondDir() in {BondDir.ENDUPRIGHT, BondDir.ENDDOWNRIGHT}:
-                                    otherbond.SetBondDir(BondDir.NONE)
-                            Chem.AssignStereochemistry(tautomer, force=True, cleanIt=True)
-                            log.debug('Removed stereochemistry from unfixed double bond')
-                            break
-        return list(tautomers.values())
\ No newline at end of file
+                    neighbours = tautomer.GetAtomWithIdx(begin).GetBonds() + tautomer.GetAtomWithIdx(end).GetBonds()
+                    for otherbond in neighbours:
+                        if otherbond.GetBondDir() in {BondDir.ENDUPRIGHT, BondDir.ENDDOWNRIGHT}:
+                            otherbond.SetBondDir(BondDir.NONE)
+                    Chem.AssignStereochemistry(tautomer, force=True, cleanIt=True)
+                    log.debug('Removed stereochemistry from unfixed double bond')
+        return list(tautomers.values())
+
+    @staticmethod
+    def _get_unfixed_bonds(tautomers):
+        """Return the indices of the bonds that are not double in every tautomer. All tautomers share the same bond
+        indices.
+
+        :param tautomers: The tautomers.
+        :type tautomers: list of rdkit.Chem.rdchem.Mol
+        :return: The bond indices.
+        :rtype: set of ints
+        """
+        unfixed = set()
+        for tautomer in tautomers:
+            for bond in tautomer.GetBonds():
+                if bond.GetBondType() != BondType.DOUBLE:
+                    unfixed.add(bond.GetIdx())
+        return unfixed
\ No newline at end of file
@@ -44,14 +44,12 @@ def print_gypsum_citation():
     except:
         print(citation_print)
 
-#print out the citation of Gypsum-DL paper.
-print_gypsum_citation()
-
 import argparse
 import copy
 from gypsum_dl.Start import prepare_molecules
 from gypsum_dl.Test.Tester import run_test
 from gypsum_dl import Utils
+from gypsum_dl import Parallelizer
 
 PARSER = argparse.ArgumentParser(
     formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -105,12 +103,24 @@ python run_gypsum_dl.py --source ./examples/sample_molecules.smi \\
 python run_gypsum_dl.py --source ./examples/sample_molecules.smi \\
     --job_manager multiprocessing --num_processors 4
 
+   Or in threads mode, using 4 threads of a single process:
+
+python run_gypsum_dl.py --source ./examples/sample_molecules.smi \\
+    --job_manager threads --num_processors 4
+
 9. Run Gypsum-DL in mpi mode using all available processors:
 
 mpirun -n $NTASKS python -m mpi4py run_gypsum_dl.py \\
     --source ./examples/sample_molecules.smi \\
     --job_manager mpi --num_processors -1
 
+   Or with one MPI process per compute node, each using all the CPU cores of
+   its node:
+
+mpirun -n $NNODES --map-by node python -m mpi4py run_gypsum_dl.py \\
+    --source ./examples/sample_molecules.smi \\
+    --job_manager mpi --num_processors -1 --mpi_local_processors 0
+
 10. Gypsum-DL can also take parameters from a JSON file:
 
 python run_gypsum_dl.py --json myparams.json
@@ -137,13 +147,94 @@ PARSER.add_argument('--output_folder', '-o', type=str,
                     help='The path to an existing folder where the Gypsum-DL ' +
                     'output file(s) will be saved.')
 PARSER.add_argument('--job_manager', type=str, default='multiprocessing',
-                    choices = ["mpi", "multiprocessing", "serial"],
+                    choices = ["mpi", "multiprocessing", "threads", "serial"],
                     help='Determine what style of multiprocessing to use: mpi, \
-                        multiprocessing, or serial. Serial will override the \
-                        num_processors flag, forcing it to be one. MPI mode \
-                        requires mpi4py 2.1.0 or higher and should be executed \
-                        as: mpirun -n $NTASKS python -m mpi4py run_gypsum_dl.py \
-                        ...-settings...')
+                        multiprocessing, threads, or serial. Serial will \
+                        override the num_processors flag, forcing it to be \
+                        one. Threads mode runs the thread-safe steps \
+                        (including all 3D steps) in num_processors threads of \
+                        a single process, which uses much less memory than \
+                        multiprocessing. Other steps, and all steps if \
+                        per-molecule limits are set, use worker processes. \
+                        MPI mode requires mpi4py 2.1.0 or higher and should be \
+                        executed as: mpirun -n $NTASKS python -m mpi4py \
+                        run_gypsum_dl.py ...-settings...')
+PARSER.add_argument('--pipeline_steps', action='store_true',
+                    help='Run the preparation steps as a pipeline. Each \
+                    input molecule moves on to the next step as soon as it \
+                    has finished the current one, and its models are saved \
+                    as soon as they are ready. Molecules are saved in the \
+                    order they finish. Not supported in mpi mode.')
+PARSER.add_argument('--molecule_timeout', type=float, metavar='SECONDS',
+                    help='The maximum number of seconds a single \
+                    calculation (e.g., generating the conformers of one \
+                    molecular variant) may run. Molecules that exceed this \
+                    limit are skipped and listed in gypsum_dl_failed.smi. \
+                    With --pipeline_steps, the limit applies instead to all \
+                    the SMILES (or all the 3D) steps of one input molecule, \
+                    and the whole input molecule is skipped if it is \
+                    exceeded. 0 (the default) means no limit.')
+PARSER.add_argument('--molecule_memory_limit', type=int, metavar='MB',
+                    help='The maximum amount of memory (in MB) a single \
+                    calculation may use. Molecules that exceed this limit are \
+                    skipped and listed in gypsum_dl_failed.smi. With \
+                    --pipeline_steps, the limit applies to the same \
+                    calculations as --molecule_timeout. 0 (the default) means \
+                    no limit. Requires a platform that supports resource \
+                    limits (e.g., Linux).')
+PARSER.add_argument('--max_tasks_per_worker', type=int, metavar='N',
+                    help='Replace each worker process with a fresh one after \
+                    it has run N calculations, to release accumulated \
+                    memory. 0 (the default) means never.')
+PARSER.add_argument('--force_field', type=str.upper,
+                    choices=["UFF", "MMFF94", "MMFF94S"],
+                    help='The force field used to score and minimize the 3D \
+                    models. Molecules that MMFF cannot describe fall back to \
+                    UFF. Defaults to UFF.')
+PARSER.add_argument('--minimization_threads', type=int, metavar='T',
+                    help='The number of threads each process uses to \
+                    minimize the conformers of a molecule, which are all \
+                    optimized at once. 0 means one per CPU core. Defaults \
+                    to 1. On many-core machines, combining fewer processes \
+                    (--num_processors) with several threads each can be \
+                    faster.')
+PARSER.add_argument('--seed', type=int, metavar='S',
+                    help='Make the output reproducible. The random choices \
+                    (which variants to sample, the starting coordinates of \
+                    each 3D model, etc.) are derived from this seed and from \
+                    each molecule, so the same input and parameters give \
+                    identical output regardless of the job manager or \
+                    number of processors. Negative values (the default, -1) \
+                    mean the output can vary from run to run.')
+PARSER.add_argument('--mpi_local_processors', type=int, metavar='N',
+                    help='In mpi mode, the number of local worker processes \
+                    (or threads) each MPI process uses. 1 (the default) \
+                    means each MPI process prepares its molecules in serial, \
+                    so one MPI process per CPU core is needed. With more, \
+                    each MPI process gets a share of the input molecules and \
+                    prepares them on its own pool of workers, so one MPI \
+                    process per compute node is enough. 0 means one worker \
+                    per CPU core of the node.')
+PARSER.add_argument('--mpi_local_job_manager', type=str.lower,
+                    choices=["multiprocessing", "threads"],
+                    help='The kind of local workers to use with \
+                    --mpi_local_processors. Defaults to multiprocessing.')
+PARSER.add_argument('--log_level', type=str.upper,
+                    choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                    help='The least important messages to print. DEBUG \
+                    also prints the SMILES of every variant after each \
+                    step. Defaults to INFO.')
+PARSER.add_argument('--log_file', type=str, metavar='log.jsonl',
+                    help='Also append the messages, along with structured \
+                    events (e.g., how long each step took, and which \
+                    molecules failed), to this file, one JSON object per \
+                    line.')
+PARSER.add_argument('--tautomer_cache_file', type=str, metavar='tauts.json',
+                    help='Reuse the tautomers enumerated by earlier runs, \
+                    saved in this file, and save the tautomers of this run \
+                    to it. Useful when libraries that share many molecules \
+                    (or fragments) are prepared one after another. Not used \
+                    in mpi mode or with --pipeline_steps.')
 PARSER.add_argument('--num_processors', '-p', type=int, metavar='N', default=1,
                     help='Number of processors to use for parallel \
                     calculations.')
@@ -207,17 +298,27 @@ PARSER.add_argument('--cache_prerun', '-c', action='store_true',
 PARSER.add_argument('--test', action='store_true',
                     help='Tests Gypsum-DL to check for programming bugs.')
 
-ARGS_DICT = vars(PARSER.parse_args())
-if ARGS_DICT["test"] == True:
-    run_test()
-elif ARGS_DICT["cache_prerun"] == False:
-
-    INPUTS = copy.deepcopy(ARGS_DICT)
-
-    for k, v in ARGS_DICT.items():
-        if v is None:
-            del INPUTS[k]
-    prepare_molecules(INPUTS)
-    Utils.log("Finished Gypsum-DL")
-else:
-    pass
+# Worker processes started by the fork server import this script again (see
+# Parallelizer.get_context()), so only run Gypsum-DL when it is executed
+# directly.
+if __name__ == "__main__":
+    # Safe, because of the above.
+    Parallelizer.use_forkserver()
+
+    #print out the citation of Gypsum-DL paper.
+    print_gypsum_citation()
+
+    ARGS_DICT = vars(PARSER.parse_args())
+    if ARGS_DICT["test"] == True:
+        run_test()
+    elif ARGS_DICT["cache_prerun"] == False:
+
+        INPUTS = copy.deepcopy(ARGS_DICT)
+
+        for k, v in ARGS_DICT.items():
+            if v is None:
+                del INPUTS[k]
+        prepare_molecules(INPUTS)
+        Utils.log("Finished Gypsum-DL")
+    else:
+        pass